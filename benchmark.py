@@ -0,0 +1,373 @@
+"""Бенчмарк установки и проверки клиента на локальном сервере.
+
+Из манифеста формата clien.json создается синтетический клиент (размеры
+файлов умножаются на --scale, содержимое детерминировано --seed), который
+раздается локальным HTTP-сервером с поддержкой Range. Сервер может
+вносить задержку, ограничивать общую скорость, сбрасывать соединения и
+обрывать ответы. Установка и проверка выполняются командами лаунчера
+install и verify --deep в отдельных процессах, поэтому время CPU и пиковая
+память относятся только к лаунчеру.
+
+Результат - одна строка JSON с коммитом, параметрами и метриками; строки
+из разных коммитов можно сравнить ключом --compare:
+
+    python benchmark.py --output bench.jsonl
+    python benchmark.py --reset-rate 0.05 --latency 20 --compare bench.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LAUNCHER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wow-launcher.py')
+METRICS = (
+    # (ключ, единица, больше - лучше)
+    ('install_wall', 'с', False),
+    ('install_throughput', 'МБ/с', True),
+    ('install_cpu', 'с', False),
+    ('install_peak_rss', 'МБ', False),
+    ('requests', '', False),
+    ('faults', '', False),
+    ('verify_wall', 'с', False),
+    ('verify_throughput', 'МБ/с', True),
+    ('verify_cpu', 'с', False),
+    ('verify_peak_rss', 'МБ', False),
+)
+
+
+class Faults:
+    """Сбои, которые сервер вносит в ответы с данными файлов"""
+
+    def __init__(self, latency: float = 0.0, bandwidth: float = 0.0, reset_rate: float = 0.0,
+                 truncate_rate: float = 0.0, seed: int = 0):
+        self.latency = latency  # Секунды до ответа на каждый запрос
+        self.bandwidth = bandwidth  # Байт в секунду на все соединения (0 - без ограничения)
+        self.reset_rate = reset_rate  # Доля ответов, прерванных сбросом соединения (RST)
+        self.truncate_rate = truncate_rate  # Доля ответов, оборванных закрытием соединения
+        self.injected = 0
+        self._random = random.Random(seed)
+        self._next_send = 0.0
+        self._lock = threading.Lock()
+
+    def choose(self, size: int):
+        """Решает, что сделать с ответом: (None | 'reset' | 'truncate', сколько байт успеть отдать)"""
+        with self._lock:
+            roll = self._random.random()
+            cut = int(size * self._random.random())
+            if roll < self.reset_rate:
+                self.injected += 1
+                return 'reset', cut
+            if roll < self.reset_rate + self.truncate_rate:
+                self.injected += 1
+                return 'truncate', cut
+            return None, size
+
+    def throttle(self, size: int):
+        """Выдерживает общую скорость: отправка size байт планируется после предыдущих"""
+        if not self.bandwidth:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._next_send = max(self._next_send, now) + size / self.bandwidth
+            delay = self._next_send - now
+        time.sleep(delay)
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(send_body=False)
+
+    def do_GET(self, send_body=True):
+        origin = self.server
+        with origin.lock:
+            origin.requests += 1
+        time.sleep(origin.faults.latency)
+        relative = self.path.split('?')[0].lstrip('/')
+        path = os.path.realpath(os.path.join(origin.root, relative))
+        if not path.startswith(origin.root + os.sep) or not os.path.isfile(path):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size
+        requested = self.headers.get('Range', '')
+        if requested.startswith('bytes='):
+            first, _, last = requested[6:].partition('-')
+            start = int(first)
+            end = min(size, int(last) + 1) if last else size
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+        if not send_body:
+            return
+
+        fault, limit = (None, end - start) if relative == origin.manifest_name else origin.faults.choose(end - start)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            left = limit
+            try:
+                while left:
+                    data = f.read(min(left, 64 * 1024))
+                    if not data:
+                        break
+                    origin.faults.throttle(len(data))
+                    self.wfile.write(data)
+                    left -= len(data)
+            except ConnectionError:
+                self.close_connection = True
+                return
+        if fault == 'reset':
+            # SO_LINGER с нулевым таймаутом: close() отправляет RST вместо FIN
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.wfile.flush()
+            self.connection.close()
+            self.close_connection = True
+        elif fault == 'truncate':
+            self.close_connection = True
+
+
+class Origin(ThreadingHTTPServer):
+    """Локальный сервер клиента с подсчетом запросов"""
+    daemon_threads = True
+
+    def __init__(self, root: str, manifest_name: str, faults: Faults):
+        super().__init__(('127.0.0.1', 0), OriginHandler)
+        self.root = os.path.realpath(root)
+        self.manifest_name = manifest_name
+        self.faults = faults
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass  # Оборванные соединения - ожидаемая часть бенчмарка
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}/'
+
+
+def generate_client(manifest_path: str, root: str, scale: float, seed: int) -> int:
+    """Создает файлы по манифесту и манифест client.json с их хешами. Возвращает общий размер"""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        source = json.load(f)
+    files = {}
+    for filename, info in sorted(source['files'].items()):
+        size = max(1, int(info['size'] * scale))
+        path = os.path.join(root, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        generator = random.Random(f'{seed}:{filename}')
+        hasher = hashlib.sha256()
+        with open(path, 'wb') as out:
+            left = size
+            while left:
+                length = min(left, 1024 * 1024)
+                data = generator.getrandbits(length * 8).to_bytes(length, 'little')
+                out.write(data)
+                hasher.update(data)
+                left -= length
+        files[filename] = {'size': size, 'hash': hasher.hexdigest()}
+    with open(os.path.join(root, 'client.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': 'benchmark', 'files': files}, f)
+    return sum(info['size'] for info in files.values())
+
+
+def run_launcher(arguments: list, workdir: str) -> dict:
+    """Запускает команду лаунчера и возвращает время, CPU, пиковую память и итоговое событие"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, LAUNCHER] + arguments,
+        cwd=workdir,  # launcher.log и config.ini остаются во временной папке
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    )
+    output = process.stdout.read()
+    cpu = peak_rss = None
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+        cpu = usage.ru_utime + usage.ru_stime
+        # ru_maxrss - килобайты в Linux и байты в macOS
+        peak_rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    else:
+        process.wait()
+    wall = time.perf_counter() - started
+
+    result = {}
+    for line in output.decode('utf-8', 'replace').splitlines():
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if event.get('event') == 'result':
+            result = event
+    return {'wall': wall, 'cpu': cpu, 'peak_rss': peak_rss, 'code': process.returncode, 'result': result}
+
+
+def run_once(args, client_root: str, total_size: int) -> dict:
+    faults = Faults(args.latency / 1000, args.bandwidth * 1000 * 1000 / 8, args.reset_rate, args.truncate_rate, args.seed)
+    origin = Origin(client_root, 'client.json', faults)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+    # Сервер получает новый порт при каждом запуске - он же единственное зеркало манифеста
+    manifest_path = os.path.join(client_root, 'client.json')
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest['mirrors'] = [origin.url]
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    workdir = tempfile.mkdtemp(prefix='wow-bench-')
+    game_path = os.path.join(workdir, 'game')
+    common = ['--game-path', game_path, '--manifest-url', origin.url + 'client.json']
+    try:
+        install = run_launcher(
+            ['install'] + common + ['--parallel-files', str(args.parallel_files), '--segments', str(args.segments),
+                                    '--progress-interval', '60'],
+            workdir
+        )
+        if install['code'] != 0:
+            raise RuntimeError(f"Установка завершилась с кодом {install['code']}: {install['result'].get('error')}")
+        requests_count, injected = origin.requests, faults.injected
+
+        # Проверка идет без сбоев: измеряется только хеширование
+        faults.reset_rate = faults.truncate_rate = faults.latency = faults.bandwidth = 0
+        verify = run_launcher(['verify', '--deep'] + common + ['--progress-interval', '60'], workdir)
+        if verify['code'] != 0:
+            raise RuntimeError(f"Проверка завершилась с кодом {verify['code']}")
+    finally:
+        origin.shutdown()
+        origin.server_close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    megabytes = total_size / (1024 * 1024)
+    return {
+        'install_wall': install['wall'],
+        'install_throughput': megabytes / install['wall'],
+        'install_cpu': install['cpu'],
+        'install_peak_rss': install['peak_rss'],
+        'requests': requests_count,
+        'faults': injected,
+        'verify_wall': verify['wall'],
+        'verify_throughput': megabytes / verify['wall'],
+        'verify_cpu': verify['cpu'],
+        'verify_peak_rss': verify['peak_rss'],
+    }
+
+
+def git_commit() -> str:
+    """Текущий коммит; '+' в конце - есть незакоммиченные изменения"""
+    directory = os.path.dirname(LAUNCHER)
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=directory,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD', '--', 'wow-launcher.py'], cwd=directory,
+                                stderr=subprocess.DEVNULL) != 0
+        return commit + ('+' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_report(report: dict, baseline: dict = None):
+    print(f"Коммит {report['commit']}, клиент {report['params']['size'] / (1024 * 1024):.0f} МБ, "
+          f"запусков {report['params']['repeat']}", file=sys.stderr)
+    for key, unit, higher_is_better in METRICS:
+        value = report['metrics'].get(key)
+        if value is None:
+            continue
+        line = f'  {key:<20} {value:>10.2f} {unit}'
+        old = (baseline or {}).get('metrics', {}).get(key)
+        if old:
+            change = (value - old) / old * 100
+            better = change > 0 if higher_is_better else change < 0
+            line += f'   {change:+.1f}% к {baseline["commit"]}' + (' (лучше)' if better and abs(change) >= 1 else '')
+        print(line, file=sys.stderr)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Бенчмарк установки и проверки клиента на локальном сервере')
+    parser.add_argument('--manifest', default=os.path.join(os.path.dirname(LAUNCHER), 'clien.json'),
+                        help='манифест, по которому создается синтетический клиент')
+    parser.add_argument('--scale', type=float, default=0.01, help='множитель размеров файлов')
+    parser.add_argument('--seed', type=int, default=1, help='зерно содержимого файлов и сбоев')
+    parser.add_argument('--repeat', type=int, default=3, help='запусков; в отчет идет медиана')
+    parser.add_argument('--latency', type=float, default=0, help='задержка ответа, мс')
+    parser.add_argument('--bandwidth', type=float, default=0, help='общая скорость сервера, Мбит/с (0 - без ограничения)')
+    parser.add_argument('--reset-rate', type=float, default=0, help='доля ответов со сбросом соединения')
+    parser.add_argument('--truncate-rate', type=float, default=0, help='доля оборванных ответов')
+    parser.add_argument('--parallel-files', type=int, default=4)
+    parser.add_argument('--segments', type=int, default=4)
+    parser.add_argument('--output', help='дописать результат строкой JSON в файл')
+    parser.add_argument('--compare', help='файл с результатами; сравнение с последней строкой')
+    args = parser.parse_args(argv)
+
+    client_root = tempfile.mkdtemp(prefix='wow-bench-client-')
+    try:
+        size = generate_client(args.manifest, client_root, args.scale, args.seed)
+        runs = []
+        for index in range(args.repeat):
+            try:
+                runs.append(run_once(args, client_root, size))
+            except RuntimeError as e:
+                print(f'Запуск {index + 1}: {e}', file=sys.stderr)
+                return 1
+            print(f"Запуск {index + 1}: установка {runs[-1]['install_wall']:.2f} с, "
+                  f"проверка {runs[-1]['verify_wall']:.2f} с", file=sys.stderr)
+    finally:
+        shutil.rmtree(client_root, ignore_errors=True)
+
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'manifest')}
+    params['size'] = size
+    params['manifest'] = os.path.basename(args.manifest)
+    report = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': params,
+        'metrics': {
+            key: statistics.median(run[key] for run in runs) if runs[0][key] is not None else None
+            for key, _, _ in METRICS
+        },
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        # Сравниваем только запуски с теми же параметрами
+        same = [line for line in lines if line.get('params') == params]
+        baseline = same[-1] if same else None
+        if baseline is None:
+            print('В файле сравнения нет запуска с такими же параметрами', file=sys.stderr)
+    print_report(report, baseline)
+    print(json.dumps(report, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report, ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
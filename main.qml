@@ -23,7 +23,11 @@ ApplicationWindow {
 
         Image {
             anchors.fill: parent
-            source: "qml/images/background.jpg" // Путь к изображению
+            source: "image://assets/crop/" + encodeURIComponent("qml/images/background.jpg") // Путь к изображению
+            // Размер округляется вверх до шага 256 px: изменение размера окна
+            // не перезапрашивает фон на каждый пиксель
+            sourceSize: Qt.size(Math.ceil(mainWindow.width / 256) * 256, Math.ceil(mainWindow.height / 256) * 256)
+            asynchronous: true
             fillMode: Image.PreserveAspectCrop
             opacity: 0.3
 
@@ -159,7 +163,7 @@ ApplicationWindow {
                         
                         Label {
                             Layout.fillWidth: true
-                            text: launcher ? launcher.currentFileName : ""
+                            text: launcher && launcher.downloadStats.activeFiles ? launcher.downloadStats.activeFiles.join(", ") : ""
                             color: Theme.Theme.primaryText
                             font.pixelSize: Theme.Theme.smallSize
                             visible: text !== ""
@@ -172,13 +176,13 @@ ApplicationWindow {
                             Layout.rightMargin: 1
                             Layout.topMargin: 1
                             Layout.bottomMargin: 1
-                            value: launcher ? launcher.downloadProgress : 0
+                            value: launcher && launcher.downloadStats.progress ? launcher.downloadStats.progress : 0
                             text: {
                                 if (launcher) {
-                                    if (launcher.downloadSpeed && launcher.downloadSizeInfo) {
-                                        return launcher.downloadSpeed + " / " + launcher.downloadSizeInfo
-                                    }
-                                    return launcher.downloadSpeed
+                                    var stats = launcher.downloadStats
+                                    return [stats.speedText, stats.sizeText, stats.etaText].filter(function(part) {
+                                        return part
+                                    }).join(" / ")
                                 }
                                 return ""                            
                             }
@@ -227,9 +231,18 @@ ApplicationWindow {
                     font.bold: true
                     
                     ToolTip.visible: serverMouseArea.containsMouse
-                    ToolTip.text: launcher && launcher.isServerOnline ? 
-                        "Сервер доступен" : 
-                        "Сервер недоступен"
+                    ToolTip.text: {
+                        if (!launcher || launcher.realmStats.length === 0)
+                            return "Сервер недоступен"
+                        return launcher.realmStats.map(function(realm) {
+                            return realm.name + "\n" + ["auth", "world"].map(function(kind) {
+                                var endpoint = realm[kind]
+                                if (!endpoint.online)
+                                    return "  " + kind + ": недоступен"
+                                return "  " + kind + ": " + endpoint.p50 + " мс (p95 " + endpoint.p95 + " мс)"
+                            }).join("\n")
+                        }).join("\n")
+                    }
                     
                     MouseArea {
                         id: serverMouseArea
@@ -17,6 +17,12 @@ Menu {
         onTriggered: launcher.verifyFiles()
     }
     
+    MenuItem {
+        text: "Полная проверка файлов"
+        enabled: launcher && launcher.gamePath && !launcher.isDownloading
+        onTriggered: launcher.deepVerifyFiles()
+    }
+    
     MenuItem {
         text: "Восстановить клиент"
         enabled: launcher && launcher.gamePath && !launcher.isDownloading
@@ -140,16 +140,46 @@ Dialog {
                     
                     ComboBox {
                         Layout.fillWidth: true
-                        model: ["Без ограничений", "1 Мбит/с", "2 Мбит/с", "5 Мбит/с", "10 Мбит/с"]
+                        model: ["Без ограничений", "1 Мбит/с", "2 Мбит/с", "5 Мбит/с", "10 Мбит/с", "Авто (по задержке до сервера)"]
                         currentIndex: launcher && launcher.settings ? launcher.settings.speedLimit : 0
                         onCurrentIndexChanged: if (launcher && launcher.settings) launcher.settings.speedLimit = currentIndex
                     }
                     
+                    Label {
+                        text: "Одновременных загрузок файлов:"
+                    }
+                    
+                    SpinBox {
+                        Layout.fillWidth: true
+                        from: 1
+                        to: 8
+                        value: launcher && launcher.settings ? launcher.settings.parallelDownloads : 4
+                        onValueChanged: if (launcher && launcher.settings) launcher.settings.parallelDownloads = value
+                    }
+                    
+                    Label {
+                        text: "Потоков на один большой файл:"
+                    }
+                    
+                    SpinBox {
+                        Layout.fillWidth: true
+                        from: 1
+                        to: 16
+                        value: launcher && launcher.settings ? launcher.settings.parallelSegments : 4
+                        onValueChanged: if (launcher && launcher.settings) launcher.settings.parallelSegments = value
+                    }
+                    
                     CheckBox {
                         text: "Автоматически загружать обновления"
                         checked: launcher && launcher.settings ? launcher.settings.autoUpdate : true
                         onCheckedChanged: if (launcher && launcher.settings) launcher.settings.autoUpdate = checked
                     }
+
+                    CheckBox {
+                        text: "Обмениваться файлами с лаунчерами в локальной сети"
+                        checked: launcher && launcher.settings ? launcher.settings.lanCache : false
+                        onCheckedChanged: if (launcher && launcher.settings) launcher.settings.lanCache = checked
+                    }
                 }
             }
             
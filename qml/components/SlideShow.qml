@@ -11,20 +11,35 @@ Item {
     
     property var imageUrls: []
     property int interval: 5000
+    // Размер декодирования округляется вверх до шага 256 px, чтобы изменение
+    // размера области не перезапрашивало слайды на каждый пиксель
+    readonly property size decodeSize: Qt.size(Math.ceil(width / 256) * 256, Math.ceil(height / 256) * 256)
+    
+    // Слайды загружаются уменьшенными до размера области через кэш image://assets.
+    // Относительные пути считаются от этого файла, как у обычного Image
+    function slideSource(index) {
+        if (imageUrls.length === 0 || width <= 0 || height <= 0)
+            return ""
+        return "image://assets/fit/" + encodeURIComponent(Qt.resolvedUrl(imageUrls[index % imageUrls.length]))
+    }
     
     // Добавляем второе изображение для плавного перехода
     Image {
         id: fadeOutImage
         anchors.fill: parent
         fillMode: Image.PreserveAspectFit
+        sourceSize: root.decodeSize
+        asynchronous: true
         opacity: 0
     }
     
     Image {
         id: mainImage
         anchors.fill: parent
-        source: imageUrls.length > 0 ? imageUrls[currentIndex] : ""
+        source: slideSource(currentIndex)
         fillMode: Image.PreserveAspectFit
+        sourceSize: root.decodeSize
+        asynchronous: true
         
         property int currentIndex: 0
         
@@ -40,6 +55,14 @@ Item {
         }
     }
     
+    // Заранее готовим следующий слайд, чтобы переход не ждал загрузки
+    Image {
+        visible: false
+        source: imageUrls.length > 1 ? slideSource(mainImage.currentIndex + 1) : ""
+        sourceSize: root.decodeSize
+        asynchronous: true
+    }
+    
     // Кнопки навигации
     Rectangle {
         id: prevButton
@@ -0,0 +1,71 @@
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtGui import QGuiApplication  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)  # benchmark.py с тестовым сервером
+
+from benchmark import Faults, Origin, generate_client  # noqa: E402
+
+
+def load_launcher():
+    spec = importlib.util.spec_from_file_location('wow_launcher', os.path.join(ROOT, 'wow-launcher.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def app():
+    return QGuiApplication.instance() or QGuiApplication([])
+
+
+@pytest.fixture(scope='session')
+def launcher(app):
+    return load_launcher()
+
+
+# Мелкие файлы обрываются на нулевом байте чаще крупных - на них и падала установка
+CLIENT = {
+    'Data/common.MPQ': 3 * 1024 * 1024,
+    'Data/ruRU/locale-ruRU.MPQ': 600 * 1024,
+    'Microsoft.VC80.CRT.manifest': 522,
+    'Wow.exe': 70 * 1024,
+    'realmlist.wtf': 30,
+    'Data/patch.MPQ': 200 * 1024,
+    'Data/ruRU/Interface/Cinematics/Logo_800.avi': 100 * 1024,
+}
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """Клиент CLIENT на сервере бенчмарка; сбои задаются через origin.faults"""
+    source = tmp_path / 'source.json'
+    source.write_text(json.dumps({'files': {name: {'size': size, 'hash': ''} for name, size in CLIENT.items()}}))
+    root = tmp_path / 'origin'
+    generate_client(str(source), str(root), 1.0, 1)
+    manifest = json.loads((root / 'client.json').read_text())
+    server = Origin(str(root), 'client.json', Faults(seed=3))
+    manifest['mirrors'] = [server.url]
+    (root / 'client.json').write_text(json.dumps(manifest))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.files = manifest['files']
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def installed(game_path, files: dict) -> list:
+    return sorted(
+        name for name, info in files.items()
+        if (game_path / name).exists() and hashlib.sha256((game_path / name).read_bytes()).hexdigest() == info['hash']
+    )
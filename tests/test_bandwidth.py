@@ -0,0 +1,92 @@
+import threading
+import time
+
+
+def consume_for(limiter, seconds: float, chunk: int = 32 * 1024):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        limiter.consume(chunk)
+        time.sleep(0.001)
+
+
+def test_token_bucket_rate(launcher):
+    limiter = launcher.BandwidthLimiter(rate=1000 * 1000)
+    started = time.monotonic()
+    for _ in range(50):
+        limiter.consume(10 * 1000)
+    assert 0.4 <= time.monotonic() - started <= 1.0
+
+
+def test_rate_change_wakes_waiters(launcher):
+    limiter = launcher.BandwidthLimiter(rate=10 * 1000)
+    thread = threading.Thread(target=limiter.consume, args=(100 * 1000,))
+    started = time.monotonic()
+    thread.start()
+    time.sleep(0.1)
+    limiter.set_rate(0)
+    thread.join(1.0)
+    assert not thread.is_alive() and time.monotonic() - started < 1.0
+
+
+def test_auto_backs_off_on_rtt_growth(launcher):
+    limiter = launcher.BandwidthLimiter()
+    rtts = [0.010] * 3 + [0.200] * 100
+    limiter.measure_rtt = lambda host, port: rtts.pop(0)
+    limiter.set_auto('realm', 3724, interval=0.05)
+    consume_for(limiter, 0.15)
+    assert limiter.rate == 0  # Задержка в норме - без ограничения
+    consume_for(limiter, 0.3)
+    assert 0 < limiter.rate
+    learned = limiter.rate
+
+    # Повторное включение авторежима не сбрасывает подобранный лимит
+    limiter.set_auto('realm', 3724, interval=0.05)
+    assert 0 < limiter.rate <= learned
+    limiter.set_rate(0)
+    assert limiter.rate == 0 and limiter._auto_target is None
+
+
+def test_auto_recovers_when_rtt_normal(launcher):
+    limiter = launcher.BandwidthLimiter()
+    limiter.measure_rtt = lambda host, port: 0.010
+    limiter.set_auto('realm', 3724, interval=0.05)
+    limiter._set_rate(100 * 1000, auto=True)
+    consume_for(limiter, 0.5, chunk=4 * 1024)
+    # Лимит растет на 10% за замер и снимается, когда намного превышает фактическую скорость
+    assert limiter.rate == 0 or limiter.rate > 100 * 1000
+    limiter.set_rate(0)
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.calls = []
+
+    def set_auto(self, host, port):
+        self.calls.append('auto')
+
+    def set_rate(self, rate):
+        self.calls.append(rate)
+
+
+def test_backend_applies_only_speed_limit_changes(launcher, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # config.ini и settings.json
+    limiter = RecordingLimiter()
+    monkeypatch.setattr(launcher, 'bandwidth_limiter', limiter)
+    backend = launcher.LauncherBackend(launcher.ConfigManager())
+    settings = backend._settings
+    settings.settingsChanged.connect(backend._apply_speed_limit)
+    backend._apply_speed_limit()
+    assert limiter.calls == [0]
+
+    settings.slideInterval = 7
+    assert limiter.calls == [0]
+
+    # Во время игры без ручного лимита работает авторежим, и другие настройки его не сбрасывают
+    backend._set_game_running(True)
+    settings.showNotifications = False
+    assert limiter.calls == [0, 'auto']
+    settings.speedLimit = 2
+    settings.speedLimit = 0
+    assert limiter.calls == [0, 'auto', 2 * 1000 * 1000 / 8, 'auto']
+    backend.game_exited()
+    assert limiter.calls == [0, 'auto', 2 * 1000 * 1000 / 8, 'auto', 0]
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+
+import pytest
+from PyQt5.QtCore import Qt
+
+from conftest import CLIENT, installed
+
+
+def make_manager(launcher, origin, game_path):
+    manager = launcher.DownloadManager(origin.url + 'client.json', str(game_path))
+    manager.retry_delay = 0.01
+    return manager
+
+
+def test_install_survives_flaky_origin(launcher, origin, tmp_path):
+    origin.faults.reset_rate, origin.faults.truncate_rate = 0.6, 0.2
+    manager = make_manager(launcher, origin, tmp_path / 'game')
+    manager.run()
+    assert origin.faults.injected > 0
+    assert manager.error is None and manager.completed
+    assert installed(tmp_path / 'game', origin.files) == sorted(CLIENT)
+
+
+def test_unavailable_file_fails_alone(launcher, origin, tmp_path):
+    os.remove(os.path.join(origin.root, 'Wow.exe'))  # Сервер отвечает 404
+    manager = make_manager(launcher, origin, tmp_path / 'game')
+    manager.retry_budget = 0.3
+    manager.file_retries = 1
+    manager.run()
+    assert manager.error is None and not manager.completed
+    assert manager.corrupted_files == ['Wow.exe']
+    assert installed(tmp_path / 'game', origin.files) == sorted(set(CLIENT) - {'Wow.exe'})
+
+
+def test_block_repair_keeps_store_links(launcher, origin, tmp_path):
+    name = 'Data/common.MPQ'
+    manifest_path = os.path.join(origin.root, 'client.json')
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    info = manifest['files'][name]
+    info['block_size'] = 1024 * 1024
+    info['blocks'] = launcher.VerifyEngine().hash_blocks(os.path.join(origin.root, name), info['block_size'])
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    store = launcher.ObjectStore(str(tmp_path / 'store'))
+    for game in ('first', 'second'):
+        launcher.DownloadManager(origin.url + 'client.json', str(tmp_path / game), object_store=store).run()
+    first, second = tmp_path / 'first' / name, tmp_path / 'second' / name
+    assert os.path.samefile(first, second)
+
+    with open(second, 'r+b') as f:
+        f.seek(1024 * 1024 + 10)
+        f.write(b'broken')
+    damaged = first.read_bytes()
+    manager = launcher.DownloadManager(origin.url + 'client.json', str(tmp_path / 'second'), [name],
+                                       repair_blocks={name: [1]}, object_store=store)
+    manager.run()
+    assert manager.completed
+    assert hashlib.sha256(second.read_bytes()).hexdigest() == info['hash']
+    # Другая установка не изменилась, а в хранилище теперь исправленная копия
+    assert first.read_bytes() == damaged
+    assert os.path.samefile(store.path(info['hash']), second)
+
+
+def test_steal_skips_reserved_chunk(launcher, tmp_path):
+    manager = launcher.DownloadManager('http://127.0.0.1:9/client.json', str(tmp_path))
+    victim = launcher.Segment(0, 8 * 1024 * 1024)
+    victim.reserved = 6 * 1024 * 1024  # Поток уже пишет блок до этой позиции
+    state = {'pending': [], 'active': [victim], 'mirrors': launcher.MirrorSet(['http://127.0.0.1:9/'])}
+    stolen = manager._take_segment(state)
+    assert stolen.start >= victim.reserved and stolen.start == victim.end
+    assert stolen.end == 8 * 1024 * 1024
+
+
+def test_steal_after_gap_split(launcher, tmp_path):
+    manager = launcher.DownloadManager('http://127.0.0.1:9/client.json', str(tmp_path))
+    size = 3 * manager.controller.segment_size
+    state = {'pending': [launcher.Segment(0, size)], 'active': [], 'mirrors': launcher.MirrorSet(['http://127.0.0.1:9/'])}
+    taken = [manager._take_segment(state) for _ in range(3)]
+    assert [(s.start, s.end) for s in taken] == [(i * size // 3, (i + 1) * size // 3) for i in range(3)]
+    state['active'] = [taken[2]]  # Первые два сегмента уже загружены
+    stolen = manager._take_segment(state)
+    assert taken[2].position < stolen.start == taken[2].end
+
+
+@pytest.mark.parametrize('filename, tier', [
+    ('Wow.exe', 0),
+    ('Battle.net.dll', 0),
+    ('Microsoft.VC80.CRT.manifest', 0),
+    ('realmlist.wtf', 0),
+    ('Data/ruRU/realmlist.wtf', 0),
+    ('Data/common.MPQ', 0),
+    ('Data/ruRU/locale-ruRU.MPQ', 0),
+    ('Data/ruRU/base-ruRU.MPQ', 0),
+    ('Data/common-2.MPQ', 1),
+    ('Data/lichking.MPQ', 1),
+    ('Data/patch-3.MPQ', 1),
+    ('Data/ruRU/speech-ruRU.MPQ', 1),
+    ('Data/ruRU/expansion-locale-ruRU.MPQ', 1),
+    ('Data/ruRU/Interface/Cinematics/WOW_Intro_800.avi', 2),
+])
+def test_manifest_tier(launcher, filename, tier):
+    assert launcher.manifest_tier(filename, {}) == tier
+
+
+def test_manifest_tier_field(launcher):
+    assert launcher.manifest_tier('Data/lichking.MPQ', {'tier': 'launch'}) == launcher.TIER_LAUNCH
+    assert launcher.manifest_tier('Wow.exe', {'tier': 'optional'}) == launcher.TIER_OPTIONAL
+
+
+def record_run(launcher, manager) -> list:
+    """Запускает загрузку и возвращает события ('file', имя) и ('playable', флаг) по порядку"""
+    events = []
+    process_file = manager.process_file
+    manager.process_file = lambda filename, info: (events.append(('file', filename)), process_file(filename, info))
+    manager.playable_changed.connect(lambda playable: events.append(('playable', playable)), Qt.DirectConnection)
+    manager.run()
+    return events
+
+
+def test_files_load_by_tier(launcher, origin, tmp_path):
+    manager = launcher.DownloadManager(origin.url + 'client.json', str(tmp_path / 'game'), max_parallel_files=1)
+    events = record_run(launcher, manager)
+    assert manager.completed
+    files = [name for kind, name in events if kind == 'file']
+    tiers = [launcher.manifest_tier(name, {}) for name in files]
+    assert tiers == sorted(tiers) and sorted(files) == sorted(CLIENT)
+    # Играть можно сразу после файлов для запуска, не дожидаясь остальных
+    ready = events.index(('playable', True))
+    assert events[0] == ('playable', False)
+    assert {name for kind, name in events[:ready] if kind == 'file'} == {
+        name for name in CLIENT if launcher.manifest_tier(name, {}) == launcher.TIER_LAUNCH
+    }
+
+
+def test_outdated_launch_file_keeps_play(launcher, origin, tmp_path):
+    launcher.DownloadManager(origin.url + 'client.json', str(tmp_path / 'game')).run()
+    data = os.urandom(CLIENT['Wow.exe'])
+    with open(os.path.join(origin.root, 'Wow.exe'), 'wb') as f:
+        f.write(data)
+    manifest_path = os.path.join(origin.root, 'client.json')
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    manifest['files']['Wow.exe']['hash'] = hashlib.sha256(data).hexdigest()
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+    manager = launcher.DownloadManager(origin.url + 'client.json', str(tmp_path / 'game'))
+    events = record_run(launcher, manager)
+    assert manager.completed
+    assert events == [('playable', True), ('file', 'Wow.exe')]
+    assert (tmp_path / 'game' / 'Wow.exe').read_bytes() == data
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import random
+import threading
+
+
+def chunks(data: bytes, size: int) -> list:
+    return [(offset, data[offset:offset + size]) for offset in range(0, len(data), size)]
+
+
+def write_file(tmp_path, data: bytes) -> str:
+    """Файл, в который все блоки уже записаны, - как .temp при загрузке"""
+    path = tmp_path / 'file.temp'
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_hasher_in_order(launcher, tmp_path):
+    data = os.urandom(100000)
+    hasher = launcher.StreamHasher(write_file(tmp_path, data))
+    for offset, chunk in chunks(data, 7000):
+        hasher.update(offset, chunk)
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+    assert hasher.covered == len(data)
+
+
+def test_hasher_out_of_order(launcher, tmp_path):
+    data = os.urandom(300000)
+    blocks = chunks(data, 5000)
+    random.Random(1).shuffle(blocks)
+    hasher = launcher.StreamHasher(write_file(tmp_path, data), block_size=4096)
+    for offset, chunk in blocks:
+        hasher.update(offset, chunk)
+    assert hasher.position == len(data)
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_hasher_covered_counts_ranges_ahead(launcher, tmp_path):
+    data = os.urandom(30000)
+    hasher = launcher.StreamHasher(write_file(tmp_path, data))
+    hasher.update(20000, data[20000:])
+    hasher.update(10000, data[10000:20000])
+    assert hasher.position == 0 and hasher.covered == 20000
+    hasher.update(0, data[:10000])
+    assert hasher.position == hasher.covered == len(data)
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_hasher_resumes_with_completed_ranges(launcher, tmp_path):
+    data = os.urandom(50000)
+    hasher = launcher.StreamHasher(write_file(tmp_path, data), [[0, 10000], [30000, 40000]])
+    assert hasher.position == 10000 and hasher.covered == 20000
+    for offset, end in ((40000, 50000), (10000, 30000)):
+        hasher.update(offset, data[offset:end])
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_hasher_from_start_offset(launcher, tmp_path):
+    data = os.urandom(50000)
+    hasher = launcher.StreamHasher(write_file(tmp_path, data), start=20000)
+    hasher.update(35000, data[35000:])
+    hasher.update(20000, data[20000:35000])
+    assert hasher.hexdigest() == hashlib.sha256(data[20000:]).hexdigest()
+
+
+def test_hasher_parallel_segments(launcher, tmp_path):
+    data = os.urandom(1024 * 1024)
+    hasher = launcher.StreamHasher(write_file(tmp_path, data), block_size=10000)
+    segment = len(data) // 4
+
+    def feed(start):
+        for offset, chunk in chunks(data[start:start + segment], 3000):
+            hasher.update(start + offset, chunk)
+
+    threads = [threading.Thread(target=feed, args=(start,)) for start in range(0, len(data), segment)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert hasher.position == len(data)
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
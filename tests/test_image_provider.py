@@ -0,0 +1,52 @@
+import os
+import re
+
+import pytest
+from PyQt5.QtCore import Q_ARG, Q_RETURN_ARG, QMetaObject, QSize, QUrl, QVariant
+from PyQt5.QtQml import QQmlComponent, QQmlEngine
+
+from conftest import ROOT
+
+
+@pytest.fixture(scope='module')
+def provider(launcher, tmp_path_factory):
+    return launcher.ImageProvider(launcher.ImageCache(str(tmp_path_factory.mktemp('images')), ROOT))
+
+
+@pytest.fixture(scope='module')
+def slideshow(app):
+    engine = QQmlEngine()
+    component = QQmlComponent(engine, QUrl.fromLocalFile(os.path.join(ROOT, 'qml', 'components', 'SlideShow.qml')))
+    item = component.create()
+    assert item is not None, component.errors()
+    item.setProperty('width', 400)
+    item.setProperty('height', 300)
+    yield item
+    item.deleteLater()
+
+
+def slide_urls() -> list:
+    with open(os.path.join(ROOT, 'main.qml'), encoding='utf-8') as f:
+        block = re.search(r'imageUrls:\s*\[(.*?)\]', f.read(), re.S).group(1)
+    return re.findall(r'"([^"]+)"', block)
+
+
+def request(provider, source: str, size: QSize):
+    assert source.startswith('image://assets/')
+    return provider.requestImage(source[len('image://assets/'):], size)
+
+
+@pytest.mark.parametrize('path', slide_urls())
+def test_slide_loads(provider, slideshow, path):
+    slideshow.setProperty('imageUrls', [path])
+    source = QMetaObject.invokeMethod(slideshow, 'slideSource', Q_RETURN_ARG(QVariant), Q_ARG(QVariant, 0))
+    image, size = request(provider, source, QSize(400, 300))
+    assert not image.isNull(), source
+    assert size.width() <= 400 and size.height() <= 300
+
+
+def test_background_loads(provider):
+    with open(os.path.join(ROOT, 'main.qml'), encoding='utf-8') as f:
+        path = re.search(r'"image://assets/crop/" \+ encodeURIComponent\("([^"]+)"\)', f.read()).group(1)
+    image, _ = request(provider, 'image://assets/crop/' + bytes(QUrl.toPercentEncoding(path)).decode(), QSize(1010, 650))
+    assert not image.isNull()
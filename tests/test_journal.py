@@ -0,0 +1,101 @@
+import json
+import os
+import zlib
+
+from benchmark import OriginHandler
+
+
+def journal_with(launcher, tmp_path, data: bytes, ranges: list):
+    """Файл .temp с данными data и журнал, в котором записаны диапазоны ranges"""
+    temp_path = tmp_path / 'file.temp'
+    temp_path.write_bytes(data)
+    journal = launcher.SegmentJournal(str(temp_path) + '.journal')
+    journal.open([])
+    with open(temp_path, 'rb') as f:
+        for start, end in ranges:
+            journal.record(f, start, end, zlib.crc32(data[start:end]))
+    journal.close()
+    return journal, str(temp_path)
+
+
+def test_journal_round_trip(launcher, tmp_path):
+    data = os.urandom(10000)
+    journal, temp_path = journal_with(launcher, tmp_path, data, [(0, 4000), (6000, 10000)])
+    assert journal.load(temp_path, len(data)) == [
+        [0, 4000, zlib.crc32(data[:4000])], [6000, 10000, zlib.crc32(data[6000:])]
+    ]
+
+
+def test_journal_drops_ranges_with_wrong_crc(launcher, tmp_path):
+    data = os.urandom(10000)
+    journal, temp_path = journal_with(launcher, tmp_path, data, [(0, 4000), (4000, 8000)])
+    with open(temp_path, 'r+b') as f:
+        f.seek(5000)
+        f.write(b'lost')  # Данные не дошли до диска, а запись журнала - дошла
+    assert [record[:2] for record in journal.load(temp_path, len(data))] == [[0, 4000]]
+
+
+def test_journal_stops_at_torn_record(launcher, tmp_path):
+    data = os.urandom(10000)
+    journal, temp_path = journal_with(launcher, tmp_path, data, [(0, 4000), (4000, 8000)])
+    with open(journal.path, 'a') as f:
+        f.write('[8000, 100')  # Запись оборвалась при отключении питания
+    assert [record[:2] for record in journal.load(temp_path, len(data))] == [[0, 4000], [4000, 8000]]
+
+
+def test_journal_drops_ranges_beyond_file(launcher, tmp_path):
+    data = os.urandom(10000)
+    journal, temp_path = journal_with(launcher, tmp_path, data, [(0, 4000), (4000, 10000)])
+    assert [record[:2] for record in journal.load(temp_path, 8000)] == [[0, 4000]]
+
+
+def test_journal_reopen_compacts(launcher, tmp_path):
+    data = os.urandom(10000)
+    journal, temp_path = journal_with(launcher, tmp_path, data, [(0, 4000)])
+    with open(journal.path, 'a') as f:
+        f.write('[4000, 8000, 1]\n[8000, 1')
+    records = journal.load(temp_path, len(data))
+    journal.open(records)
+    journal.close()
+    with open(journal.path) as f:
+        assert [json.loads(line) for line in f] == records == [[0, 4000, zlib.crc32(data[:4000])]]
+
+
+def test_download_resumes_from_journal(launcher, origin, tmp_path, monkeypatch):
+    name = 'Data/common.MPQ'
+    with open(os.path.join(origin.root, name), 'rb') as f:
+        data = f.read()
+    local_path = tmp_path / 'game' / name
+    local_path.parent.mkdir(parents=True)
+    damaged = bytearray(data)
+    damaged[2 * 1024 * 1024 + 10:2 * 1024 * 1024 + 16] = b'broken'
+    temp_path = str(local_path) + '.temp'
+    with open(temp_path, 'wb') as f:
+        f.write(damaged[:2 * 1024 * 1024 + 512 * 1024])
+    journal = launcher.SegmentJournal(temp_path + '.journal')
+    journal.open([
+        [0, 1024 * 1024, zlib.crc32(data[:1024 * 1024])],
+        [1024 * 1024, 2 * 1024 * 1024, zlib.crc32(data[1024 * 1024:2 * 1024 * 1024])],
+        [2 * 1024 * 1024, 2 * 1024 * 1024 + 512 * 1024, zlib.crc32(data[2 * 1024 * 1024:2 * 1024 * 1024 + 512 * 1024])],
+    ])
+    journal.close()
+    with open(journal.path, 'a') as f:
+        f.write('[2621440, 30')
+
+    requested = []
+    do_get = OriginHandler.do_GET
+
+    def record_range(handler, send_body=True):
+        if handler.path.lstrip('/') == name:
+            requested.append(handler.headers.get('Range'))
+        return do_get(handler, send_body)
+
+    monkeypatch.setattr(OriginHandler, 'do_GET', record_range)
+    manager = launcher.DownloadManager(origin.url + 'client.json', str(tmp_path / 'game'))
+    manager.run()
+    assert manager.completed
+    assert local_path.read_bytes() == data
+    assert not os.path.exists(temp_path + '.journal')
+    # Первые 2 МБ с верной CRC взяты с диска, поврежденный диапазон загружен заново
+    starts = [int(value[6:].partition('-')[0]) for value in requested if value and value.startswith('bytes=')]
+    assert starts and min(starts) == 2 * 1024 * 1024
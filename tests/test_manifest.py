@@ -0,0 +1,75 @@
+import json
+import os
+
+from conftest import CLIENT, installed
+
+
+def read_state(game_path) -> dict:
+    with open(game_path / '.launcher_manifest.json') as f:
+        return json.load(f)
+
+
+def publish(origin, change):
+    """Меняет манифест на сервере: change(files) правит словарь файлов"""
+    manifest_path = os.path.join(origin.root, 'client.json')
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    change(manifest['files'])
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    origin.files = manifest['files']
+
+
+def drop_realmlist(files):
+    del files['realmlist.wtf']
+
+
+def test_synced_manifest_is_not_stored_twice(launcher, origin, tmp_path):
+    manager = launcher.DownloadManager(origin.url + 'client.json', str(tmp_path / 'game'))
+    manager.run()
+    assert manager.completed
+    state = read_state(tmp_path / 'game')
+    assert state['synced'] == {'digest': state['digest']}
+    assert launcher.ManifestStore.synced_files(state) == state['manifest']['files']
+
+
+def test_synced_hashes_survive_new_manifest(launcher, origin, tmp_path):
+    game_path = tmp_path / 'game'
+    launcher.DownloadManager(origin.url + 'client.json', str(game_path)).run()
+    old_files = dict(origin.files)
+    publish(origin, drop_realmlist)
+
+    snapshot = launcher.ManifestStore(str(game_path), origin.url + 'client.json').fetch()
+    assert snapshot.diff == {'added': [], 'removed': ['realmlist.wtf'], 'changed': []}
+    assert snapshot.previous == {
+        name: {'size': info['size'], 'hash': info['hash']} for name, info in old_files.items()
+    }
+    # Хеши прежней версии сохранены отдельно и переживают перезапуск
+    state = read_state(game_path)
+    assert state['synced']['files'] == snapshot.previous
+    assert launcher.ManifestStore(str(game_path), origin.url + 'client.json').fetch().previous == snapshot.previous
+
+
+def test_removed_file_deleted_after_manifest_change(launcher, origin, tmp_path):
+    game_path = tmp_path / 'game'
+    launcher.DownloadManager(origin.url + 'client.json', str(game_path)).run()
+    publish(origin, drop_realmlist)
+    manager = launcher.DownloadManager(origin.url + 'client.json', str(game_path))
+    manager.run()
+    assert manager.completed
+    assert not (game_path / 'realmlist.wtf').exists()
+    assert installed(game_path, origin.files) == sorted(set(CLIENT) - {'realmlist.wtf'})
+    state = read_state(game_path)
+    assert state['synced'] == {'digest': state['digest']}
+
+
+def test_store_gc_keeps_synced_objects(launcher, origin, tmp_path):
+    game_path = tmp_path / 'game'
+    store = launcher.ObjectStore(str(tmp_path / 'store'))
+    launcher.DownloadManager(origin.url + 'client.json', str(game_path), object_store=store).run()
+    realmlist_hash = origin.files['realmlist.wtf']['hash']
+    publish(origin, drop_realmlist)
+    launcher.ManifestStore(str(game_path), origin.url + 'client.json').fetch()
+    os.remove(game_path / 'realmlist.wtf')  # Объект больше не связан жесткой ссылкой
+    store.gc()
+    assert os.path.exists(store.path(realmlist_hash))
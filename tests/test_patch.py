@@ -0,0 +1,68 @@
+import io
+import json
+import os
+import random
+
+import pytest
+
+
+def round_trip(launcher, tmp_path, old: bytes, new: bytes) -> int:
+    """Создает патч old -> new, применяет его и возвращает размер патча"""
+    old_path, new_path, patch_path = tmp_path / 'old.bin', tmp_path / 'new.bin', tmp_path / 'patch.delta'
+    old_path.write_bytes(old)
+    new_path.write_bytes(new)
+    launcher.DeltaPatch.create(str(old_path), str(new_path), str(patch_path))
+    patch = patch_path.read_bytes()
+    result = []
+    assert launcher.DeltaPatch(io.BytesIO(patch), chunk_size=1000).apply(str(old_path), result.append)
+    assert b''.join(result) == new
+    return len(patch)
+
+
+def random_bytes(size: int, seed: int = 1) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+OLD = random_bytes(1024 * 1024)
+
+
+@pytest.mark.parametrize('new, limit', [
+    (OLD, 100),
+    (OLD[:300000] + random_bytes(100, 2) + OLD[300100:], 300),  # Правка 100 байт
+    (OLD[:12345] + random_bytes(1000, 3) + OLD[12345:], 1200),  # Вставка
+    (OLD[:500000] + OLD[530001:], 100),  # Удаление
+    (OLD[333333:] + OLD[:333333], 100),  # Сдвиг по кругу
+    (OLD[700000:] + OLD[:700000][::-1][:5000], 5200),  # Перенос и новые данные
+    (OLD[:-7], 100),  # Обрезка с неполным последним блоком
+    (b'', 100),
+])
+def test_patch_round_trip(launcher, tmp_path, new, limit):
+    assert round_trip(launcher, tmp_path, OLD, new) <= limit
+
+
+def test_patch_from_empty_file(launcher, tmp_path):
+    new = random_bytes(10000)
+    assert round_trip(launcher, tmp_path, b'', new) <= len(new) + 100
+
+
+def test_patch_repeated_blocks(launcher, tmp_path):
+    old = b'\0' * 100000 + random_bytes(5000) + b'\0' * 100000
+    new = b'\0' * 50000 + random_bytes(5000) + b'\0' * 150000 + b'tail'
+    assert round_trip(launcher, tmp_path, old, new) <= 200
+
+
+def test_make_patch_cli(launcher, tmp_path, capsys):
+    old_path, new_path, patch_path = tmp_path / 'old.bin', tmp_path / 'new.bin', tmp_path / 'patch.delta'
+    old_path.write_bytes(OLD)
+    new_path.write_bytes(OLD[:1000] + b'changed' + OLD[1000:])
+    assert launcher.run_cli(['make-patch', str(old_path), str(new_path), str(patch_path)]) == launcher.EXIT_OK
+    result = json.loads(capsys.readouterr().out)
+    engine = launcher.VerifyEngine()
+    assert result['ok'] and result['from'] == engine.hash_file(str(old_path))
+    assert result['hash'] == engine.hash_file(str(patch_path))
+    assert result['size'] == os.path.getsize(patch_path) < 100
+
+
+def test_patch_edits_near_file_ends(launcher, tmp_path):
+    new = OLD[:1000] + b'head' + OLD[1000:-1000] + b'tail' + OLD[-1000:]
+    assert round_trip(launcher, tmp_path, OLD, new) <= 100
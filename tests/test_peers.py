@@ -0,0 +1,68 @@
+import os
+import time
+
+import pytest
+
+from conftest import CLIENT, installed
+
+
+@pytest.fixture
+def seeder(launcher, origin, tmp_path):
+    """Лаунчер с установленным клиентом, раздающий его на localhost"""
+    game = tmp_path / 'seeder'
+    manager = launcher.DownloadManager(origin.url + 'client.json', str(game))
+    manager.run()
+    assert manager.completed
+    peer = launcher.PeerCache(str(game), discovery=False)
+    peer.start()
+    peer.game = game
+    yield peer
+    peer.stop()
+
+
+def fetcher(launcher, seeder, tmp_path):
+    return launcher.PeerCache(str(tmp_path / 'fetcher-cache'), peers=[f'127.0.0.1:{seeder.http_port}'], discovery=False)
+
+
+def test_fetch_from_peer(launcher, origin, seeder, tmp_path):
+    # Сервер больше не отдает файлы клиента - загрузить их можно только у соседа
+    for name in CLIENT:
+        os.remove(os.path.join(origin.root, name))
+    manager = launcher.DownloadManager(origin.url + 'client.json', str(tmp_path / 'game'),
+                                       peers=fetcher(launcher, seeder, tmp_path))
+    manager.run()
+    assert manager.completed
+    assert installed(tmp_path / 'game', origin.files) == sorted(CLIENT)
+
+
+def test_peer_serves_only_verified_files(launcher, origin, seeder, tmp_path):
+    info = origin.files['Wow.exe']
+    peers = fetcher(launcher, seeder, tmp_path)
+    assert peers.sources(info['hash'], info['size']) == [f'http://127.0.0.1:{seeder.http_port}/objects/']
+    assert peers.sources(info['hash'], info['size'] + 1) == []
+    assert peers.sources('0' * 64, 1) == []
+
+    # Файл изменен после проверки - сосед перестает его раздавать
+    path = seeder.game / 'Wow.exe'
+    time.sleep(0.01)
+    path.write_bytes(path.read_bytes())
+    assert seeder.lookup(info['hash']) is None
+    assert peers.sources(info['hash'], info['size']) == []
+
+
+def test_bad_peer_falls_back_to_origin(launcher, origin, seeder, tmp_path):
+    # Сосед отдает данные нужного размера, но не те
+    junk = tmp_path / 'junk'
+    junk.mkdir()
+    paths = {}
+    for name, info in origin.files.items():
+        paths[info['hash']] = str(junk / name.replace('/', '_'))
+        with open(paths[info['hash']], 'wb') as f:
+            f.write(os.urandom(info['size']))
+    seeder.lookup = paths.get
+    manager = launcher.DownloadManager(origin.url + 'client.json', str(tmp_path / 'game'),
+                                       peers=fetcher(launcher, seeder, tmp_path))
+    manager.run()
+    assert manager.completed and not manager.corrupted_files
+    assert installed(tmp_path / 'game', origin.files) == sorted(CLIENT)
+    assert manager.total_downloaded == manager.total_size
@@ -0,0 +1,95 @@
+import asyncio
+import socket
+import socketserver
+import struct
+import threading
+
+import pytest
+from PyQt5.QtCore import Qt
+
+
+class FakeAuthHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        header = self.request.recv(4)
+        if len(header) < 4:
+            return  # Проверка TCP-подключением: клиент закрыл соединение, ничего не отправив
+        command, error, size = struct.unpack('<BBH', header)
+        body = b''
+        while len(body) < size:
+            body += self.request.recv(size - len(body))
+        server.packets.append(header + body)
+        if server.reply is not None:
+            self.request.sendall(server.reply)
+        else:
+            server.release.wait(5)  # Сервер принимает соединение, но не отвечает
+
+
+@pytest.fixture
+def authserver():
+    """authserver в отдельном потоке: отвечает reply на AUTH_LOGON_CHALLENGE"""
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeAuthHandler)
+    server.daemon_threads = True
+    server.packets = []
+    # AUTH_LOGON_CHALLENGE, 0, WOW_FAIL_UNKNOWN_ACCOUNT - как для несуществующей учетной записи
+    server.reply = bytes([0x00, 0x00, 0x04])
+    server.release = threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_checker(launcher, authserver, logon_probe=True):
+    return launcher.ServerChecker([{
+        'name': 'test', 'auth': f'127.0.0.1:{authserver.server_address[1]}',
+        'world': f'127.0.0.1:{closed_port()}', 'logon_probe': logon_probe
+    }], timeout=0.3)
+
+
+def test_logon_challenge_packet(launcher):
+    packet = launcher.build_logon_challenge('player', build=12340)
+    command, error, size = struct.unpack('<BBH', packet[:4])
+    assert (command, error, size) == (launcher.AUTH_LOGON_CHALLENGE, 8, len(packet) - 4)
+    game, major, minor, patch, build, platform, os_name, country = struct.unpack('<4s3BH4s4s4s', packet[4:25])
+    assert (game, major, minor, patch, build) == (b'WoW\0', 3, 3, 5, 12340)
+    assert (platform, os_name, country) == (b'68x\0', b'niW\0', b'SUne')
+    assert packet[33] == len('PLAYER') and packet[34:] == b'PLAYER'
+
+
+def test_logon_probe_online(launcher, authserver):
+    checker = make_checker(launcher, authserver)
+    auth, world = checker.realms[0]['auth'], checker.realms[0]['world']
+    asyncio.run(checker.check_endpoint(auth))
+    asyncio.run(checker.check_endpoint(world))
+    assert authserver.packets == [launcher.build_logon_challenge()]
+    assert auth.online and len(auth.rtts) == 1 and auth.to_dict()['probe'] == 'logon'
+    assert not world.online and world.failures == 1
+
+    statuses = []
+    checker.status_changed.connect(lambda online, text: statuses.append((online, text)), Qt.DirectConnection)
+    checker._emit_status()
+    assert statuses == [(True, f"Auth сервер {auth.to_dict()['p50']} мс")]
+
+
+@pytest.mark.parametrize('reply', [b'\x01\x00\x00', b'\x00', None], ids=['wrong-command', 'short', 'silent'])
+def test_logon_probe_rejects_bad_server(launcher, authserver, reply):
+    authserver.reply = reply
+    checker = make_checker(launcher, authserver)
+    auth = checker.realms[0]['auth']
+    asyncio.run(checker.check_endpoint(auth))
+    assert authserver.packets and not auth.online and auth.failures == 1
+
+
+def test_tcp_probe_does_not_send_challenge(launcher, authserver):
+    checker = make_checker(launcher, authserver, logon_probe=False)
+    auth = checker.realms[0]['auth']
+    asyncio.run(checker.check_endpoint(auth))
+    assert auth.online and auth.to_dict()['probe'] == 'tcp'
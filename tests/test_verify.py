@@ -0,0 +1,127 @@
+import hashlib
+import os
+
+from PyQt5.QtCore import Qt
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_verify_reports_unreadable_files(launcher, tmp_path):
+    good = tmp_path / 'good.bin'
+    good.write_bytes(b'good')
+    bad = tmp_path / 'bad.bin'
+    bad.write_bytes(b'bad')
+    (tmp_path / 'locked').mkdir()  # Открыть на чтение нельзя, как заблокированный файл
+    jobs = [
+        ('good.bin', str(good), sha256(b'good')),
+        ('bad.bin', str(bad), sha256(b'good')),
+        ('missing.bin', str(tmp_path / 'missing.bin'), sha256(b'')),
+        ('locked', str(tmp_path / 'locked'), sha256(b'')),
+    ]
+    engine = launcher.VerifyEngine()
+    reported = []
+    results = engine.verify(jobs, on_result=lambda filename, ok, stats: reported.append((filename, ok)))
+    assert results == {'good.bin': True, 'bad.bin': False, 'missing.bin': False, 'locked': False}
+    assert sorted(reported) == sorted(results.items())
+    assert engine.last_digests['missing.bin'] is None and engine.last_digests['bad.bin'] == sha256(b'bad')
+
+
+def test_verify_blocks_in_same_pass(launcher, tmp_path):
+    data = os.urandom(10 * 1024)
+    path = tmp_path / 'file.bin'
+    path.write_bytes(data)
+    block_size = 4 * 1024
+    engine = launcher.VerifyEngine(buffer_size=3000)
+    results = engine.verify([('file.bin', str(path), sha256(data))], block_sizes={'file.bin': block_size})
+    assert results == {'file.bin': True}
+    assert engine.last_blocks['file.bin'] == [sha256(data[i:i + block_size]) for i in range(0, len(data), block_size)]
+    assert engine.last_blocks['file.bin'] == engine.hash_blocks(str(path), block_size)
+
+
+def cached_file(launcher, tmp_path, data: bytes = b'client data'):
+    """Кэш проверки с одной записью для game/file.bin"""
+    path = tmp_path / 'file.bin'
+    path.write_bytes(data)
+    manifest = {'file.bin': {'size': len(data), 'hash': sha256(data)}, 'other.bin': {'size': 1, 'hash': sha256(b'o')}}
+    cache = launcher.VerifyCache(str(tmp_path), manifest, 'digest-1')
+    cache.store('file.bin', str(path), sha256(data))
+    cache.store('other.bin', str(path), sha256(data))
+    cache.save()
+    return cache, path, manifest
+
+
+def test_verify_cache_survives_reload(launcher, tmp_path):
+    cache, path, manifest = cached_file(launcher, tmp_path)
+    cache = launcher.VerifyCache(str(tmp_path), manifest, 'digest-1')
+    assert cache.is_valid('file.bin', str(path), sha256(b'client data'))
+    assert not cache.is_valid('file.bin', str(path), sha256(b'new version'))
+    assert not cache.is_valid('missing.bin', str(tmp_path / 'missing.bin'), sha256(b''))
+
+
+def test_verify_cache_size_change(launcher, tmp_path):
+    cache, path, _ = cached_file(launcher, tmp_path)
+    stat = os.stat(path)
+    with open(path, 'ab') as f:
+        f.write(b'!')
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert not cache.is_valid('file.bin', str(path), sha256(b'client data'))
+    assert cache.recorded_hash('file.bin', str(path)) is None
+
+
+def test_verify_cache_mtime_change(launcher, tmp_path):
+    cache, path, _ = cached_file(launcher, tmp_path)
+    stat = os.stat(path)
+    path.write_bytes(b'client dat4')  # Тот же размер
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert not cache.is_valid('file.bin', str(path), sha256(b'client data'))
+
+
+def test_verify_cache_inode_change(launcher, tmp_path):
+    cache, path, _ = cached_file(launcher, tmp_path)
+    stat = os.stat(path)
+    replacement = tmp_path / 'replacement.bin'
+    replacement.write_bytes(b'client dat4')
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(replacement, path)  # Файл подменен целиком с теми же размером и временем
+    assert os.stat(path).st_ino != stat.st_ino
+    assert not cache.is_valid('file.bin', str(path), sha256(b'client data'))
+
+
+def test_verify_cache_manifest_change(launcher, tmp_path):
+    _, path, manifest = cached_file(launcher, tmp_path)
+    del manifest['other.bin']
+    manifest['file.bin'] = {'size': 3, 'hash': sha256(b'new')}
+    cache = launcher.VerifyCache(str(tmp_path), manifest, 'digest-2')
+    # Запись измененного файла не подтверждает новый хеш, но помнит прежнюю версию на диске
+    assert not cache.is_valid('file.bin', str(path), sha256(b'new'))
+    assert cache.recorded_hash('file.bin', str(path)) == sha256(b'client data')
+    assert cache.recorded_hash('other.bin', str(path)) is None
+
+
+def test_verify_cache_corrupted_file(launcher, tmp_path):
+    _, path, manifest = cached_file(launcher, tmp_path)
+    (tmp_path / launcher.VerifyCache.FILE_NAME).write_text('{"files": ')
+    cache = launcher.VerifyCache(str(tmp_path), manifest, 'digest-1')
+    assert not cache.is_valid('file.bin', str(path), sha256(b'client data'))
+
+
+def test_verifier_hashes_only_changed_files(launcher, origin, tmp_path, monkeypatch):
+    game_path = tmp_path / 'game'
+    launcher.DownloadManager(origin.url + 'client.json', str(game_path)).run()
+    hashed = []
+    verify = launcher.VerifyEngine.verify
+
+    def record_jobs(engine, jobs, *args, **kwargs):
+        hashed.append(sorted(filename for filename, _, _ in jobs))
+        return verify(engine, jobs, *args, **kwargs)
+
+    monkeypatch.setattr(launcher.VerifyEngine, 'verify', record_jobs)
+    corrupted = []
+    verifier = launcher.FileVerifier(origin.url + 'client.json', str(game_path))
+    verifier.verification_complete.connect(corrupted.extend, Qt.DirectConnection)
+    verifier.run()
+    os.utime(game_path / 'Wow.exe')
+    verifier.run()
+    assert hashed == [[], ['Wow.exe']] and corrupted == []
@@ -1,35 +1,116 @@
+import time
+_startup_time = time.perf_counter()  # Точка отсчета для --startup-profile
 import sys
 import os
 import subprocess
 import platform
 import configparser
-import requests
+import argparse
 import hashlib
 import logging
+import logging.handlers
+import queue
+import atexit
 import json
+import mmap
+import struct
+import random
+import zlib
+import shutil
+import re
 import socket
 import threading
-import time
 from PyQt5.QtWidgets import QApplication, QFileDialog, QSystemTrayIcon, QMenu, QAction
 from PyQt5.QtCore import (
     QThread, pyqtSignal, QObject, pyqtSlot, 
     pyqtProperty, QUrl, QTimer, QMetaObject, 
-    QVariant, Q_ARG, Qt
+    QVariant, Q_ARG, Qt, QCoreApplication
 )
 from PyQt5.QtQml import QQmlApplicationEngine
-from PyQt5.QtGui import QIcon
-from typing import Optional
-
-# Настройка логирования
-logging.basicConfig(
-    filename='launcher.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-)
+from PyQt5.QtGui import QIcon, QImage
+from PyQt5.QtQuick import QQuickImageProvider
+from typing import Optional, TYPE_CHECKING
+from collections import deque, OrderedDict
+from itertools import accumulate
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urlsplit
+
+if TYPE_CHECKING:
+    import requests
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Размер launcher.log, после которого он переименовывается в launcher.log.1
+LOG_BACKUPS = 3
+# Уровни по подсистемам; переопределяются полем logLevels в settings.json
+LOG_LEVELS = {
+    '': 'INFO',
+    'launcher.verify': 'INFO',  # DEBUG - скорость проверки каждого файла
+    'urllib3': 'WARNING',  # DEBUG - строка на каждый HTTP-запрос
+}
+
+
+class EnqueueHandler(logging.handlers.QueueHandler):
+    """Только ставит запись в очередь: форматирование и запись - в потоке QueueListener"""
+
+    def prepare(self, record):
+        return record
+
+
+def apply_log_levels(levels: dict):
+    """Устанавливает уровни логгеров {'имя': 'DEBUG'}; '' - корневой логгер"""
+    for name, level in levels.items():
+        try:
+            logging.getLogger(name or None).setLevel(str(level).upper())
+        except ValueError:
+            logging.getLogger('launcher').warning(f'Неизвестный уровень логирования {level!r} для {name!r}')
+
+
+def setup_logging(path: str = 'launcher.log') -> logging.handlers.QueueListener:
+    """Логирование через очередь.
+
+    Потоки загрузки, проверки и опроса серверов только кладут запись в
+    очередь и не ждут диска. Единственный поток QueueListener форматирует
+    записи и пишет их в launcher.log с ротацией по размеру, поэтому
+    медленный диск или проверка файла антивирусом задерживают только его.
+    """
+    handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8', delay=True
+    )
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    root = logging.getLogger()
+    root.addHandler(EnqueueHandler(log_queue))
+    apply_log_levels(LOG_LEVELS)
+    listener.start()
+    atexit.register(listener.stop)  # Дописывает очередь при выходе
+    return listener
+
+MANIFEST_URL = "http://you.url.com/client.json"
+
+class StartupProfiler:
+    """Длительность фаз запуска для режима --startup-profile"""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.phases = []
+        self._last = started
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self) -> str:
+        lines = [f'{phase:<30}{duration * 1000:9.1f} мс' for phase, duration in self.phases]
+        lines.append(f'{"Всего":<30}{(self._last - self.started) * 1000:9.1f} мс')
+        return '\n'.join(lines)
+
 
 class ConfigManager:
     def __init__(self, config_file: str = 'config.ini') -> None:
-        self.logger = logging.getLogger(__name__)
+        self.logger = logging.getLogger('launcher.config')
         self.config_file = config_file
         self.config = configparser.ConfigParser()
         self.game_path = self.load_game_path()
@@ -59,6 +140,17 @@ class ConfigManager:
             self.logger.error(f"Ошибка при сохранении пути к игре: {str(e)}")
             return False
 
+    def save_current_version(self, version: str, game_path: Optional[str] = None) -> bool:
+        # CurrentVersion относится к установке из GamePath: версию другой
+        # установки (например, из --game-path) сюда не записываем
+        if game_path and (not self.game_path or os.path.normcase(os.path.abspath(game_path))
+                          != os.path.normcase(os.path.abspath(self.game_path))):
+            return False
+        self.current_version = version
+        if self.game_path:
+            return self.save_game_path(self.game_path)
+        return True
+
     def load_current_version(self) -> str:
         try:
             if os.path.exists(self.config_file):
@@ -70,43 +162,2000 @@ class ConfigManager:
             self.logger.error(f"Ошибка при загрузке версии: {str(e)}")
             return "3.3.5"
 
+class CountingPoolMixin:
+    """Считает реальные TCP-подключения пула, включая переподключения после разрыва"""
+    _counter_lock = threading.Lock()
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        if getattr(conn, 'sock', None) is None:
+            with self._counter_lock:
+                self.num_connects = getattr(self, 'num_connects', 0) + 1
+        return conn
+
+
+_requests = None
+_pool_adapter_class = None
+
+
+def requests_module():
+    """Модуль requests.
+
+    requests - самый тяжелый импорт лаунчера и окну он не нужен, поэтому
+    модуль загружается только при первом HTTP-запросе.
+    """
+    global _requests
+    if _requests is None:
+        import requests
+        _requests = requests
+    return _requests
+
+
+def pool_adapter_class():
+    """Адаптер requests, пулы которого считают подключения"""
+    global _pool_adapter_class
+    if _pool_adapter_class is None:
+        from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+        class CountingHTTPConnectionPool(CountingPoolMixin, HTTPConnectionPool):
+            pass
+
+        class CountingHTTPSConnectionPool(CountingPoolMixin, HTTPSConnectionPool):
+            pass
+
+        class PoolAdapter(requests_module().adapters.HTTPAdapter):
+            def init_poolmanager(self, *args, **kwargs):
+                super().init_poolmanager(*args, **kwargs)
+                self.poolmanager.pool_classes_by_scheme = {
+                    'http': CountingHTTPConnectionPool,
+                    'https': CountingHTTPSConnectionPool
+                }
+
+        _pool_adapter_class = PoolAdapter
+    return _pool_adapter_class
+
+
+class HttpPool:
+    """Общий пул keep-alive соединений: одна сессия requests на каждый хост"""
+
+    def __init__(self, pool_size: int = 32, connect_timeout: float = 5, read_timeout: float = 30):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session(self, url: str) -> 'requests.Session':
+        host = urlsplit(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                adapter = pool_adapter_class()(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_size,
+                    pool_block=True  # Ждем свободное соединение вместо открытия лишних
+                )
+                session = requests_module().Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[host] = session
+            return session
+
+    def get(self, url: str, **kwargs) -> 'requests.Response':
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session(url).get(url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> 'requests.Response':
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session(url).head(url, **kwargs)
+
+    def stats(self) -> dict:
+        """Счетчики запросов и открытых соединений по всем хостам"""
+        requests_count = connections = 0
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            pools = session.get_adapter('http://').poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    requests_count += pool.num_requests
+                    connections += getattr(pool, 'num_connects', 0)
+        return {
+            'requests': requests_count,
+            'connections': connections,
+            'reused': max(0, requests_count - connections)
+        }
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+http_pool = HttpPool()
+
+
+class BandwidthLimiter:
+    """Общий для всех загрузок ограничитель скорости (token bucket).
+
+    Потоки загрузки вызывают consume() после получения каждого блока и
+    засыпают на условной переменной, пока не накопится нужное число
+    токенов. Смена лимита будит ожидающих, поэтому применяется сразу.
+    В автоматическом режиме лимит подбирается по задержке до игрового
+    сервера: при росте RTT скорость снижается, при нормальном - растет.
+    """
+
+    def __init__(self, rate: float = 0, burst: float = 0.5):
+        self.rate = rate  # Байт в секунду, 0 - без ограничений
+        self.burst = burst  # Запас токенов в секундах
+        self.logger = logging.getLogger('launcher.download')
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._cond = threading.Condition()
+        self._consumed = 0  # Счетчик байт для оценки скорости в авторежиме
+        self._auto_target = None
+        self._auto_thread = None
+
+    def set_rate(self, rate: float):
+        """Устанавливает фиксированный лимит и выключает авторежим"""
+        self._auto_target = None
+        self._set_rate(rate)
+
+    def _set_rate(self, rate: float, auto: bool = False):
+        with self._cond:
+            if auto and self._auto_target is None:
+                return  # Авторежим уже выключен фиксированным лимитом
+            self._refill()
+            self.rate = rate
+            self._tokens = min(self._tokens, self._capacity())
+            self._cond.notify_all()
+
+    def _capacity(self) -> float:
+        return max(self.rate * self.burst, 64 * 1024)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self._tokens + (now - self._last) * self.rate, self._capacity())
+        self._last = now
+
+    def consume(self, size: int):
+        with self._cond:
+            self._consumed += size
+            if not self.rate:
+                return
+            self._refill()
+            self._tokens -= size
+            while self.rate and self._tokens < 0:
+                self._cond.wait(-self._tokens / self.rate)
+                self._refill()
+
+    def set_auto(self, host: str, port: int, interval: float = 1.0):
+        """Включает авторежим: лимит по задержке TCP-подключения к host:port"""
+        if self._auto_target == (host, port) and self._auto_thread and self._auto_thread.is_alive():
+            return  # Авторежим уже работает - подобранный им лимит сохраняется
+        self._auto_target = (host, port)
+        self._set_rate(0)
+        if self._auto_thread is None or not self._auto_thread.is_alive():
+            self._auto_thread = threading.Thread(target=self._auto_loop, args=(interval,), daemon=True)
+            self._auto_thread.start()
+
+    @staticmethod
+    def measure_rtt(host: str, port: int, timeout: float = 2) -> Optional[float]:
+        started = time.perf_counter()
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return time.perf_counter() - started
+        except OSError:
+            return None
+
+    def _auto_loop(self, interval: float):
+        baseline = None
+        last_consumed = self._consumed
+        while self._auto_target is not None:
+            time.sleep(interval)
+            consumed, last_consumed = self._consumed - last_consumed, self._consumed
+            if not consumed or self._auto_target is None:
+                continue  # Загрузок нет - не нагружаем сервер замерами
+            rtt = self.measure_rtt(*self._auto_target)
+            if rtt is None:
+                continue
+            throughput = consumed / interval
+            baseline = rtt if baseline is None else min(rtt, baseline * 1.01 + 0.0001)
+            if rtt > baseline * 1.5 + 0.02:
+                # Задержка выросла - канал перегружен, снижаем скорость
+                rate = throughput * 0.7
+                self.logger.debug('Авторежим: RTT %.0f мс, лимит %.0f КБ/с', rtt * 1000, rate / 1024)
+                self._set_rate(max(rate, 64 * 1024), auto=True)
+            elif self.rate:
+                rate = self.rate * 1.1
+                # Лимит заметно выше фактической скорости - снимаем ограничение
+                self._set_rate(0 if rate > throughput * 2 else rate, auto=True)
+
+
+bandwidth_limiter = BandwidthLimiter()
+
+
+class Span:
+    """Интервал трассировки; attrs можно дополнять, пока интервал открыт"""
+    __slots__ = ('name', 'id', 'parent', 'thread', 'start', 'started', 'attrs')
+
+    def __init__(self, name: str, span_id: int, parent: Optional[int], attrs: dict):
+        self.name = name
+        self.id = span_id
+        self.parent = parent
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.attrs = attrs
+
+
+class Tracer:
+    """Замеры фаз работы лаунчера: интервалы, счетчики и показатели.
+
+    Завершенный интервал (загрузка манифеста, файл, HTTP-запрос, хеширование
+    и т.д.) записывается строкой JSON в файл трассировки; вложенность
+    отслеживается в пределах потока. Счетчики и показатели копятся в памяти
+    и методом export() сохраняются снимком в текстовом формате Prometheus.
+    Пока файлы не заданы через open(), ничего не записывается.
+    """
+    PREFIX = 'wowlauncher'
+
+    def __init__(self):
+        self.trace_path = None
+        self.metrics_path = None
+        self.logger = logging.getLogger('launcher')
+        self._trace = None
+        self._counters = {}  # {(имя, метки): значение}
+        self._gauges = {}
+        self._spans = {}  # {имя: [количество, сумма секунд, ошибок]}
+        self._next_id = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def open(self, trace_path: Optional[str], metrics_path: Optional[str] = None):
+        """Начинает запись трассировки (файл перезаписывается) и задает файл снимка метрик"""
+        self.metrics_path = metrics_path
+        if trace_path:
+            self.trace_path = trace_path
+            self._trace = open(trace_path, 'w', encoding='utf-8')
+            self._write({
+                'type': 'session', 'time': time.time(), 'pid': os.getpid(),
+                'platform': platform.platform(), 'python': platform.python_version()
+            })
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def start(self, name: str, **attrs) -> Span:
+        stack = self._stack()
+        with self._lock:
+            self._next_id += 1
+            span = Span(name, self._next_id, stack[-1].id if stack else None, attrs)
+        stack.append(span)
+        return span
+
+    def end(self, span: Span, error=None, **attrs):
+        duration = time.perf_counter() - span.started
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+        span.attrs.update(attrs)
+        if error:
+            span.attrs['error'] = str(error)
+        with self._lock:
+            totals = self._spans.setdefault(span.name, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] += 1 if error else 0
+        self._write({
+            'type': 'span', 'name': span.name, 'id': span.id, 'parent': span.parent, 'thread': span.thread,
+            'start': round(span.start, 6), 'duration': round(duration, 6), 'attrs': span.attrs
+        })
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """with tracer.span('имя') as attrs: ... - attrs попадут в запись интервала"""
+        span = self.start(name, **attrs)
+        error = None
+        try:
+            yield span.attrs
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.end(span, error)
+
+    def annotate(self, **attrs):
+        """Дополняет атрибуты текущего интервала потока"""
+        stack = self._stack()
+        if stack:
+            stack[-1].attrs.update(attrs)
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def _write(self, record: dict):
+        if self._trace is None:
+            return
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            try:
+                self._trace.write(line + '\n')
+                self._trace.flush()
+            except (OSError, ValueError) as e:
+                self.logger.warning(f'Запись трассировки остановлена: {e}')
+                self._trace = None
+
+    @staticmethod
+    def _labels(labels) -> str:
+        if not labels:
+            return ''
+        escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+    def prometheus(self) -> str:
+        """Снимок счетчиков, показателей и сумм по интервалам в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            counters, gauges, spans = dict(self._counters), dict(self._gauges), dict(self._spans)
+
+        def family(items, suffix, kind):
+            written = set()
+            for (name, labels), value in sorted(items.items()):
+                metric = f'{self.PREFIX}_{name}{suffix}'
+                if metric not in written:
+                    lines.append(f'# TYPE {metric} {kind}')
+                    written.add(metric)
+                lines.append(f'{metric}{self._labels(labels)} {float(value)!r}')
+
+        family(counters, '_total', 'counter')
+        family(gauges, '', 'gauge')
+        family({('span_seconds', (('span', name),)): totals[1] for name, totals in spans.items()}, '_total', 'counter')
+        family({('spans', (('span', name),)): totals[0] for name, totals in spans.items()}, '_total', 'counter')
+        family({('span_errors', (('span', name),)): totals[2] for name, totals in spans.items()}, '_total', 'counter')
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        """Сохраняет снимок метрик в metrics_path (атомарно, для textfile-коллектора)"""
+        if not self.metrics_path:
+            return
+        temp_path = self.metrics_path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self.prometheus())
+            os.replace(temp_path, self.metrics_path)
+        except OSError as e:
+            self.logger.warning(f'Не удалось сохранить метрики {self.metrics_path}: {e}')
+
+
+tracer = Tracer()
+
+
+class Segment:
+    """Диапазон байт [start, end) файла, загружаемый одним потоком"""
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.position = start  # Следующий байт для записи
+        self.reserved = start  # Байты до этой позиции уже отданы потоку на запись
+        self.end = end  # Может уменьшиться, если часть диапазона заберет другой поток
+        self.mirror = None  # Зеркало, с которого сегмент загружается сейчас
+
+    @property
+    def remaining(self) -> int:
+        return self.end - self.position
+
+
+def merge_ranges(ranges: list) -> list:
+    """Объединяет пересекающиеся и соседние диапазоны [start, end)"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        elif end > start:
+            merged.append([start, end])
+    return merged
+
+
+# Уровни приоритета файлов клиента: загружаются по порядку, играть можно после первого
+TIER_LAUNCH, TIER_GAMEPLAY, TIER_OPTIONAL = 0, 1, 2
+MANIFEST_TIERS = {'launch': TIER_LAUNCH, 'gameplay': TIER_GAMEPLAY, 'optional': TIER_OPTIONAL}
+# Уровни для файлов, у которых в манифесте нет поля tier; остальные файлы - TIER_GAMEPLAY
+DEFAULT_TIERS = [
+    (re.compile(r'/Interface/Cinematics/', re.IGNORECASE), TIER_OPTIONAL),  # Видеоролики
+    # Минимум для запуска: программа и ее библиотеки, адрес сервера, базовые архивы
+    (re.compile(r'^[^/]+\.(exe|dll|manifest)$', re.IGNORECASE), TIER_LAUNCH),
+    (re.compile(r'(^|/)realmlist\.wtf$', re.IGNORECASE), TIER_LAUNCH),
+    (re.compile(r'^Data/common\.MPQ$', re.IGNORECASE), TIER_LAUNCH),
+    (re.compile(r'^Data/([a-z]{2}[A-Z]{2})/(locale|base)-\1\.MPQ$', re.IGNORECASE), TIER_LAUNCH),
+]
+
+
+def manifest_tier(filename: str, file_info: dict) -> int:
+    """Уровень файла: поле tier манифеста ('launch', 'gameplay', 'optional') или правило по пути"""
+    tier = file_info.get('tier')
+    if tier in MANIFEST_TIERS:
+        return MANIFEST_TIERS[tier]
+    for pattern, default in DEFAULT_TIERS:
+        if pattern.search(filename):
+            return default
+    return TIER_GAMEPLAY
+
+
+def manifest_block_sizes(manifest: dict) -> dict:
+    """{файл: размер блока} для файлов манифеста с блочными хешами"""
+    return {filename: file_info['block_size'] for filename, file_info in manifest.items() if file_info.get('blocks')}
+
+
+def block_range(file_info: dict, index: int) -> tuple:
+    """Диапазон байт [start, end) блока index из блочного манифеста файла"""
+    start = index * file_info['block_size']
+    return start, min(start + file_info['block_size'], file_info['size'])
+
+
+class SegmentJournal:
+    """Журнал загруженных диапазонов файла .temp (файл .temp.journal).
+
+    Каждая строка - JSON [start, end, crc32] одного записанного диапазона.
+    Строка дописывается только после fsync данных, поэтому журнал не
+    опережает файл даже при отключении питания. При возобновлении
+    оборванная последняя строка и диапазоны с неверной CRC32
+    отбрасываются, а журнал переписывается в сжатом виде.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def load(self, temp_path: str, file_size: int) -> list:
+        """Возвращает проверенные записи [start, end, crc32] диапазонов из temp_path"""
+        records = []
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        start, end, crc = json.loads(line)
+                    except ValueError:
+                        break  # Запись оборвалась при сбое
+                    if 0 <= start < end <= file_size:
+                        records.append((start, end, crc))
+        except OSError:
+            return []
+
+        verified = []
+        with open(temp_path, 'rb') as f:
+            for start, end, crc in records:
+                f.seek(start)
+                if zlib.crc32(f.read(end - start)) == crc:
+                    verified.append([start, end, crc])
+        return verified
+
+    def open(self, records: list):
+        """Переписывает журнал проверенными записями и открывает его для дозаписи"""
+        with open(self.path + '.new', 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + '.new', self.path)
+        self._file = open(self.path, 'a')
+
+    def record(self, data_file, start: int, end: int, crc: int):
+        """Фиксирует диапазон после сброса его данных на диск"""
+        data_file.flush()
+        os.fsync(data_file.fileno())
+        with self._lock:
+            self._file.write(json.dumps([start, end, crc]) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self, remove: bool = False):
+        if self._file:
+            self._file.close()
+            self._file = None
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Mirror:
+    """Зеркало загрузки и его измеренные характеристики"""
+
+    def __init__(self, url: str):
+        self.url = url if url.endswith('/') else url + '/'
+        self.rtt = None  # Секунды до ответа на пробный запрос
+        self.speed = 0.0  # Байт в секунду на одно соединение (скользящее среднее)
+        self.active = 0  # Запросов в работе
+        self.failures = 0  # Ошибок подряд
+        self.demoted_until = 0.0  # До этого момента зеркало используется только без альтернатив
+
+
+class MirrorSet:
+    """Зеркала, между которыми распределяются сегменты загрузки.
+
+    Скорость зеркал оценивается пробным запросом при старте и затем по
+    фактической скорости сегментов. Новый запрос уходит на зеркало с
+    наибольшей скоростью в расчете на активное соединение. Зеркало,
+    которое выдает ошибки или заметно медленнее лучшего, временно
+    понижается, и его сегменты переходят к остальным.
+    """
+
+    def __init__(self, urls: list, smoothing: float = 0.3, slow_ratio: float = 0.25, demote_time: float = 30.0):
+        unique = []
+        for url in urls:
+            if url and url not in unique:
+                unique.append(url)
+        self.mirrors = [Mirror(url) for url in unique]
+        self.smoothing = smoothing
+        self.slow_ratio = slow_ratio  # Доля скорости лучшего зеркала, ниже которой зеркало понижается
+        self.demote_time = demote_time
+        self.logger = logging.getLogger('launcher.download')
+        self._lock = threading.Lock()
+
+    def probe(self, path: str, size: int = 256 * 1024):
+        """Измеряет задержку и скорость всех зеркал на начале файла path"""
+        if len(self.mirrors) < 2:
+            return
+
+        def measure(mirror: Mirror):
+            started = time.monotonic()
+            try:
+                with http_pool.get(mirror.url + path, headers={'Range': f'bytes=0-{size - 1}'}, stream=True) as response:
+                    response.raise_for_status()
+                    mirror.rtt = time.monotonic() - started
+                    received = 0
+                    for chunk in response.iter_content(chunk_size=65536):
+                        received += len(chunk)
+                        if received >= size:
+                            break
+                self.report(mirror, received, time.monotonic() - started)
+            except Exception as e:
+                self.fail(mirror)
+                self.logger.warning(f'Зеркало {mirror.url} недоступно: {e}')
+
+        with ThreadPoolExecutor(max_workers=len(self.mirrors)) as executor:
+            list(executor.map(measure, self.mirrors))
+        for mirror in self.mirrors:
+            if mirror.rtt is not None:
+                self.logger.info(
+                    f'Зеркало {mirror.url}: задержка {mirror.rtt * 1000:.0f} мс, скорость {format_speed(mirror.speed)}'
+                )
+
+    def acquire(self) -> Mirror:
+        """Выбирает зеркало для следующего запроса"""
+        now = time.monotonic()
+        with self._lock:
+            usable = [mirror for mirror in self.mirrors if mirror.demoted_until <= now] or self.mirrors
+            # Неизмеренные зеркала считаются не хуже лучшего, чтобы их скорость тоже была оценена
+            best = max(mirror.speed for mirror in usable)
+            mirror = max(usable, key=lambda m: ((m.speed or best) / (m.active + 1), -m.active))
+            mirror.active += 1
+            return mirror
+
+    def release(self, mirror: Mirror):
+        with self._lock:
+            mirror.active -= 1
+
+    def best(self) -> Mirror:
+        now = time.monotonic()
+        with self._lock:
+            usable = [mirror for mirror in self.mirrors if mirror.demoted_until <= now] or self.mirrors
+            return max(usable, key=lambda m: m.speed)
+
+    def report(self, mirror: Mirror, size: int, elapsed: float):
+        """Учитывает скорость, с которой зеркало отдало size байт"""
+        if size <= 0 or elapsed <= 0:
+            return
+        speed = size / elapsed
+        with self._lock:
+            mirror.speed = speed if not mirror.speed else mirror.speed + self.smoothing * (speed - mirror.speed)
+            mirror.failures = 0
+
+    def fail(self, mirror: Mirror):
+        """Понижает зеркало после ошибки, с каждой ошибкой подряд - на больший срок"""
+        with self._lock:
+            mirror.failures += 1
+            mirror.demoted_until = time.monotonic() + min(self.demote_time, 2 ** mirror.failures)
+
+    def is_slow(self, mirror: Mirror) -> bool:
+        """Проверяет, не отстает ли зеркало от лучшего; отстающее понижается"""
+        now = time.monotonic()
+        with self._lock:
+            others = [m.speed for m in self.mirrors if m is not mirror and m.speed and m.demoted_until <= now]
+            if not others or not mirror.speed or mirror.speed >= max(others) * self.slow_ratio:
+                return False
+            mirror.demoted_until = now + self.demote_time
+            return True
+
+    def steal_share(self, mirror: Optional[Mirror]) -> float:
+        """Доля остатка сегмента, которую стоит забрать у потока на зеркале mirror"""
+        best = max(m.speed for m in self.mirrors)
+        if mirror is None or not mirror.speed or not best:
+            return 0.5
+        return min(0.9, max(0.5, best / (best + mirror.speed)))
+
+    def remaining_time(self, segment: 'Segment') -> float:
+        """Оценка времени до конца сегмента с учетом скорости его зеркала"""
+        speed = (segment.mirror.speed if segment.mirror else 0) or max(m.speed for m in self.mirrors) or 1
+        return segment.remaining / speed
+
+
+class StreamHasher:
+    """SHA-256 файла, вычисляемый по мере поступления данных.
+
+    Данные, пришедшие по порядку, хешируются сразу из памяти. Диапазоны,
+    записанные на диск впереди курсора (параллельные сегменты), дочитываются
+    из файла, когда курсор до них доходит, - обычно это кэш ОС. Состояние
+    hashlib нельзя сохранить между запусками, поэтому при возобновлении
+    уже загруженное начало файла хешируется один раз при создании.
+    """
+
+    def __init__(self, path: str, completed: list = None, block_size: int = 1024 * 1024, start: int = 0):
+        self.path = path
+        self.start = start
+        self.position = start  # Все байты от start до этой позиции уже учтены в хеше
+        self.block_size = block_size
+        self._hash = hashlib.sha256()
+        self._pending = merge_ranges(completed or [])
+        self._busy = True  # Курсор двигает только один поток
+        self._lock = threading.Lock()
+        self._advance(0)
+
+    def update(self, offset: int, data: bytes):
+        """Учитывает блок, уже записанный в файл по смещению offset"""
+        with self._lock:
+            if self._busy or offset != self.position:
+                self._pending = merge_ranges(self._pending + [[offset, offset + len(data)]])
+                return
+            self._busy = True
+        self._hash.update(data)
+        self._advance(len(data))
+
+    def _advance(self, size: int):
+        """Сдвигает курсор и дохеширует с диска диапазоны, оказавшиеся за ним"""
+        while True:
+            with self._lock:
+                self.position += size
+                size = 0
+                if not self._pending or self._pending[0][0] > self.position:
+                    self._busy = False
+                    return
+                start, end = self._pending.pop(0)
+                start = self.position
+            if end > start:
+                size = self._hash_file_range(start, end)
+
+    def _hash_file_range(self, start: int, end: int) -> int:
+        buffer = bytearray(self.block_size)
+        view = memoryview(buffer)
+        position = start
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            while position < end:
+                read = f.readinto(view[:min(self.block_size, end - position)])
+                if not read:
+                    raise IOError(f'Неожиданный конец файла {self.path} на позиции {position}')
+                self._hash.update(view[:read])
+                position += read
+        return position - start
+
+    @property
+    def covered(self) -> int:
+        """Сколько байт от start уже записано в файл (учтено в хеше или ждет его)"""
+        with self._lock:
+            return self.position - self.start + sum(end - start for start, end in self._pending)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+class DeltaPatch:
+    """Бинарный патч между версиями файла.
+
+    Формат: заголовок MAGIC и последовательность команд
+      b'C' + uint64 offset + uint64 length  - скопировать байты из старого файла
+      b'I' + uint64 length + данные         - вставить новые байты
+      b'E'                                  - конец патча
+    Патч применяется потоково: команды читаются прямо из ответа сервера,
+    результат пишется последовательно в новый файл.
+    """
+    MAGIC = b'WLDELTA1'
+    COPY = b'C'
+    INSERT = b'I'
+    END = b'E'
+    HEADER = struct.Struct('<QQ')
+    LENGTH = struct.Struct('<Q')
+
+    def __init__(self, stream, chunk_size: int = 1024 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.patch_hash = hashlib.sha256()
+        self.read_size = 0
+
+    def _read(self, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = self.stream.read(size - len(data))
+            if not chunk:
+                raise IOError('Патч оборван')
+            bandwidth_limiter.consume(len(chunk))
+            data += chunk
+        self.patch_hash.update(data)
+        self.read_size += len(data)
+        return data
+
+    def apply(self, old_path: str, write, is_running=lambda: True) -> bool:
+        """Применяет патч, передавая новые данные в write(data). False при отмене"""
+        if self._read(len(self.MAGIC)) != self.MAGIC:
+            raise ValueError('Неизвестный формат патча')
+        with open(old_path, 'rb') as old:
+            while is_running():
+                command = self._read(1)
+                if command == self.END:
+                    return True
+                if command == self.COPY:
+                    offset, length = self.HEADER.unpack(self._read(self.HEADER.size))
+                    old.seek(offset)
+                    while length:
+                        data = old.read(min(length, self.chunk_size))
+                        if not data:
+                            raise IOError('Патч ссылается за пределы старого файла')
+                        write(data)
+                        length -= len(data)
+                elif command == self.INSERT:
+                    (length,) = self.LENGTH.unpack(self._read(self.LENGTH.size))
+                    while length:
+                        data = self._read(min(length, self.chunk_size))
+                        write(data)
+                        length -= len(data)
+                else:
+                    raise ValueError(f'Неизвестная команда патча {command!r}')
+        return False
+
+    @classmethod
+    def create(cls, old_path: str, new_path: str, patch_path: str, block_size: int = 4096):
+        """Создает патч old -> new для публикации на сервере.
+
+        Как в rsync: выровненные блоки старого файла индексируются по
+        скользящей контрольной сумме, новый файл просматривается окном
+        block_size со сдвигом на один байт. Найденное совпадение
+        расширяется в обе стороны до первого отличающегося байта, поэтому
+        правка, вставка, удаление или перенос данных дают патч размером с
+        измененные байты. Побайтово просматриваются только несовпавшие
+        участки.
+        """
+        with open(old_path, 'rb') as old_file, open(new_path, 'rb') as new_file, open(patch_path, 'wb') as out:
+            old = mmap.mmap(old_file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(old_path) else b''
+            new = mmap.mmap(new_file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(new_path) else b''
+            index = {}
+            for offset in range(0, len(old) - block_size + 1, block_size):
+                block = old[offset:offset + block_size]
+                weak = (sum(block) & 0xffff) | (sum(accumulate(block)) & 0xffff) << 16
+                index.setdefault(weak, []).append(offset)
+
+            def search(start):
+                """Первое окно нового файла от start, совпадающее с блоком старого"""
+                if not index or len(new) - start < block_size:
+                    return None
+                window = new[start:start + block_size]
+                a, b = sum(window) & 0xffff, sum(accumulate(window)) & 0xffff
+                last = len(new) - block_size
+                for position in range(start, last + 1):
+                    for old_position in index.get(a | b << 16, ()):
+                        if old[old_position:old_position + block_size] == new[position:position + block_size]:
+                            return position, old_position
+                    if position < last:
+                        removed = new[position]
+                        a = (a - removed + new[position + block_size]) & 0xffff
+                        b = (b - block_size * removed + a) & 0xffff
+                return None
+
+            def match_length(old_position, position):
+                """Длина общего участка old[old_position:] и new[position:]"""
+                length = 0
+                limit = min(len(old) - old_position, len(new) - position)
+                step = 1024 * 1024
+                while step:
+                    while (length + step <= limit and old[old_position + length:old_position + length + step]
+                           == new[position + length:position + length + step]):
+                        length += step
+                    step //= 16
+                return length
+
+            def insert(start, end):
+                for chunk in range(start, end, block_size * 256):
+                    data = new[chunk:min(end, chunk + block_size * 256)]
+                    out.write(cls.INSERT + cls.LENGTH.pack(len(data)) + data)
+
+            out.write(cls.MAGIC)
+            # Начало незаписанной вставки в новом файле. Общие начало и конец
+            # файлов короче блока окном не находятся и копируются отдельно
+            literal = match_length(0, 0)
+            if literal:
+                out.write(cls.COPY + cls.HEADER.pack(0, literal))
+            found = search(literal)
+            while found:
+                position, old_position = found
+                while position > literal and old_position > 0 and new[position - 1] == old[old_position - 1]:
+                    position -= 1
+                    old_position -= 1
+                insert(literal, position)
+                length = match_length(old_position, position)
+                out.write(cls.COPY + cls.HEADER.pack(old_position, length))
+                literal = position + length
+                found = search(literal)
+            tail = 0
+            while tail < min(len(new) - literal, len(old)) and new[-tail - 1] == old[-tail - 1]:
+                tail += 1
+            insert(literal, len(new) - tail)
+            if tail:
+                out.write(cls.COPY + cls.HEADER.pack(len(old) - tail, tail))
+            out.write(cls.END)
+            for view in (old, new):
+                if isinstance(view, mmap.mmap):
+                    view.close()
+
+
+class ManifestSnapshot:
+    """Полученный манифест: данные, хеш и отличия от последней синхронизированной версии"""
+
+    def __init__(self, data: dict, digest: str, diff: Optional[dict] = None, from_cache: bool = False,
+                 previous: Optional[dict] = None):
+        self.data = data
+        self.files = data['files']
+        self.version = data.get('version')
+        self.mirrors = data.get('mirrors', [])  # Базовые адреса зеркал для загрузки файлов
+        self.digest = digest
+        self.diff = diff  # {'added': [...], 'removed': [...], 'changed': [...]} или None
+        self.previous = previous  # Файлы последнего синхронизированного манифеста
+        self.from_cache = from_cache  # Сервер ответил 304 Not Modified
+
+
+class ManifestStore:
+    """Локальная копия манифеста с условной загрузкой.
+
+    Последний полученный манифест хранится в папке игры вместе с ETag и
+    Last-Modified, запрос повторяется с If-None-Match/If-Modified-Since, и
+    при ответе 304 используется сохраненная копия. Отдельно хранятся размеры
+    и хеши файлов манифеста, с которым клиент был синхронизирован в последний
+    раз, - от них считаются отличия нового манифеста. Если это и есть
+    сохраненный манифест, запоминается только его хеш.
+    """
+    FILE_NAME = '.launcher_manifest.json'
+
+    def __init__(self, game_path: str, manifest_url: str):
+        self.path = os.path.join(game_path, self.FILE_NAME)
+        self.manifest_url = manifest_url
+        self.logger = logging.getLogger('launcher.download')
+        self._state = {}
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    state = json.load(f)
+                if state.get('url') == manifest_url:
+                    self._state = state
+        except (OSError, ValueError) as e:
+            self.logger.warning(f'Сохраненный манифест {self.path} поврежден: {e}')
+
+    @staticmethod
+    def synced_files(state: dict) -> dict:
+        """Файлы последнего синхронизированного манифеста из содержимого FILE_NAME"""
+        synced = state.get('synced') or {}
+        if 'files' in synced:
+            return synced['files']
+        if synced and synced.get('digest') == state.get('digest'):
+            return (state.get('manifest') or {}).get('files', {})
+        return {}
+
+    @staticmethod
+    def _file_hashes(files: dict) -> dict:
+        return {filename: {'size': info['size'], 'hash': info['hash']} for filename, info in files.items()}
+
+    @staticmethod
+    def diff(old_files: dict, new_files: dict) -> dict:
+        """Добавленные, удаленные и измененные записи манифеста"""
+        return {
+            'added': sorted(set(new_files) - set(old_files)),
+            'removed': sorted(set(old_files) - set(new_files)),
+            'changed': sorted(
+                filename for filename in set(old_files) & set(new_files)
+                if old_files[filename]['size'] != new_files[filename]['size']
+                or old_files[filename]['hash'] != new_files[filename]['hash']
+            )
+        }
+
+    def fetch(self) -> ManifestSnapshot:
+        headers = {}
+        if self._state.get('manifest'):
+            if self._state.get('etag'):
+                headers['If-None-Match'] = self._state['etag']
+            if self._state.get('last_modified'):
+                headers['If-Modified-Since'] = self._state['last_modified']
+
+        response = http_pool.get(self.manifest_url, headers=headers)
+        from_cache = response.status_code == 304
+        if from_cache:
+            self.logger.info('Манифест не изменился, используется сохраненная копия')
+            data = self._state['manifest']
+            digest = self._state['digest']
+        else:
+            response.raise_for_status()
+            data = response.json()
+            digest = hashlib.sha256(response.content).hexdigest()
+            synced = self._state.get('synced')
+            if synced and 'files' not in synced and synced.get('digest') != digest:
+                # Синхронизированный манифест сейчас будет заменен - сохраняем его хеши отдельно
+                synced['files'] = self._file_hashes(self.synced_files(self._state))
+            self._state.update({
+                'url': self.manifest_url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'manifest': data,
+                'digest': digest
+            })
+            self._save()
+
+        diff = previous = None
+        if self._state.get('synced'):
+            previous = self.synced_files(self._state)
+            diff = self.diff(previous, data['files'])
+            if any(diff.values()):
+                self.logger.info(
+                    f"Изменения манифеста: добавлено {len(diff['added'])}, "
+                    f"удалено {len(diff['removed'])}, изменено {len(diff['changed'])}"
+                )
+        return ManifestSnapshot(data, digest, diff, from_cache, previous)
+
+    def mark_synced(self, snapshot: ManifestSnapshot):
+        """Запоминает манифест, которому клиент полностью соответствует"""
+        self._state['synced'] = {'digest': snapshot.digest}
+        if snapshot.digest != self._state.get('digest'):
+            self._state['synced']['files'] = self._file_hashes(snapshot.files)
+        self._save()
+
+    def _save(self):
+        temp_path = self.path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)  # Манифест получен до первой загрузки
+            with open(temp_path, 'w') as f:
+                json.dump(self._state, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f'Не удалось сохранить манифест {self.path}: {e}')
+
+
+class VerifyCache:
+    """Кэш проверенных файлов в папке игры.
+
+    Для каждого файла манифеста хранит (size, mtime_ns, inode, hash) на момент
+    последней проверки. Пока эти атрибуты не изменились, файл не хешируется
+    повторно. При смене манифеста сбрасываются записи удаленных из него
+    файлов. Записи измененных остаются со старым хешем: is_valid их не
+    принимает, а recorded_hash подтверждает, что на диске прежняя версия.
+    """
+    FILE_NAME = '.launcher_verify.json'
+
+    def __init__(self, game_path: str, manifest: dict, manifest_digest: str):
+        self.path = os.path.join(game_path, self.FILE_NAME)
+        self.manifest_digest = manifest_digest
+        self.logger = logging.getLogger('launcher.verify')
+        self._lock = threading.Lock()
+        self._entries = {}
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                self._entries = data.get('files', {})
+                if data.get('manifest') != manifest_digest:
+                    self._entries = {
+                        filename: entry for filename, entry in self._entries.items() if filename in manifest
+                    }
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f'Кэш проверки {self.path} поврежден и будет пересоздан: {e}')
+            self._entries = {}
+
+    @staticmethod
+    def _signature(local_path: str) -> dict:
+        stat = os.stat(local_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+
+    def is_valid(self, filename: str, local_path: str, expected_hash: str) -> bool:
+        """True, если файл не менялся с момента проверки и хеш совпадал с ожидаемым"""
+        with self._lock:
+            entry = self._entries.get(filename)
+        if entry is None or entry['hash'] != expected_hash:
+            return False
+        try:
+            signature = self._signature(local_path)
+        except OSError:
+            return False
+        return all(entry[key] == value for key, value in signature.items())
+
+    def recorded_hash(self, filename: str, local_path: str) -> Optional[str]:
+        """Хеш файла на момент последней проверки, если файл с тех пор не менялся"""
+        with self._lock:
+            entry = self._entries.get(filename)
+        if entry is None:
+            return None
+        try:
+            signature = self._signature(local_path)
+        except OSError:
+            return None
+        return entry['hash'] if all(entry[key] == value for key, value in signature.items()) else None
+
+    def store(self, filename: str, local_path: str, file_hash: str):
+        try:
+            entry = self._signature(local_path)
+        except OSError:
+            return
+        entry['hash'] = file_hash
+        with self._lock:
+            self._entries[filename] = entry
+
+    def discard(self, filename: str):
+        with self._lock:
+            self._entries.pop(filename, None)
+
+    def save(self):
+        with self._lock:
+            data = {'manifest': self.manifest_digest, 'files': dict(self._entries)}
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f'Не удалось сохранить кэш проверки {self.path}: {e}')
+
+
+FICLONE = 0x40049409  # ioctl клонирования файла (reflink) в Linux
+
+
+def clone_file(source: str, destination: str):
+    """Копирует файл, по возможности без копирования данных (reflink на btrfs/XFS)"""
+    if sys.platform.startswith('linux'):
+        import fcntl
+        try:
+            with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return
+        except OSError:
+            pass  # Файловая система не поддерживает reflink
+    shutil.copyfile(source, destination)
+
+
+class ObjectStore:
+    """Общее хранилище файлов клиента, адресуемое хешем из манифеста.
+
+    Объект хранится один раз в objects/<2 символа хеша>/<хеш>, а в папки
+    клиентов попадает жесткой ссылкой (или reflink-копией, если папки на
+    разных дисках). Папки клиентов, использующих хранилище, записаны в
+    installs.json - по их манифестам gc() определяет, какие объекты еще
+    нужны.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.installs_path = os.path.join(root, 'installs.json')
+        self.logger = logging.getLogger('launcher.store')
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def path(self, file_hash: str) -> str:
+        return os.path.join(self.objects_dir, file_hash[:2], file_hash)
+
+    def has(self, file_hash: str, size: int) -> bool:
+        """Объект нужного размера есть в хранилище; содержимое проверяется перед использованием"""
+        try:
+            return os.path.getsize(self.path(file_hash)) == size
+        except OSError:
+            return False
+
+    def contains(self, file_hash: str, local_path: str) -> bool:
+        """local_path - ссылка на объект хранилища, а не отдельная копия"""
+        try:
+            return os.path.samefile(self.path(file_hash), local_path)
+        except OSError:
+            return False
+
+    def add(self, file_hash: str, local_path: str):
+        """Помещает проверенный файл в хранилище, связывая его с объектом"""
+        object_path = self.path(file_hash)
+        if os.path.exists(object_path):
+            return
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        temp_path = f'{object_path}.{threading.get_ident()}.tmp'
+        try:
+            os.link(local_path, temp_path)
+        except OSError:
+            clone_file(local_path, temp_path)  # Хранилище на другом диске
+        os.replace(temp_path, object_path)
+
+    def materialize(self, file_hash: str, local_path: str):
+        """Создает файл клиента из объекта хранилища"""
+        temp_path = local_path + '.store.tmp'
+        try:
+            os.link(self.path(file_hash), temp_path)
+        except OSError:
+            clone_file(self.path(file_hash), temp_path)
+        os.replace(temp_path, local_path)
+
+    def discard(self, file_hash: str):
+        """Удаляет поврежденный объект, чтобы он больше не раздавался"""
+        try:
+            os.remove(self.path(file_hash))
+        except OSError:
+            pass
+
+    def register(self, game_path: str):
+        """Запоминает папку клиента, чьи файлы ссылаются на хранилище"""
+        game_path = os.path.abspath(game_path)
+        with self._lock:
+            installs = self._load_installs()
+            if game_path not in installs:
+                installs.append(game_path)
+                self._save_installs(installs)
+
+    def _load_installs(self) -> list:
+        try:
+            with open(self.installs_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _save_installs(self, installs: list):
+        temp_path = self.installs_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(installs, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.installs_path)
+
+    def gc(self) -> dict:
+        """Удаляет объекты, на которые не ссылается ни одна папка клиента.
+
+        Объект нужен, если его хеш есть в манифесте одной из папок или на
+        него есть жесткая ссылка. Папки, которых больше нет, забываются.
+        """
+        with self._lock:
+            installs = [path for path in self._load_installs() if os.path.isdir(path)]
+            self._save_installs(installs)
+        referenced = set()
+        for game_path in installs:
+            try:
+                with open(os.path.join(game_path, ManifestStore.FILE_NAME), 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            # Текущий манифест и тот, с которым папка синхронизирована последний раз
+            for files in ((state.get('manifest') or {}).get('files', {}), ManifestStore.synced_files(state)):
+                referenced.update(info['hash'] for info in files.values())
+
+        removed = freed = kept = 0
+        for entry in os.scandir(self.objects_dir):
+            if not entry.is_dir():
+                continue
+            for obj in os.scandir(entry.path):
+                stat = obj.stat()
+                if obj.name in referenced or stat.st_nlink > 1:
+                    kept += 1
+                    continue
+                try:
+                    os.remove(obj.path)
+                    removed += 1
+                    freed += stat.st_size
+                except OSError as e:
+                    self.logger.warning(f'Не удалось удалить {obj.path}: {e}')
+        self.logger.info(f'Хранилище: удалено объектов {removed}, освобождено {freed / (1024 * 1024):.0f} МБ')
+        return {'removed': removed, 'freed': freed, 'kept': kept, 'installs': len(installs)}
+
+
+_peer_handler_class = None
+
+
+def peer_handler_class():
+    """Обработчик HTTP-запросов соседей; http.server загружается при включении обмена"""
+    global _peer_handler_class
+    if _peer_handler_class is None:
+        from http.server import BaseHTTPRequestHandler
+
+        class PeerRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive для последовательных сегментов
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self.do_GET(send_body=False)
+
+            def do_GET(self, send_body=True):
+                parts = self.path.split('/')
+                path = None
+                if len(parts) == 3 and parts[1] == 'objects' and PeerCache.HASH_PATTERN.fullmatch(parts[2]):
+                    path = self.server.peer_cache.lookup(parts[2])
+                if path is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                with open(path, 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    start, end = 0, size
+                    match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                    if match:
+                        start = int(match.group(1))
+                        end = min(size, int(match.group(2)) + 1) if match.group(2) else size
+                        if start >= end:
+                            self.send_response(416)
+                            self.send_header('Content-Range', f'bytes */{size}')
+                            self.send_header('Content-Length', '0')
+                            self.end_headers()
+                            return
+                        self.send_response(206)
+                        self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+                    else:
+                        self.send_response(200)
+                    self.send_header('Content-Length', str(end - start))
+                    self.send_header('Accept-Ranges', 'bytes')
+                    self.end_headers()
+                    if not send_body:
+                        return
+                    f.seek(start)
+                    left = end - start
+                    try:
+                        while left:
+                            data = f.read(min(left, 256 * 1024))
+                            if not data:
+                                break
+                            self.wfile.write(data)
+                            left -= len(data)
+                    except ConnectionError:
+                        self.close_connection = True  # Сосед прервал сегмент и взял его у другого источника
+
+        _peer_handler_class = PeerRequestHandler
+    return _peer_handler_class
+
+
+_peer_server_class = None
+
+
+def peer_server_class():
+    """HTTP-сервер раздачи; обрывы соединений соседями пишутся в журнал, а не в stderr"""
+    global _peer_server_class
+    if _peer_server_class is None:
+        from http.server import ThreadingHTTPServer
+
+        class PeerServer(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                logger = logging.getLogger('launcher.peers')
+                error = sys.exc_info()[1]
+                if isinstance(error, ConnectionError):
+                    # Сосед закрыл соединение (отменил сегмент или завершился) - это штатно
+                    logger.debug(f'Сосед {client_address[0]} разорвал соединение: {error}')
+                else:
+                    logger.exception(f'Ошибка обработки запроса соседа {client_address[0]}')
+
+        _peer_server_class = PeerServer
+    return _peer_server_class
+
+
+class PeerCache:
+    """Обмен файлами клиента с другими лаунчерами в локальной сети.
+
+    Проверенные файлы папки игры (и общего хранилища) раздаются по HTTP с
+    поддержкой Range по адресу /objects/<хеш>. Отдаются только файлы, чьи
+    размер, время изменения и inode совпадают с записью кэша проверки.
+    Лаунчеры находят друг друга по объявлениям в multicast-группе; адреса
+    из настроек опрашиваются всегда. Полученные от соседей данные
+    проверяются по хешу манифеста так же, как данные с сервера.
+    """
+    GROUP = '239.255.37.20'
+    PORT = 37020
+    HASH_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+    def __init__(self, game_path: str, peers: list = None, object_store: 'ObjectStore' = None,
+                 http_port: int = 0, announce_interval: float = 5.0, discovery: bool = True):
+        self.game_path = game_path
+        self.object_store = object_store
+        self.static_peers = [peer if '://' in peer else f'http://{peer}/' for peer in (peers or [])]
+        self.static_peers = [peer if peer.endswith('/') else peer + '/' for peer in self.static_peers]
+        self.http_port = http_port
+        self.announce_interval = announce_interval
+        self.discovery = discovery
+        self.peer_id = os.urandom(8).hex()
+        self.logger = logging.getLogger('launcher.peers')
+        self._peers = {}  # {id: [адрес, время последнего объявления]}
+        self._index = {}  # {хеш: файл клиента}
+        self._index_mtime = None
+        self._lock = threading.Lock()
+        self._server = None
+        self._socket = None
+        self._running = False
+
+    def start(self):
+        self._server = peer_server_class()(('', self.http_port), peer_handler_class())
+        self._server.peer_cache = self
+        self.http_port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self._running = True
+        if self.discovery:
+            try:
+                self._socket = self._open_socket()
+                threading.Thread(target=self._discovery_loop, daemon=True).start()
+            except OSError as e:
+                self.logger.warning(f'Поиск лаунчеров в локальной сети недоступен: {e}')
+        self.logger.info(f'Раздача файлов в локальной сети на порту {self.http_port}')
+
+    def stop(self):
+        self._running = False
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+    def _open_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)  # Несколько лаунчеров на одной машине
+        sock.bind(('', self.PORT))
+        membership = struct.pack('4s4s', socket.inet_aton(self.GROUP), socket.inet_aton('0.0.0.0'))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)  # Не дальше локальной сети
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        sock.settimeout(1.0)
+        return sock
+
+    def _discovery_loop(self):
+        announcement = json.dumps({'service': 'wow-launcher', 'id': self.peer_id, 'port': self.http_port}).encode()
+        next_announce = 0.0
+        while self._running and self._socket:
+            now = time.monotonic()
+            try:
+                if now >= next_announce:
+                    self._socket.sendto(announcement, (self.GROUP, self.PORT))
+                    next_announce = now + self.announce_interval
+                data, address = self._socket.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                if not self._running:
+                    return
+                time.sleep(self.announce_interval)  # Сеть недоступна - пробуем позже
+                continue
+            try:
+                message = json.loads(data)
+                if message.get('service') != 'wow-launcher' or message.get('id') == self.peer_id:
+                    continue
+                url = f"http://{address[0]}:{int(message['port'])}/"
+            except (ValueError, KeyError, TypeError):
+                continue
+            with self._lock:
+                if message['id'] not in self._peers:
+                    self.logger.info(f'Найден лаунчер в локальной сети: {url}')
+                    next_announce = 0.0  # Новый лаунчер узнает о нас сразу, не дожидаясь интервала
+                self._peers[message['id']] = [url, time.monotonic()]
+
+    def peers(self) -> list:
+        """Адреса соседей: из настроек и объявившиеся недавно"""
+        expired = time.monotonic() - self.announce_interval * 3
+        with self._lock:
+            for peer_id in [peer_id for peer_id, (_, seen) in self._peers.items() if seen < expired]:
+                del self._peers[peer_id]
+            found = [url for url, _ in self._peers.values()]
+        return self.static_peers + [url for url in found if url not in self.static_peers]
+
+    def sources(self, file_hash: str, size: int, timeout: float = 1.0) -> list:
+        """Базовые адреса соседей, у которых есть файл с этим хешем"""
+        peers = self.peers()
+        if not peers:
+            return []
+
+        def has_file(url: str) -> bool:
+            try:
+                response = http_pool.head(f'{url}objects/{file_hash}', timeout=timeout)
+                return response.status_code == 200 and int(response.headers.get('Content-Length', -1)) == size
+            except Exception:
+                return False
+
+        with ThreadPoolExecutor(max_workers=len(peers)) as executor:
+            found = list(executor.map(has_file, peers))
+        return [f'{url}objects/' for url, ok in zip(peers, found) if ok]
+
+    def lookup(self, file_hash: str) -> Optional[str]:
+        """Путь к проверенному файлу с этим хешем или None"""
+        if self.object_store and os.path.exists(self.object_store.path(file_hash)):
+            return self.object_store.path(file_hash)
+        self._load_index()
+        with self._lock:
+            filename, entry = self._index.get(file_hash, (None, None))
+        if filename is None:
+            return None
+        local_path = os.path.join(self.game_path, filename)
+        try:
+            signature = VerifyCache._signature(local_path)
+        except OSError:
+            return None
+        # Файл изменился после проверки - не раздаем
+        if any(entry[key] != value for key, value in signature.items()):
+            return None
+        return local_path
+
+    def _load_index(self):
+        """Перечитывает кэш проверки, если лаунчер его обновил"""
+        path = os.path.join(self.game_path, VerifyCache.FILE_NAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if mtime == self._index_mtime:
+                return
+            with open(path, 'r') as f:
+                entries = json.load(f).get('files', {})
+            index = {entry['hash']: (filename, entry) for filename, entry in entries.items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            mtime, index = None, {}
+        with self._lock:
+            self._index, self._index_mtime = index, mtime
+
+
+class VerifyEngine:
+    """Параллельное хеширование файлов на пуле потоков.
+
+    hashlib отпускает GIL на больших блоках, поэтому несколько файлов
+    хешируются одновременно на разных ядрах. Файл читается через readinto
+    в переиспользуемый буфер потока, без создания объекта на каждый блок.
+    """
+
+    def __init__(self, workers: int = None, buffer_size: int = 4 * 1024 * 1024):
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.buffer_size = buffer_size
+        self.logger = logging.getLogger('launcher.verify')
+        self._local = threading.local()
+
+    def _buffer(self) -> memoryview:
+        if getattr(self._local, 'buffer', None) is None:
+            self._local.buffer = memoryview(bytearray(self.buffer_size))
+        return self._local.buffer
+
+    def hash_file(self, path: str, is_running=lambda: True) -> Optional[str]:
+        """SHA-256 файла или None, если проверка прервана"""
+        buffer = self._buffer()
+        sha256_hash = hashlib.sha256()
+        with open(path, 'rb', buffering=0) as f:
+            while True:
+                if not is_running():
+                    return None
+                read = f.readinto(buffer)
+                if not read:
+                    break
+                sha256_hash.update(buffer[:read])
+        return sha256_hash.hexdigest()
+
+    def hash_file_blocks(self, path: str, block_size: int, is_running=lambda: True) -> Optional[tuple]:
+        """(SHA-256 файла, [SHA-256 блоков]) за одно чтение файла или None, если проверка прервана"""
+        buffer = self._buffer()
+        file_hash = hashlib.sha256()
+        block_hash = hashlib.sha256()
+        block_left = block_size
+        digests = []
+        with open(path, 'rb', buffering=0) as f:
+            while True:
+                if not is_running():
+                    return None
+                # Чтение не переходит границу блока
+                read = f.readinto(buffer[:min(block_left, len(buffer))])
+                if not read:
+                    break
+                file_hash.update(buffer[:read])
+                block_hash.update(buffer[:read])
+                block_left -= read
+                if not block_left:
+                    digests.append(block_hash.hexdigest())
+                    block_hash = hashlib.sha256()
+                    block_left = block_size
+        if block_left != block_size:
+            digests.append(block_hash.hexdigest())
+        return file_hash.hexdigest(), digests
+
+    def hash_blocks(self, path: str, block_size: int, is_running=lambda: True) -> Optional[list]:
+        """SHA-256 каждого блока файла размером block_size"""
+        buffer = self._buffer()
+        digests = []
+        with open(path, 'rb', buffering=0) as f:
+            while True:
+                block_hash = hashlib.sha256()
+                left = block_size
+                while left:
+                    if not is_running():
+                        return None
+                    read = f.readinto(buffer[:min(left, len(buffer))])
+                    if not read:
+                        break
+                    block_hash.update(buffer[:read])
+                    left -= read
+                if left == block_size:
+                    return digests
+                digests.append(block_hash.hexdigest())
+                if left:
+                    return digests
+
+    def find_bad_blocks(self, path: str, file_info: dict, is_running=lambda: True) -> Optional[list]:
+        """Номера блоков, не совпадающих с блочными хешами манифеста.
+
+        Отсутствующие в конце короткого файла блоки тоже считаются
+        поврежденными. Возвращает None, если у файла нет блочных хешей.
+        """
+        if not file_info.get('blocks'):
+            return None
+        return self.compare_blocks(file_info, self.hash_blocks(path, file_info['block_size'], is_running))
+
+    @staticmethod
+    def compare_blocks(file_info: dict, digests: Optional[list]) -> Optional[list]:
+        """Номера блоков, хеши digests которых не совпадают с манифестом (None - хешей нет)"""
+        if not file_info.get('blocks') or digests is None:
+            return None
+        return [
+            index for index, expected in enumerate(file_info['blocks'])
+            if index >= len(digests) or digests[index] != expected
+        ]
+
+    def verify(self, jobs: list, on_result=None, is_running=lambda: True, block_sizes: dict = None) -> dict:
+        """Проверяет файлы jobs = [(filename, local_path, expected_hash), ...].
+
+        on_result(filename, ok, stats) вызывается в вызывающем потоке по мере
+        готовности файлов. Возвращает {filename: ok}, фактические хеши
+        сохраняются в self.last_digests, общая статистика - в self.last_stats.
+        Для файлов из block_sizes ({файл: размер блока}) в том же проходе
+        считаются хеши блоков - они сохраняются в self.last_blocks, чтобы
+        найти поврежденные блоки без повторного чтения файла. Файл, который
+        не удалось прочитать (удален, заблокирован игрой или антивирусом),
+        считается поврежденным, его хеш в last_digests - None.
+        """
+        results = {}
+        block_sizes = block_sizes or {}
+        self.last_digests = {}
+        self.last_blocks = {}
+        started = time.perf_counter()
+        total_bytes = 0
+
+        def check(job):
+            filename, local_path, expected_hash = job
+            file_started = time.perf_counter()
+            blocks = None
+            with tracer.span('hash', file=filename) as span:
+                try:
+                    if block_sizes.get(filename):
+                        digest, blocks = self.hash_file_blocks(local_path, block_sizes[filename], is_running) or (None, None)
+                    else:
+                        digest = self.hash_file(local_path, is_running)
+                    size = span['bytes'] = os.path.getsize(local_path)
+                except OSError as e:
+                    self.logger.warning(f'Не удалось прочитать {filename}: {e}')
+                    return filename, None, None, expected_hash, {'size': 0, 'seconds': 0.0, 'speed': 0.0}, False
+            seconds = time.perf_counter() - file_started
+            tracer.count('hash_bytes', size)
+            tracer.count('hash_seconds', seconds)
+            stats = {'size': size, 'seconds': seconds, 'speed': size / seconds if seconds else 0.0}
+            return filename, digest, blocks, expected_hash, stats, True
+
+        def size_of(job) -> int:
+            try:
+                return os.path.getsize(job[1])
+            except OSError:
+                return 0
+
+        # Большие файлы первыми, чтобы потоки заканчивали примерно одновременно
+        jobs = sorted(jobs, key=size_of, reverse=True)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(check, job) for job in jobs]
+            for future in as_completed(futures):
+                filename, digest, blocks, expected_hash, stats, readable = future.result()
+                if digest is None and readable:
+                    continue  # Проверка прервана
+                ok = digest == expected_hash
+                results[filename] = ok
+                self.last_digests[filename] = digest
+                if blocks is not None:
+                    self.last_blocks[filename] = blocks
+                total_bytes += stats['size']
+                # Аргументы подставляются, только если DEBUG включен для launcher.verify
+                self.logger.debug('Проверен %s: %.1f МБ/с', filename, stats['speed'] / (1024 * 1024))
+                if on_result:
+                    on_result(filename, ok, stats)
+
+        seconds = time.perf_counter() - started
+        self.last_stats = {
+            'files': len(results),
+            'size': total_bytes,
+            'seconds': seconds,
+            'speed': total_bytes / seconds if seconds else 0.0
+        }
+        if results:
+            tracer.gauge('hash_bytes_per_second', self.last_stats['speed'])
+            self.logger.info(
+                f"Проверено {len(results)} файлов, {total_bytes / (1024 * 1024):.0f} МБ за {seconds:.1f} с "
+                f"({self.last_stats['speed'] / (1024 * 1024):.1f} МБ/с)"
+            )
+        return results
+
+
+def format_speed(speed: float) -> str:
+    if speed > 1024 * 1024:
+        return f"{speed / (1024 * 1024):.1f} МБ/с"
+    return f"{speed / 1024:.1f} КБ/с"
+
+
+def format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class TransferTelemetry:
+    """Счетчики загрузки без блокировок в горячем цикле.
+
+    Каждый поток загрузки увеличивает собственную ячейку, а снимок
+    суммирует ячейки с фиксированной частотой: прогресс, скорость
+    (экспоненциальное скользящее среднее), оставшееся время и список
+    загружаемых файлов. snapshot() вызывается из одного потока.
+    """
+
+    def __init__(self, smoothing: float = 0.3):
+        self.total_size = 0
+        self.smoothing = smoothing
+        self._cells = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._active_files = []
+        self._speed = 0.0
+        self._last_downloaded = 0
+        self._last_time = None
+        self.controller = None  # TransferController, решения которого попадают в снимок
+
+    def add(self, size: int):
+        cell = getattr(self._local, 'cell', None)
+        if cell is None:
+            cell = self._local.cell = [0]
+            with self._lock:
+                self._cells.append(cell)
+        cell[0] += size
+
+    @property
+    def downloaded(self) -> int:
+        return sum(cell[0] for cell in list(self._cells))
+
+    def reset(self, total_size: int):
+        """Обнуляет счетчики перед запуском потоков загрузки"""
+        with self._lock:
+            self._cells = []
+            self._local = threading.local()
+        self.total_size = total_size
+        self._speed = 0.0
+        self._last_downloaded = 0
+        self._last_time = None
+
+    def file_started(self, filename: str):
+        with self._lock:
+            self._active_files.append(filename)
+
+    def file_finished(self, filename: str):
+        with self._lock:
+            self._active_files.remove(filename)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        downloaded = self.downloaded
+        if self._last_time is not None and now > self._last_time:
+            speed = max(0, downloaded - self._last_downloaded) / (now - self._last_time)
+            self._speed += self.smoothing * (speed - self._speed)
+        self._last_time = now
+        self._last_downloaded = downloaded
+
+        with self._lock:
+            active_files = list(self._active_files)
+        progress = min(1.0, downloaded / self.total_size) if self.total_size else 0.0
+        eta = (self.total_size - downloaded) / self._speed if self._speed > 0 else -1
+        snapshot = {
+            'progress': progress,
+            'downloaded': downloaded,
+            'total': self.total_size,
+            'speed': self._speed,
+            'eta': eta,
+            'activeFiles': active_files,
+            'speedText': format_speed(self._speed) if self._speed > 0 else '',
+            'sizeText': f"{downloaded / (1024 ** 3):.2f}/{self.total_size / (1024 ** 3):.2f} ГБ",
+            'etaText': f"осталось {format_eta(eta)}" if eta >= 0 else ''
+        }
+        if self.controller is not None:
+            snapshot.update(self.controller.snapshot())
+        return snapshot
+
+
+class TransferController:
+    """Подбирает параметры загрузки по измеренной скорости, задержке и ошибкам.
+
+    Число одновременных HTTP-запросов меняется по схеме AIMD: в начале
+    лимит удваивается, пока скорость растет, затем увеличивается на
+    единицу, пока скорость не падает и задержка первого байта остается
+    обычной. Признаки перегрузки сервера (таймауты, ответы 429 и 503)
+    сокращают лимит вдвое, рост задержки - на единицу. Обрывы соединений
+    лимит не уменьшают (на нестабильном канале они не зависят от числа
+    соединений), но уменьшают сегмент вдвое, чтобы обрыв стоил меньше.
+    Сегмент рассчитывается на segment_time секунд загрузки одним
+    соединением, блок чтения - на read_time секунд. Решения
+    пересматриваются раз в interval секунд из потоков загрузки.
+
+    Свободное соединение достается запросу с наименьшим priority (уровнем
+    файла), поэтому файлы, нужные для запуска игры, не делят канал с
+    остальными. set_ceiling() временно ограничивает число соединений.
+    """
+
+    def __init__(self, max_connections: int, connections: int = None, segment_size: int = 10 * 1024 * 1024,
+                 min_segment_size: int = 1024 * 1024, max_segment_size: int = 64 * 1024 * 1024,
+                 read_size: int = 64 * 1024, min_read_size: int = 16 * 1024, max_read_size: int = 1024 * 1024,
+                 segment_time: float = 5.0, read_time: float = 0.05, interval: float = 2.0):
+        self.max_connections = max(1, max_connections)
+        self.ceiling = None  # Временная граница числа соединений, например пока идет игра
+        self.connections = min(self.max_connections, max(1, connections or self.max_connections))
+        self.segment_size = segment_size
+        self.min_segment_size = min_segment_size
+        self.max_segment_size = max_segment_size
+        self.read_size = read_size
+        self.min_read_size = min_read_size
+        self.max_read_size = max_read_size
+        self.segment_time = segment_time
+        self.read_time = read_time
+        self.interval = interval
+        self.sample_interval = 0.25  # Как часто потоки сообщают о загруженных байтах
+        self.rate = 0.0
+        self.logger = logging.getLogger('launcher.download')
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = {}  # {priority: число ожидающих запросов}
+        self._peak = 0  # Наибольшее число одновременных запросов за интервал
+        self._slow_start = True
+        self._bytes = 0
+        self._drops = 0
+        self._overloads = 0
+        self._ttfb = []
+        self._min_ttfb = None
+        self._last_time = None
+        self._publish()
+
+    def acquire(self, running, priority: int = 0) -> bool:
+        """Ждет свободного соединения; False, если загрузка остановлена"""
+        with self._cond:
+            self._waiting[priority] = self._waiting.get(priority, 0) + 1
+            try:
+                while self._active >= self.connections or min(self._waiting) < priority:
+                    if not running():
+                        return False
+                    self._cond.wait(0.5)
+            finally:
+                self._waiting[priority] -= 1
+                if not self._waiting[priority]:
+                    del self._waiting[priority]
+                self._cond.notify_all()  # Очередь могли ждать запросы с большим priority
+            self._active += 1
+            self._peak = max(self._peak, self._active)
+            return True
+
+    def report(self, size: int):
+        """Учитывает байты, полученные с прошлого отчета"""
+        with self._cond:
+            self._bytes += size
+            self._adjust()
+
+    def release(self, size: int, ttfb: Optional[float] = None, error: str = None):
+        """Завершает запрос: последние байты, задержка первого байта и ошибка ('drop' или 'overload')"""
+        with self._cond:
+            self._active -= 1
+            self._bytes += size
+            if ttfb is not None:
+                self._ttfb.append(ttfb)
+            if error == 'overload':
+                self._overloads += 1
+            elif error:
+                self._drops += 1
+            self._adjust()
+            self._cond.notify_all()
+
+    def set_ceiling(self, ceiling: Optional[int]):
+        """Ограничивает число соединений сверху; None снимает ограничение"""
+        with self._cond:
+            self.ceiling = ceiling
+            if ceiling is None:
+                # Быстро возвращаемся к прежней скорости: удвоение, пока она растет
+                self._slow_start = True
+                self.rate = 0.0
+            self.connections = min(self.connections, self._limit())
+            self._cond.notify_all()
+        self._publish()
+
+    def _limit(self) -> int:
+        return max(1, min(self.max_connections, self.ceiling or self.max_connections))
+
+    @staticmethod
+    def _round(value: float, lower: int, upper: int) -> int:
+        """Степень двойки не больше value в пределах [lower, upper]"""
+        size = lower
+        while size * 2 <= min(value, upper):
+            size *= 2
+        return size
+
+    def _adjust(self):
+        now = time.monotonic()
+        if self._last_time is None:
+            self._last_time = now
+            return
+        elapsed = now - self._last_time
+        if elapsed < self.interval:
+            return
+        rate = self._bytes / elapsed
+        drops, overloads = self._drops, self._overloads
+        ttfb = sorted(self._ttfb)[len(self._ttfb) // 2] if self._ttfb else None
+        peak = max(self._peak, self._active)
+        self._bytes = self._drops = self._overloads = 0
+        self._ttfb = []
+        self._peak = self._active
+        self._last_time = now
+
+        if ttfb is not None:
+            self._min_ttfb = ttfb if self._min_ttfb is None else min(self._min_ttfb, ttfb)
+        delayed = ttfb is not None and ttfb > self._min_ttfb * 2 + 0.05
+        limited = bandwidth_limiter.rate and rate >= bandwidth_limiter.rate * 0.9
+        connections = self.connections
+        if overloads:
+            connections = connections // 2
+            self._slow_start = False
+        elif delayed and rate < self.rate * 0.9:
+            # Задержка растет, а скорость нет - очередь на канале
+            connections -= 1
+            self._slow_start = False
+        elif rate and not limited and not drops and peak >= connections:
+            if self._slow_start and rate > self.rate * 1.1:
+                connections *= 2
+            elif self._slow_start:
+                self._slow_start = False  # Удвоение больше не дает прироста
+            elif rate >= self.rate * 0.95 and not delayed:
+                connections += 1
+        self.connections = min(self._limit(), max(1, connections))
+
+        if drops or overloads:
+            self.segment_size = max(self.min_segment_size, self.segment_size // 2)
+        elif rate:
+            per_connection = rate / max(1, peak)
+            self.segment_size = min(
+                self.segment_size * 2,
+                self._round(per_connection * self.segment_time, self.min_segment_size, self.max_segment_size)
+            )
+            self.read_size = self._round(per_connection * self.read_time, self.min_read_size, self.max_read_size)
+        if rate:
+            self.rate = rate
+        self._cond.notify_all()
+
+        self.logger.debug(
+            'Загрузка: %.0f КБ/с, обрывов %d, перегрузок %d, TTFB %s, соединений %d, сегмент %d КБ, блок %d КБ',
+            rate / 1024, drops, overloads, f'{ttfb * 1000:.0f} мс' if ttfb is not None else '-',
+            self.connections, self.segment_size // 1024, self.read_size // 1024
+        )
+        self._publish()
+
+    def _publish(self):
+        tracer.gauge('transfer_connections', self.connections)
+        tracer.gauge('transfer_segment_bytes', self.segment_size)
+        tracer.gauge('transfer_read_bytes', self.read_size)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                'connections': self.connections,
+                'activeConnections': self._active,
+                'segmentSize': self.segment_size,
+                'readSize': self.read_size
+            }
+
+
 class DownloadManager(QThread):
     update_status = pyqtSignal(str)
-    update_progress = pyqtSignal(float)
-    update_file_name = pyqtSignal(str)
-    update_speed = pyqtSignal(str)
-    update_size_info = pyqtSignal(str) # Новый сигнал для отображения информации о размере файлов
+    telemetry_updated = pyqtSignal(dict)  # Снимок TransferTelemetry с фиксированной частотой
+    playable_changed = pyqtSignal(bool)  # Файлы уровня TIER_LAUNCH проверены и игру можно запускать
     finished = pyqtSignal()
 
-    def __init__(self, manifest_url: str, game_path: str, files_to_download=None):
+    def __init__(self, manifest_url: str, game_path: str, files_to_download=None, max_parallel_files: int = 4,
+                 parallel_segments: int = 4, deep_verify: bool = False, repair_blocks: dict = None,
+                 manifest: ManifestSnapshot = None, mirrors: list = None, object_store: ObjectStore = None,
+                 peers: PeerCache = None):
         super().__init__()
         self.manifest_url = manifest_url
         self.game_path = game_path
+        self.manifest = manifest  # Уже полученный манифест, чтобы не запрашивать его повторно
+        self.manifest_store = ManifestStore(game_path, manifest_url)
         self.specific_files = files_to_download  # список конкретных файлов для загрузки
+        self.deep_verify = deep_verify  # Хешировать все файлы, не доверяя кэшу проверки
+        self.repair_blocks = dict(repair_blocks or {})  # {файл: [номера поврежденных блоков]}
+        self.patches = {}  # {файл: описание патча из манифеста}
+        self.manifest_version = None  # Версия клиента из манифеста
+        self.completed = False  # Все файлы загружены и проверены
+        self.error = None  # Текст ошибки, прервавшей загрузку
+        self.download_url = 'http://dl.neix.ru/'  # Используется, если в манифесте нет зеркал
+        self.extra_mirrors = list(mirrors or [])  # Зеркала из настроек
+        self.object_store = object_store  # Общее хранилище файлов нескольких клиентов
+        self.peers = peers  # Лаунчеры в локальной сети, у которых можно взять файлы
+        self.duplicates = {}  # {файл: файл с тем же хешем, который загружается вместо него}
+        self.tiers = {}  # {файл: уровень приоритета из manifest_tier}
+        self._launch_files = set()  # Еще не готовые файлы, без которых игра не запустится
+        self._outdated = set()  # Файлы прежней версии: они обновляются, но игре не мешают
+        self._copied = set()  # Уже созданные копии из duplicates
+        self.mirrors = MirrorSet([self.download_url])
+        self.verify_cache = None
+        self.verify_engine = VerifyEngine()
+        self.max_parallel_files = max(1, max_parallel_files)  # Количество одновременно загружаемых файлов
         self.is_downloading = True
         self.files_to_download = {}
         self.files_to_process = {}  # Файлы, которые нужно скачать
         self.corrupted_files = []
-        self.logger = logging.getLogger(__name__)
+        self.logger = logging.getLogger('launcher.download')
         self.chunk_size = 8192
-        self.current_downloaded = 0
-        self.last_downloaded = 0
-        self.resume_position = 0  # Позиция для возобновления загрузки
-        self.speed_timer = QTimer()
-        self.speed_timer.timeout.connect(self.calculate_speed)
-        self.speed_timer.start(1000)  # Обновляем каждую секунду
+        self.telemetry = TransferTelemetry()
+        self.telemetry_timer = QTimer()
+        self.telemetry_timer.timeout.connect(self.publish_telemetry)
+        self.telemetry_timer.start(250)  # Интерфейс обновляется 4 раза в секунду
+        self.finished.connect(self.telemetry_timer.stop)
         self.segment_size = 1024 * 1024 * 10 # 10 МБ сегменты
-        self.max_retries = 3 # Максимальное количество попыток загрузки файла
+        self.max_retries = 3 # Максимальное количество попыток загрузки блока при починке
+        self.retry_budget = 60.0  # Сколько секунд сегмент может не продвигаться, прежде чем файл будет отложен
+        self.file_retries = 2  # Сколько раз отложенный файл загружается повторно в конце своего уровня
+        self.retry_delay = 1.0  # Пауза перед первым повтором, дальше растет вдвое
+        self.retry_max_delay = 30.0
+        self.journal_interval = 4 * 1024 * 1024  # Как часто фиксировать загруженное в журнале
+        self.mirror_check_interval = 2.0  # Как часто сверять скорость зеркала с остальными, секунд
         self.total_size = 0 # Общий размер всех файлов
-        self.total_downloaded = 0 # Общий размер загруженных файлов
-        self.current_speed = 0 # Текущая скорость загрузки        
+        self.large_file_size = self.segment_size * 10  # Файлы крупнее считаются "большими" при планировании
+        self.parallel_segments = max(1, parallel_segments)  # Потоков на большой файл при полной загрузке канала
+        self.min_steal_size = 1024 * 1024  # Меньшие остатки сегментов не делятся между потоками
+        # Файлы меньше качаются одним потоком; файл покрупнее может занять все соединения,
+        # которые ему отдает TransferController, - так файлы для запуска игры не ждут остальных
+        self.parallel_min_size = self.min_steal_size * 4
+        # Число соединений, размеры сегмента и блока чтения подстраиваются под канал;
+        # настройки потоков задают только верхнюю границу
+        self.controller = TransferController(
+            min(http_pool.pool_size, self.max_parallel_files * self.parallel_segments),
+            connections=self.max_parallel_files, segment_size=self.segment_size, min_segment_size=self.min_steal_size
+        )
+        self.telemetry.controller = self.controller
+        self.background_connections = 2  # Соединений, пока идет игра
+        self._segment_lock = threading.Lock()
+        self._progress_lock = threading.Lock()
+        self._queue_lock = threading.Lock()
+        self._active_large = 0
+        self._failures = {}  # {файл: число неудачных попыток загрузки}
 
     def check_existing_files(self):
         """Проверяет существующие файлы и их целостность"""
         try:
-            response = requests.get(self.manifest_url)
-            response.raise_for_status()
-            manifest = response.json()['files']
+            if self.manifest is None:
+                with tracer.span('manifest.fetch') as span:
+                    self.manifest = self.manifest_store.fetch()
+                    span['cached'] = self.manifest.from_cache
+            self.manifest_version = self.manifest.version
+            manifest = self.manifest.files
+            self.verify_cache = VerifyCache(self.game_path, manifest, self.manifest.digest)
             
             # Если указаны конкретные файлы, загружаем только их
             if self.specific_files:
@@ -115,191 +2164,988 @@ class DownloadManager(QThread):
                     for filename in self.specific_files
                     if filename in manifest
                 }
+                # Блочная починка возможна только для существующих файлов с блочными хешами
+                self.repair_blocks = {
+                    filename: blocks for filename, blocks in self.repair_blocks.items()
+                    if filename in self.files_to_process
+                    and blocks and manifest[filename].get('blocks')
+                    and os.path.exists(os.path.join(self.game_path, filename))
+                }
             else:
                 # Стандартная проверка всех файлов
                 self.files_to_download = manifest
                 self.files_to_process = {}
+                hash_jobs = []
+                self._remove_obsolete_files()
+                # Измененные с последней синхронизации записи: если файл на диске не менялся
+                # с прошлой проверки, его версия известна из кэша и хешировать его не нужно
+                changed = set(self.manifest.diff['changed']) if self.manifest.diff and not self.deep_verify else set()
 
                 for filename, file_info in self.files_to_download.items():
                     local_path = os.path.join(self.game_path, filename)
-                    needs_download = True
 
                     if os.path.exists(local_path):
+                        current_hash = self.verify_cache.recorded_hash(filename, local_path) if filename in changed else None
+                        if current_hash and current_hash != file_info['hash']:
+                            self.logger.info(f'Файл {filename} изменен в манифесте, на диске прежняя версия')
+                            self._queue_outdated_file(filename, file_info, local_path, current_hash)
+                            continue
                         # Проверяем размер файла
                         actual_size = os.path.getsize(local_path)
                         if actual_size == file_info['size']:
-                            # Проверяем хеш только если размер совпадает
-                            if self.verify_checksum(local_path, file_info['hash']):
-                                needs_download = False
-                                self.logger.info(f'Файл {filename} проверен и корректен')
+                            # Записи, не изменившиеся с последней синхронизации, проходят
+                            # по кэшу проверки; для измененных кэш хранит старый хеш
+                            if not self.deep_verify and self.verify_cache.is_valid(filename, local_path, file_info['hash']):
                                 continue
-
-                        self.logger.warning(f'Файл {filename} поврежден или неполон. Будет перезагружен')
-                        if os.path.exists(local_path):
-                            os.remove(local_path)
-
-                    if needs_download:
+                            # Проверяем хеш только если размер совпадает
+                            hash_jobs.append((filename, local_path, file_info['hash']))
+                            continue
+                        if file_info.get('patches'):
+                            # Хеш старой версии нужен, чтобы подобрать патч
+                            hash_jobs.append((filename, local_path, file_info['hash']))
+                            continue
+                        self._queue_broken_file(filename, file_info, local_path)
+                    else:
                         self.files_to_process[filename] = file_info
                         self.logger.info(f'Файл {filename} добавлен в очередь загрузки')
 
+                results = self.verify_engine.verify(
+                    hash_jobs, is_running=lambda: self.is_downloading, block_sizes=manifest_block_sizes(manifest)
+                )
+                for filename, local_path, expected_hash in hash_jobs:
+                    if results.get(filename):
+                        self.verify_cache.store(filename, local_path, expected_hash)
+                        self.logger.info(f'Файл {filename} проверен и корректен')
+                    elif filename in results:
+                        self._queue_outdated_file(
+                            filename, manifest[filename], local_path, self.verify_engine.last_digests[filename],
+                            self.verify_engine.last_blocks.get(filename)
+                        )
+
         except Exception as e:
             self.logger.error(f"Ошибка при проверке файлов: {str(e)}")
             raise
 
+    def _remove_obsolete_files(self):
+        """Удаляет файлы, исключенные из манифеста с последней синхронизации.
+
+        Файл удаляется, только если он остался таким, каким его описывал
+        прежний манифест; измененные пользователем файлы не трогаются.
+        """
+        diff, previous = self.manifest.diff, self.manifest.previous
+        if not diff or not diff['removed']:
+            return
+        jobs = []
+        for filename in diff['removed']:
+            local_path = os.path.join(self.game_path, filename)
+            if os.path.isfile(local_path) and os.path.getsize(local_path) == previous[filename]['size']:
+                jobs.append((filename, local_path, previous[filename]['hash']))
+        results = self.verify_engine.verify(jobs, is_running=lambda: self.is_downloading)
+        removed = 0
+        for filename, local_path, _ in jobs:
+            if results.get(filename):
+                os.remove(local_path)
+                removed += 1
+                self.logger.info(f'Файл {filename} исключен из манифеста и удален')
+            elif filename in results:
+                self.logger.info(f'Файл {filename} исключен из манифеста, но изменен локально и оставлен')
+        if removed:
+            self.update_status.emit(f'Удалено устаревших файлов: {removed}')
+
+    def _queue_outdated_file(self, filename: str, file_info: dict, local_path: str, current_hash: str,
+                             block_digests: list = None):
+        """Ставит в очередь файл с хешем current_hash, не совпавшим с манифестом: патчем или загрузкой"""
+        patch = self._find_patch(file_info, current_hash)
+        previous = (self.manifest.previous or {}).get(filename)
+        if patch or (previous and previous['hash'] == current_hash):
+            self._outdated.add(filename)
+        if patch:
+            self.verify_cache.discard(filename)
+            self.patches[filename] = patch
+            self.files_to_process[filename] = file_info
+            self.logger.info(f'Файл {filename} будет обновлен патчем {patch["url"]}')
+        else:
+            self._queue_broken_file(filename, file_info, local_path, block_digests)
+
+    def _queue_broken_file(self, filename: str, file_info: dict, local_path: str, block_digests: list = None):
+        """Ставит поврежденный файл в очередь; block_digests - уже посчитанные хеши его блоков"""
+        self.verify_cache.discard(filename)
+        if self.object_store and self.object_store.contains(file_info['hash'], local_path):
+            # Файл - ссылка на объект хранилища, значит поврежден сам объект
+            self.logger.warning(f'Объект хранилища для {filename} поврежден и будет загружен заново')
+            self.object_store.discard(file_info['hash'])
+        # При наличии блочных хешей перезагружаем только поврежденные блоки
+        bad_blocks = None
+        if block_digests is not None:
+            bad_blocks = self.verify_engine.compare_blocks(file_info, block_digests)
+        elif os.path.exists(local_path):
+            try:
+                bad_blocks = self.verify_engine.find_bad_blocks(local_path, file_info, lambda: self.is_downloading)
+            except OSError:
+                pass  # Файл не читается - загружается целиком
+        if bad_blocks:
+            self.logger.warning(f'Файл {filename}: повреждено блоков {len(bad_blocks)}, будут перезагружены')
+            self.repair_blocks[filename] = bad_blocks
+        else:
+            self.logger.warning(f'Файл {filename} поврежден или неполон. Будет перезагружен')
+            try:
+                if os.path.exists(local_path):
+                    os.remove(local_path)
+            except OSError as e:
+                self.logger.warning(f'Не удалось удалить {filename}: {e}. Файл будет заменен после загрузки')
+        self.files_to_process[filename] = file_info
+        self.logger.info(f'Файл {filename} добавлен в очередь загрузки')
+
+    @staticmethod
+    def _find_patch(file_info: dict, current_hash: str) -> Optional[dict]:
+        """Патч из манифеста, переводящий файл с хешем current_hash в нужную версию"""
+        for patch in file_info.get('patches', []):
+            if patch.get('from') == current_hash:
+                return patch
+        return None
+
+    def _transfer_size(self, filename: str, file_info: dict) -> int:
+        """Сколько байт предстоит загрузить для файла"""
+        if self.object_store and self.object_store.has(file_info['hash'], file_info['size']):
+            return 0
+        if filename in self.patches:
+            return self.patches[filename]['size']
+        if filename in self.repair_blocks:
+            return sum(end - start for start, end in (
+                block_range(file_info, index) for index in self.repair_blocks[filename]
+            ))
+        return file_info['size']
+
     def stop(self):
         self.is_downloading = False
-        self.speed_timer.stop()
+        self.telemetry_timer.stop()
         self.logger.info('Загрузка остановлена пользователем')
 
     def verify_checksum(self, file_path: str, expected_checksum: str) -> bool:
         try:
-            sha256_hash = hashlib.sha256()
-            with open(file_path, "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-            return sha256_hash.hexdigest() == expected_checksum
+            return self.verify_engine.hash_file(file_path) == expected_checksum
         except Exception as e:
             self.logger.error(f"Ошибка при проверке контрольной суммы {file_path}: {e}")
             return False
 
-    def calculate_speed(self):
-        if hasattr(self, 'current_downloaded'):
-            self.current_speed = self.current_downloaded - self.last_downloaded
-            self.last_downloaded = self.current_downloaded
-            if self.current_speed > 0: # Отправляем сигнал только если есть прогресс
-                speed_str = f"{self.current_speed / (1024 * 1024):.1f} МБ/с" if self.current_speed > 1024 * 1024 else f"{self.current_speed / 1024:.1f} КБ/с"
-                self.update_speed.emit(speed_str)
-                # Обновляем информацию о размере файлов
-                downloaded_gb = self.total_downloaded / (1024 * 1024 * 1024)
-                total_gb = self.total_size / (1024 * 1024 * 1024)
-                downloaded_str = f"{downloaded_gb:.2f}/{total_gb:.2f} ГБ"
-                self.update_size_info.emit(downloaded_str)
-
-    def download_file_segmented(self, url: str, local_path: str, file_size: int):
+    @property
+    def total_downloaded(self) -> int:
+        return self.telemetry.downloaded
+
+    def publish_telemetry(self):
+        """Отправляет в интерфейс один снимок состояния загрузки"""
+        self.telemetry.total_size = self.total_size
+        self.telemetry_updated.emit(self.telemetry.snapshot())
+
+    def set_background(self, enabled: bool):
+        """Понижает приоритет загрузки, пока идет игра, и возвращает его после"""
+        self.controller.set_ceiling(self.background_connections if enabled else None)
+        self.logger.info('Загрузка продолжается в фоне' if enabled else 'Загрузка продолжается с полной скоростью')
+
+    def download_file_parallel(self, filename: str, local_path: str, file_size: int, segments: int = None,
+                               mirrors: MirrorSet = None, path: str = None):
+        """Загружает файл в заранее выделенный .temp файл в segments потоков.
+
+        Каждый сегмент пишется по своему смещению, а записанные диапазоны
+        фиксируются в журнале .temp.journal, поэтому после сбоя загрузка
+        продолжается ровно с места остановки. Освободившийся поток забирает
+        половину самого большого остатка у другого потока, чтобы последние
+        сегменты не задерживали файл; в первую очередь - у медленных зеркал.
+        mirrors и path задают другие источники файла (соседей в локальной
+        сети) и путь к нему на них.
+        """
         temp_path = local_path + '.temp'
-        downloaded_size = 0
+        journal = SegmentJournal(temp_path + '.journal')
+        records = []
 
         if os.path.exists(temp_path):
-            downloaded_size = os.path.getsize(temp_path)
-            self.total_downloaded += downloaded_size # Учитываем уже загруженный размер
+            # .temp без журнала не проверить - такой файл качается заново
+            records = journal.load(temp_path, file_size)
+        if os.path.exists(temp_path + '.parts'):
+            os.remove(temp_path + '.parts')  # Формат прошлых версий без контрольных сумм
+        completed = merge_ranges([[start, end] for start, end, _ in records])
 
-        with open(temp_path, 'ab') as f:
-            while downloaded_size < file_size:
-                start = downloaded_size
-                end = min(start + self.segment_size - 1, file_size - 1)
-                
-                for attempt in range(self.max_retries):
+        with open(temp_path, 'r+b' if os.path.exists(temp_path) else 'wb') as f:
+            f.truncate(file_size)
+
+        # Недостающие диапазоны режутся на сегменты по мере загрузки (_take_segment)
+        pending = []
+        position = 0
+        for start, end in completed + [[file_size, file_size]]:
+            if start > position:
+                pending.append(Segment(position, start))
+            position = end
+        done_size = sum(end - start for start, end in completed)
+        self._add_progress(done_size)
+
+        hasher = StreamHasher(temp_path, completed)
+        state = {
+            'pending': pending, 'active': [], 'errors': [], 'hasher': hasher, 'journal': journal,
+            'mirrors': mirrors or self.mirrors, 'path': path or filename
+        }
+        journal.open(records)
+        try:
+            workers = [
+                threading.Thread(target=self._segment_worker, args=(filename, temp_path, state), daemon=True)
+                for _ in range(min(segments or self.controller.max_connections, max(1, (file_size - done_size) // self.min_steal_size)))
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            journal.close(remove=self.is_downloading and not state['errors'])
+
+        if state['errors']:
+            # Учтенное этой попыткой вычитается из прогресса: журналированную часть
+            # снова учтет следующая попытка (например, с сервера после соседей)
+            self._add_progress(-hasher.covered)
+            raise state['errors'][0]
+        return temp_path, hasher
+
+    def _take_segment(self, state: dict):
+        """Выдает потоку следующий сегмент или забирает часть чужого"""
+        with self._segment_lock:
+            if state['pending']:
+                # Размер сегмента выбирает TransferController; короткий остаток не отделяется
+                gap = state['pending'][0]
+                end = gap.start + self.controller.segment_size
+                if gap.end - end < self.min_steal_size:
+                    segment = state['pending'].pop(0)
+                else:
+                    segment = Segment(gap.start, end)
+                    gap.start = gap.position = gap.reserved = end
+            else:
+                # Забираем у сегмента, который закончится позже всех, - чаще всего это медленное зеркало
+                victim = max(state['active'], key=state['mirrors'].remaining_time, default=None)
+                # Делится только еще не отданное на запись: блок, который поток уже пишет, остается у него
+                free = victim.end - victim.reserved if victim else 0
+                if free < self.min_steal_size * 2:
+                    return None
+                middle = victim.reserved + int(free * (1 - state['mirrors'].steal_share(victim.mirror)))
+                segment = Segment(middle, victim.end)
+                victim.end = middle
+            state['active'].append(segment)
+            return segment
+
+    def _segment_worker(self, filename: str, temp_path: str, state: dict):
+        priority = self.tiers.get(filename, TIER_LAUNCH)
+        with open(temp_path, 'r+b') as f:
+            while self.is_downloading and not state['errors']:
+                # Сегмент берется, только когда есть свободное соединение, - тогда
+                # его размер соответствует текущему решению TransferController
+                if not self.controller.acquire(lambda: self.is_downloading, priority):
+                    break
+                segment = self._take_segment(state)
+                if segment is None:
+                    self.controller.release(0)
+                    break
+                try:
+                    self._fetch_segment(state['path'], f, segment, state['hasher'], state['journal'], state['mirrors'],
+                                        acquired=True, priority=priority)
+                except Exception as e:
+                    state['errors'].append(e)
+                finally:
+                    with self._segment_lock:
+                        state['active'].remove(segment)
+
+    def _fetch_segment(self, filename: str, f, segment: Segment, hasher: StreamHasher, journal: SegmentJournal = None,
+                       mirrors: MirrorSet = None, acquired: bool = False, priority: int = 0):
+        """Загружает сегмент, записывая данные по его смещению в файле.
+
+        Запрос ждет свободного соединения у TransferController (acquired -
+        первое соединение уже получено, priority - уровень файла) и читает
+        ответ блоками выбранного им размера. Каждый запрос уходит на
+        зеркало, выбранное MirrorSet. Если зеркало
+        отстает от остальных, запрос прерывается и сегмент продолжается с
+        другого зеркала. Записанные данные попадают в журнал порциями по
+        journal_interval. После обрыва запрос продолжается с текущей позиции
+        сегмента, а паузы между неудачными попытками растут экспоненциально.
+        Сегмент сдается, только если не продвигался дольше retry_budget.
+        """
+        mirrors = mirrors or self.mirrors
+        attempt = 0
+        progress_time = time.monotonic()  # Когда сегмент последний раз продвинулся
+        while True:
+            if not acquired and not self.controller.acquire(lambda: self.is_downloading, priority):
+                return
+            acquired = False
+            position = counted = segment.position
+            counted_time = time.monotonic()
+            mirror = mirrors.acquire()
+            segment.mirror = mirror
+            url = f'{mirror.url}{filename}'
+            switch = False
+            error = None
+            request = tracer.start('http.request', file=filename, mirror=mirror.url, offset=segment.position)
+            try:
+                headers = {'Range': f'bytes={segment.position}-{segment.end - 1}'}
+                with http_pool.get(url, headers=headers, stream=True) as response:
+                    request.attrs['ttfb'] = round(time.perf_counter() - request.started, 6)
+                    request.attrs['status'] = response.status_code
+                    # Ответ 200 содержит файл целиком и подходит только для сегмента с начала файла
+                    if response.status_code != 206 and not (response.status_code == 200 and segment.position == 0):
+                        raise Exception(f"Сервер не поддерживает загрузку диапазонов (код {response.status_code})")
+                    journal_start = segment.position
+                    crc = 0
+                    window_start, window_position = time.monotonic(), segment.position
                     try:
-                        headers = {'Range': f'bytes={start}-{end}'}                        
-                        response = requests.get(url, headers=headers, stream=True)
-
-                        if response.status_code in [206, 200]:
-                            for chunk in response.iter_content(chunk_size=8192):
-                                if chunk:
-                                    f.write(chunk)
-                                    downloaded_size += len(chunk)
-                                    self.total_downloaded += len(chunk)
-                                    self.current_downloaded = self.total_downloaded
-                                    # Обновляем общий прогресс
-                                    self.update_progress.emit(self.total_downloaded / self.total_size)
+                        for chunk in response.iter_content(chunk_size=self.controller.read_size):
+                            if not self.is_downloading:
+                                return
+                            bandwidth_limiter.consume(len(chunk))
+                            with self._segment_lock:
+                                # Конец сегмента мог сдвинуться, если его часть забрал другой поток;
+                                # отрезанный по концу блок резервируется, чтобы его не забрали на лету
+                                chunk = chunk[:segment.end - segment.position]
+                                offset = segment.position
+                                segment.reserved = offset + len(chunk)
+                            if chunk:
+                                f.seek(offset)
+                                f.write(chunk)
+                                f.flush()  # Хешер может дочитать этот диапазон из файла
+                                hasher.update(offset, chunk)
+                                crc = zlib.crc32(chunk, crc)
+                                with self._segment_lock:
+                                    segment.position += len(chunk)
+                                self._add_progress(len(chunk))
+                                if journal and segment.position - journal_start >= self.journal_interval:
+                                    journal.record(f, journal_start, segment.position, crc)
+                                    journal_start, crc = segment.position, 0
+                            if segment.position >= segment.end:
+                                return
+                            now = time.monotonic()
+                            if now - counted_time >= self.controller.sample_interval:
+                                self.controller.report(segment.position - counted)
+                                counted, counted_time = segment.position, now
+                            elapsed = now - window_start
+                            if elapsed >= self.mirror_check_interval:
+                                mirrors.report(mirror, segment.position - window_position, elapsed)
+                                window_start, window_position = time.monotonic(), segment.position
+                                if mirrors.is_slow(mirror):
+                                    self.logger.info(f'Зеркало {mirror.url} отстает, сегмент {filename} переходит на другое')
+                                    tracer.count('mirror_switches')
+                                    switch = True
+                                    break
+                    finally:
+                        if journal and segment.position > journal_start:
+                            journal.record(f, journal_start, segment.position, crc)
+                        if segment.position - window_position >= 64 * 1024:  # Короткие ответы не показательны
+                            mirrors.report(mirror, segment.position - window_position, time.monotonic() - window_start)
+            except Exception as e:
+                error = e
+                overload = isinstance(e, requests_module().Timeout) or request.attrs.get('status') in (429, 503)
+                mirrors.fail(mirror)
+                tracer.count('reconnects', mirror=urlsplit(mirror.url).netloc)
+                self.logger.warning(f'Ошибка загрузки диапазона {segment.position}-{segment.end} {url}: {e}')
+            finally:
+                mirrors.release(mirror)
+                self.controller.release(
+                    segment.position - counted, request.attrs.get('ttfb'),
+                    None if error is None else 'overload' if overload else 'drop'
+                )
+                tracer.count('bytes_downloaded', segment.position - position, mirror=urlsplit(mirror.url).netloc)
+                tracer.end(request, error, bytes=segment.position - position, switched=switch)
+            if segment.position >= segment.end or not self.is_downloading:
+                return
+            if switch:
+                continue
+            # Оборванный, но продвинувшийся ответ обнуляет и паузу, и отсчет времени
+            if segment.position > position:
+                attempt, progress_time = 0, time.monotonic()
+            if time.monotonic() - progress_time >= self.retry_budget:
+                raise Exception(f"Сегмент файла не загружается дольше {self.retry_budget:.0f} с")
+            attempt += 1
+            self._backoff(attempt)
+
+    def _backoff(self, attempt: int):
+        """Пауза перед повтором: растет вдвое с каждой попыткой, со случайным разбросом"""
+        delay = min(self.retry_max_delay, self.retry_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+        tracer.count('retries')
+        tracer.count('retry_wait_seconds', delay)
+        deadline = time.monotonic() + delay
+        while self.is_downloading and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+    def _add_progress(self, size: int):
+        """Учитывает загруженные байты (вызывается из нескольких потоков без блокировок)"""
+        self.telemetry.add(size)
+
+    def _next_file(self, pending: list):
+        """Выбирает следующий файл из очереди, отсортированной по уровню и убыванию размера.
+
+        Большие файлы берутся с начала очереди, пока хотя бы один поток остается
+        свободным для мелких файлов, которые забираются с конца файлов того же уровня.
+        """
+        with self._queue_lock:
+            if not pending:
+                return None
+            filename, file_info = pending[0]
+            if file_info['size'] >= self.large_file_size and self._active_large >= self.max_parallel_files - 1:
+                tier = self.tiers[filename]
+                filename, file_info = pending.pop(sum(1 for name, _ in pending if self.tiers[name] == tier) - 1)
+            else:
+                pending.pop(0)
+            if file_info['size'] >= self.large_file_size:
+                self._active_large += 1
+            self.telemetry.file_started(filename)
+            return filename, file_info
+
+    def _finish_file(self, filename: str, file_info: dict):
+        with self._queue_lock:
+            if file_info['size'] >= self.large_file_size:
+                self._active_large -= 1
+            self.telemetry.file_finished(filename)
+
+    def _download_worker(self, pending: list):
+        """Поток пула: загружает файлы из общей очереди, пока она не опустеет"""
+        while self.is_downloading:
+            item = self._next_file(pending)
+            if item is None:
+                break
+            filename, file_info = item
+            try:
+                with tracer.span('file', file=filename, size=file_info['size'], tier=self.tiers[filename]):
+                    self.process_file(filename, file_info)
+                if self.is_downloading and filename not in self.corrupted_files:
+                    self._file_ready(filename)
+            except Exception as e:
+                self._file_failed(filename, file_info, pending, e)
+            finally:
+                self._finish_file(filename, file_info)
+
+    def _file_failed(self, filename: str, file_info: dict, pending: list, error: Exception):
+        """Откладывает файл, который не удалось загрузить, в конец его уровня очереди.
+
+        Остальные файлы при этом продолжают загружаться. После file_retries
+        повторов файл считается не загруженным и попадает в corrupted_files.
+        """
+        if not self.is_downloading:
+            return
+        with self._queue_lock:
+            self._failures[filename] = self._failures.get(filename, 0) + 1
+            retry = self._failures[filename] <= self.file_retries
+            if retry:
+                tier = self.tiers[filename]
+                position = sum(1 for name, _ in pending if self.tiers[name] <= tier)
+                pending.insert(position, (filename, file_info))
+        if retry:
+            tracer.count('file_retries')
+            self.logger.warning(f"Ошибка при загрузке {filename}: {str(error)}. Файл будет загружен повторно позже")
+        else:
+            self.logger.error(f"Ошибка при загрузке {filename}: {str(error)}")
+            self.corrupted_files.append(filename)
+
+    def process_file(self, filename: str, file_info: dict):
+        """Загружает один файл и проверяет его целостность"""
+        local_path = os.path.join(self.game_path, filename)
+
+        # Создаем директории если нужно
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+        if self.object_store and self.object_store.has(file_info['hash'], file_info['size']):
+            object_hash = self.verify_engine.hash_file(
+                self.object_store.path(file_info['hash']), lambda: self.is_downloading
+            )
+            if object_hash == file_info['hash']:
+                tracer.annotate(source='store')
+                self.object_store.materialize(file_info['hash'], local_path)
+                self.verify_cache.store(filename, local_path, file_info['hash'])
+                self.logger.info(f'Файл {filename} взят из общего хранилища')
+                return
+            if not self.is_downloading:
+                return
+            # Объект поврежден - удаляем его и загружаем файл, как если бы его не было
+            self.logger.warning(f'Объект хранилища для {filename} поврежден и будет загружен заново')
+            self.object_store.discard(file_info['hash'])
+            with self._progress_lock:
+                self.total_size += self._transfer_size(filename, file_info)
+
+        if filename in self.patches:
+            tracer.annotate(source='patch')
+            if self.apply_patch(filename, file_info, self.patches[filename]) or not self.is_downloading:
+                return
+            # Патч не подошел - качаем файл целиком вместо патча
+            with self._progress_lock:
+                self.total_size += file_info['size'] - self.patches[filename]['size']
+            if os.path.exists(local_path):
+                os.remove(local_path)
+        if filename in self.repair_blocks:
+            tracer.annotate(source='repair', blocks=len(self.repair_blocks[filename]))
+            self.repair_file_blocks(filename, file_info, self.repair_blocks[filename])
+            return
+
+        # Большие файлы качаем в несколько потоков, остальные - последовательно
+        parallel = self.parallel_segments > 1 and file_info['size'] >= self.parallel_min_size
+        segments = None if parallel else 1
+        hasher = None
+        if self.peers:
+            tracer.annotate(source='peer')
+            temp_path, hasher = self._download_from_peers(filename, local_path, file_info, segments)
+        if hasher is None:
+            tracer.annotate(source='origin')
+            temp_path, hasher = self.download_file_parallel(filename, local_path, file_info['size'], segments)
+        if not self.is_downloading:
+            return
+
+        # Хеш посчитан во время загрузки, повторно файл не читаем
+        if hasher.hexdigest() == file_info['hash']:
+            with tracer.span('file.rename', file=filename):
+                if os.path.exists(local_path):
+                    os.remove(local_path)
+                os.rename(temp_path, local_path)
+                self._file_verified(filename, local_path, file_info)
+            self.logger.info(f'Файл {filename} загружен')
+        else:
+            tracer.count('hash_mismatches')
+            self.corrupted_files.append(filename)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _download_from_peers(self, filename: str, local_path: str, file_info: dict, segments: Optional[int]):
+        """Загружает файл с лаунчеров локальной сети.
+
+        Возвращает (temp_path, hasher) или (None, None), если файл нужно
+        брать с сервера. Если соседи пропали посреди загрузки, полученная
+        часть остается в журнале и сервер докачивает только остаток; файл,
+        не совпавший с манифестом, удаляется целиком.
+        """
+        sources = self.peers.sources(file_info['hash'], file_info['size'])
+        if not sources:
+            return None, None
+        self.logger.info(f"Файл {filename} загружается из локальной сети: {', '.join(sources)}")
+        try:
+            temp_path, hasher = self.download_file_parallel(
+                filename, local_path, file_info['size'], segments, MirrorSet(sources), file_info['hash']
+            )
+        except Exception as e:
+            self.logger.warning(f'Не удалось загрузить {filename} из локальной сети: {e}. Файл будет загружен с сервера')
+            return None, None
+        if self.is_downloading and hasher.hexdigest() != file_info['hash']:
+            self.logger.warning(f'Файл {filename} из локальной сети не совпал с манифестом и будет загружен с сервера')
+            self._add_progress(-file_info['size'])
+            os.remove(temp_path)
+            return None, None
+        return temp_path, hasher
+
+    def apply_patch(self, filename: str, file_info: dict, patch: dict) -> bool:
+        """Потоково применяет патч к локальному файлу.
+
+        Патч читается прямо из ответа сервера, новая версия пишется во
+        временный файл и хешируется по ходу записи. Возвращает False, если
+        патч не удалось применить и файл нужно загрузить целиком; учтенные
+        в прогрессе байты патча тогда вычитаются обратно.
+        """
+        local_path = os.path.join(self.game_path, filename)
+        temp_path = local_path + '.patch.temp'
+        counted = 0  # Байт патча, учтенных в прогрессе
+        applied = False
+        try:
+            with http_pool.get(urljoin(self.mirrors.best().url, patch['url']), stream=True) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                delta = DeltaPatch(response.raw)
+                hasher = StreamHasher(temp_path)
+                with open(temp_path, 'wb') as out:
+                    def write(data):
+                        nonlocal counted
+                        out.write(data)
+                        hasher.update(out.tell() - len(data), data)
+                        self._add_progress(delta.read_size - counted)
+                        counted = delta.read_size
+                    if not delta.apply(local_path, write, lambda: self.is_downloading):
+                        return False
+                self._add_progress(delta.read_size - counted)
+                counted = delta.read_size
+
+            if patch.get('hash') and delta.patch_hash.hexdigest() != patch['hash']:
+                raise ValueError('хеш патча не совпал с манифестом')
+            if hasher.hexdigest() != file_info['hash']:
+                raise ValueError('хеш результата не совпал с манифестом')
+            os.replace(temp_path, local_path)
+            self._file_verified(filename, local_path, file_info)
+            self.logger.info(f'Файл {filename} обновлен патчем ({delta.read_size} байт)')
+            applied = True
+            return True
+        except Exception as e:
+            self.logger.warning(f'Не удалось применить патч к {filename}: {e}. Файл будет загружен целиком')
+            return False
+        finally:
+            if not applied:
+                self._add_progress(-counted)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def repair_file_blocks(self, filename: str, file_info: dict, blocks: list):
+        """Перезагружает поврежденные блоки прямо в существующий файл.
+
+        Каждый блок хешируется при загрузке и сверяется с хешем из манифеста,
+        поэтому после починки весь файл повторно не читается. Файл с жесткими
+        ссылками (объект общего хранилища и другие установки) и файл прежней
+        версии, которым может пользоваться запущенная игра, чинятся в отдельной
+        копии, которая затем заменяет их.
+        """
+        local_path = os.path.join(self.game_path, filename)
+        repair_path = local_path
+        if self.object_store and self.object_store.contains(file_info['hash'], local_path):
+            # Поврежден сам объект хранилища - он больше не раздается, после починки добавится заново
+            self.object_store.discard(file_info['hash'])
+        if os.stat(local_path).st_nlink > 1 or filename in self._outdated:
+            repair_path = local_path + '.repair.temp'
+            clone_file(local_path, repair_path)
+        try:
+            with open(repair_path, 'r+b') as f:
+                f.truncate(file_info['size'])
+                for index in blocks:
+                    start, end = block_range(file_info, index)
+                    for attempt in range(self.max_retries):
+                        if not self.is_downloading:
+                            return
+                        segment = Segment(start, end)
+                        hasher = StreamHasher(repair_path, start=start)
+                        self._fetch_segment(filename, f, segment, hasher)
+                        if not self.is_downloading:
+                            return
+                        if hasher.hexdigest() == file_info['blocks'][index]:
                             break
-                    except Exception as e:
-                        if attempt == self.max_retries - 1:
-                            raise Exception(f"Не удалось загрузить сегмент файла {self.max_retries} попыток")
-                        continue
+                        self.logger.warning(f'Блок {index} файла {filename} не совпал с манифестом, повтор')
+                        self._add_progress(start - end)
+                    else:
+                        self.corrupted_files.append(filename)
+                        return
+            if repair_path != local_path:
+                os.replace(repair_path, local_path)
+        finally:
+            if repair_path != local_path and os.path.exists(repair_path):
+                os.remove(repair_path)
+
+        self._file_verified(filename, local_path, file_info)
+        self.logger.info(f'Файл {filename} восстановлен: перезагружено блоков {len(blocks)}')
+
+    def _file_verified(self, filename: str, local_path: str, file_info: dict):
+        """Запоминает проверенный файл в кэше проверки и в общем хранилище"""
+        self.verify_cache.store(filename, local_path, file_info['hash'])
+        if self.object_store:
+            self.object_store.add(file_info['hash'], local_path)
+
+    def _file_ready(self, filename: str):
+        """Отмечает проверенный файл и сообщает, когда готово все нужное для запуска игры"""
+        self._copy_duplicates(filename)
+        with self._queue_lock:
+            if not self._launch_files:
+                return
+            self._launch_files.discard(filename)
+            self._launch_files.difference_update(name for name, primary in self.duplicates.items() if primary == filename)
+            if self._launch_files:
+                return
+        self.logger.info('Файлы для запуска игры готовы, остальные загружаются в фоне')
+        self.playable_changed.emit(True)
+
+    def _copy_duplicates(self, source: str = None):
+        """Создает файлы, совпадающие по хешу с уже загруженными (только копии source, если он задан)"""
+        with self._queue_lock:
+            items = [
+                (filename, primary) for filename, primary in self.duplicates.items()
+                if filename not in self._copied and source in (None, primary)
+            ]
+            self._copied.update(filename for filename, _ in items)
+        for filename, primary in items:
+            if primary in self.corrupted_files:
+                self.corrupted_files.append(filename)
+                continue
+            file_info = self.files_to_process[filename]
+            local_path = os.path.join(self.game_path, filename)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            if self.object_store:
+                self.object_store.materialize(file_info['hash'], local_path)
+            else:
+                clone_file(os.path.join(self.game_path, primary), local_path + '.temp')
+                os.replace(local_path + '.temp', local_path)
+            self.verify_cache.store(filename, local_path, file_info['hash'])
+            self.logger.info(f'Файл {filename} совпадает с {primary}, скопирован без загрузки')
 
-        return temp_path                      
-                              
     def run(self):
+        span = tracer.start('download', repair=bool(self.specific_files))
         try:
-            self.check_existing_files()
+            with tracer.span('check_existing'):
+                self.check_existing_files()
+            self.mirrors = MirrorSet((self.manifest.mirrors or [self.download_url]) + self.extra_mirrors)
+            if self.object_store:
+                self.object_store.register(self.game_path)
+
+            # Файлы с одинаковым хешем загружаются один раз
+            first_by_hash = {}
+            for filename, file_info in self.files_to_process.items():
+                if filename in self.patches or filename in self.repair_blocks:
+                    continue
+                primary = first_by_hash.setdefault(file_info['hash'], filename)
+                if primary != filename:
+                    self.duplicates[filename] = primary
             
             # Вычисляем общий размер файлов для загрузки
-            self.total_size = sum(file_info['size'] for file_info in self.files_to_process.values())
-            self.total_downloaded = 0
+            self.total_size = sum(
+                self._transfer_size(filename, file_info) for filename, file_info in self.files_to_process.items()
+                if filename not in self.duplicates
+            )
+            self.telemetry.reset(self.total_size)
 
             if len(self.files_to_process) == 0:
+               self.completed = True
+               if not self.specific_files:
+                   self.manifest_store.mark_synced(self.manifest)
                self.update_status.emit('Все файлы актуальны')
-               self.update_progress.emit(1.0)  # Устанавливаем полный прогресс
                return
-            
-            for filename, file_info in self.files_to_process.items():
-                if not self.is_downloading:
-                    break
 
-                self.update_file_name.emit(filename)
-                local_path = os.path.join(self.game_path, filename)
-            
-                # Создаем директории если нужно
-                os.makedirs(os.path.dirname(local_path), exist_ok=True)
-                
-                # Загружаем файлы сегментами
-                temp_path = self.download_file_segmented(
-                    f'http://dl.neix.ru/{filename}',
-                    local_path,
-                    file_info['size']
-                )
+            # Сначала файлы для запуска игры, затем для игрового процесса, затем необязательные.
+            # Внутри уровня крупные файлы идут первыми, мелкие заполняют свободные потоки
+            self.tiers = {filename: manifest_tier(filename, file_info) for filename, file_info in self.files_to_process.items()}
+            for filename, primary in self.duplicates.items():
+                # Файл загружается за все свои копии, поэтому получает самый высокий из их уровней
+                self.tiers[primary] = min(self.tiers[primary], self.tiers[filename])
+            # Играть нельзя, только пока файла для запуска нет или он поврежден;
+            # файл прежней версии заменяется целиком после загрузки и игре не мешает
+            self._launch_files = {
+                filename for filename, tier in self.tiers.items()
+                if tier == TIER_LAUNCH and filename not in self._outdated
+            }
+            self.playable_changed.emit(not self._launch_files)
+            pending = sorted(
+                (item for item in self.files_to_process.items() if item[0] not in self.duplicates),
+                key=lambda item: (self.tiers[item[0]], -item[1]['size'])
+            )
+            self.mirrors.probe(pending[0][0])
+            workers = [
+                threading.Thread(target=self._download_worker, args=(pending,), daemon=True)
+                for _ in range(min(self.max_parallel_files, len(pending)))
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
 
-                # Проверяем целостность файла
-                if self.verify_checksum(temp_path, file_info['hash']):
-                    if os.path.exists(local_path):
-                        os.remove(local_path)
-                    os.rename(temp_path, local_path)
-                else:
-                    self.corrupted_files.append(filename)
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
+            stats = http_pool.stats()
+            self.logger.info(
+                f"HTTP: запросов {stats['requests']}, соединений {stats['connections']}, "
+                f"повторно использовано {stats['reused']}"
+            )
+            for mirror in self.mirrors.mirrors:
+                self.logger.info(f'Зеркало {mirror.url}: скорость {format_speed(mirror.speed)}, ошибок подряд {mirror.failures}')
+            tracer.gauge('http_connections', stats['connections'])
+            tracer.gauge('http_connections_reused', stats['reused'])
 
             if self.is_downloading:
+                self._copy_duplicates()
+                self.completed = not self.corrupted_files
+                if self.completed and not self.specific_files:
+                    self.manifest_store.mark_synced(self.manifest)
                 status = 'Загрузка успешно завершена!' if not self.corrupted_files else 'Загрузка завершена с ошибками'
                 self.update_status.emit(status)
 
         except Exception as e:
             self.logger.error(f"Ошибка при загрузке: {str(e)}")
+            self.error = str(e)
             self.update_status.emit(f'Ошибка: {str(e)}')
         finally:
+            if self.verify_cache:
+                self.verify_cache.save()
+            tracer.end(span, self.error, files=len(self.files_to_process), bytes=self.total_downloaded,
+                       corrupted=len(self.corrupted_files), completed=self.completed)
+            tracer.export()
             self.finished.emit()
 
+AUTH_LOGON_CHALLENGE = 0x00
+
+
+def build_logon_challenge(account: str = 'LAUNCHER', build: int = 12340) -> bytes:
+    """Пакет AUTH_LOGON_CHALLENGE клиента 3.3.5a.
+
+    Строковые поля (игра, платформа, ОС, язык) клиент передает
+    развернутыми, как little-endian fourcc.
+    """
+    name = account.upper().encode('ascii')
+    body = struct.pack(
+        '<4s3BH4s4s4sIIB',
+        b'WoW\0', 3, 3, 5, build, b'68x\0', b'niW\0', b'SUne', 0,
+        struct.unpack('<I', socket.inet_aton('127.0.0.1'))[0], len(name)
+    ) + name
+    return struct.pack('<BBH', AUTH_LOGON_CHALLENGE, 8, len(body)) + body
+
+
+class EndpointStats:
+    """Адрес auth или world сервера и история задержек до него.
+
+    Если включен logon_probe, задержкой считается время ответа сервера
+    на AUTH_LOGON_CHALLENGE, а не время установки TCP-соединения.
+    """
+
+    def __init__(self, address: str, default_port: int, history: int = 50, logon_probe: bool = False):
+        host, _, port = address.rpartition(':')
+        self.host = host or address
+        self.port = int(port) if host else default_port
+        self.logon_probe = logon_probe
+        self.rtts = deque(maxlen=history)  # Время установки соединения, секунды
+        self.online = False
+        self.failures = 0  # Неудачных проверок подряд
+        self.next_check = 0.0
+
+    def record(self, rtt: float):
+        self.rtts.append(rtt)
+        self.online = True
+        self.failures = 0
+
+    def fail(self):
+        self.online = False
+        self.failures += 1
+
+    def percentile(self, q: float) -> float:
+        if not self.rtts:
+            return -1
+        values = sorted(self.rtts)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def to_dict(self) -> dict:
+        """Состояние адреса для интерфейса, задержки в миллисекундах"""
+        return {
+            'address': f'{self.host}:{self.port}',
+            'probe': 'logon' if self.logon_probe else 'tcp',
+            'online': self.online,
+            'last': round(self.rtts[-1] * 1000) if self.rtts else -1,
+            'p50': round(self.percentile(0.5) * 1000) if self.rtts else -1,
+            'p95': round(self.percentile(0.95) * 1000) if self.rtts else -1
+        }
+
+
 class ServerChecker(QThread):
+    """Опрашивает auth и world серверы всех realm-ов в цикле asyncio.
+
+    Все адреса проверяются одновременно, время установки соединения
+    копится в истории для p50/p95. Доступные адреса проверяются каждые
+    interval секунд, недоступные - все реже, с удвоением паузы до
+    max_interval.
+    """
     status_changed = pyqtSignal(bool, str)
+    realms_updated = pyqtSignal(list)
+    # logon_probe: проверять auth сервер запросом AUTH_LOGON_CHALLENGE
+    DEFAULT_REALMS = [{'name': 'x2 WotLK', 'auth': '127.0.0.1:3724', 'world': '127.0.0.1:8085', 'logon_probe': False}]
 
-    def __init__(self, auth_host='127.0.0.1', auth_port=3724, world_host='127.0.0.1', world_port=8085):
+    def __init__(self, realms: list = None, interval: float = 5.0, max_interval: float = 60.0, timeout: float = 2.0):
         super().__init__()
-        self.auth_host = auth_host
-        self.auth_port = auth_port
-        self.world_host = world_host
-        self.world_port = world_port
+        self.realms = [
+            {
+                'name': realm.get('name', realm['auth']),
+                'auth': EndpointStats(realm['auth'], 3724, logon_probe=realm.get('logon_probe', False)),
+                'world': EndpointStats(realm['world'], 8085)
+            }
+            for realm in (realms or self.DEFAULT_REALMS)
+        ]
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
         self.is_running = True
-        self.logger = logging.getLogger(__name__)
+        self.logger = logging.getLogger('launcher.servers')
+        self._loop = None
+        self._wakeup = None
+
+    @property
+    def auth_host(self) -> str:
+        return self.realms[0]['auth'].host
+
+    @property
+    def auth_port(self) -> int:
+        return self.realms[0]['auth'].port
+
+    def _endpoints(self) -> list:
+        return [realm[kind] for realm in self.realms for kind in ('auth', 'world')]
 
-    def check_port(self, host: str, port: int) -> bool:
+    async def check_endpoint(self, endpoint: EndpointStats):
+        import asyncio
+        started = time.monotonic()
         try:
-            with socket.create_connection((host, port), timeout=2):
-                return True
-        except (socket.timeout, socket.error):
-            return False
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(endpoint.host, endpoint.port), self.timeout)
+            try:
+                if endpoint.logon_probe:
+                    endpoint.record(await self.check_logon(reader, writer))
+                else:
+                    endpoint.record(time.monotonic() - started)
+            finally:
+                writer.close()
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            if endpoint.online:
+                self.logger.warning(f'Сервер {endpoint.host}:{endpoint.port} не отвечает: {e!r}')
+            endpoint.fail()
+        address = f'{endpoint.host}:{endpoint.port}'
+        tracer.count('server_probes', endpoint=address, online=endpoint.online)
+        tracer.gauge('server_online', int(endpoint.online), endpoint=address)
+        if endpoint.online:
+            tracer.gauge('server_latency_seconds', endpoint.rtts[-1], endpoint=address)
+            endpoint.next_check = time.monotonic() + self.interval
+        else:
+            endpoint.next_check = time.monotonic() + min(self.max_interval, self.interval * 2 ** (endpoint.failures - 1))
 
-    def run(self):
+    async def check_logon(self, reader, writer) -> float:
+        """Отправляет AUTH_LOGON_CHALLENGE и ждет ответа сервера.
+
+        Используется несуществующая учетная запись: любой код результата
+        в ответе означает, что authserver принимает логины.
+        """
+        import asyncio
+        started = time.monotonic()
+        writer.write(build_logon_challenge())
+        await writer.drain()
+        reply = await asyncio.wait_for(reader.readexactly(3), self.timeout)
+        if reply[0] != AUTH_LOGON_CHALLENGE:
+            raise ValueError(f'неожиданный ответ authserver: {reply.hex()}')
+        return time.monotonic() - started
+
+    def _emit_status(self):
+        realms = []
+        for realm in self.realms:
+            auth, world = realm['auth'].to_dict(), realm['world'].to_dict()
+            realms.append({'name': realm['name'], 'online': auth['online'] or world['online'], 'auth': auth, 'world': world})
+        self.realms_updated.emit(realms)
+
+        # В строке статуса - первый realm и медианная задержка до него
+        auth, world = realms[0]['auth'], realms[0]['world']
+        if auth['online'] and world['online']:
+            self.status_changed.emit(True, f"{world['p50']} мс")
+        elif auth['online']:
+            self.status_changed.emit(True, f"Auth сервер {auth['p50']} мс")
+        elif world['online']:
+            self.status_changed.emit(True, f"World сервер {world['p50']} мс")
+        else:
+            self.status_changed.emit(False, "Offline")
+
+    async def _main(self):
+        import asyncio
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        endpoints = self._endpoints()
         while self.is_running:
-            auth_status = self.check_port(self.auth_host, self.auth_port)
-            world_status = self.check_port(self.world_host, self.world_port)
-
-            if auth_status and world_status:
-                self.status_changed.emit(True, "Оба сервера")
-            elif auth_status:
-                self.status_changed.emit(True, "Auth сервер")
-            elif world_status:
-                self.status_changed.emit(True, "World сервер")
-            else:
-                self.status_changed.emit(False, "Offline")
+            now = time.monotonic()
+            due = [endpoint for endpoint in endpoints if endpoint.next_check <= now]
+            if due:
+                await asyncio.gather(*(self.check_endpoint(endpoint) for endpoint in due))
+                self._emit_status()
+            delay = min(endpoint.next_check for endpoint in endpoints) - time.monotonic()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0, delay))
+            except asyncio.TimeoutError:
+                pass
 
-            time.sleep(5)
+    def run(self):
+        import asyncio  # Импортируется в потоке проверки, а не при запуске лаунчера
+        asyncio.run(self._main())
 
     def stop(self):
         self.is_running = False
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
 
 class Settings(QObject):
     settingsChanged = pyqtSignal()
+    # Значения пунктов speedLimit в SettingsDialog.qml, Мбит/с (0 - без ограничений)
+    SPEED_LIMITS = [0, 1, 2, 5, 10]
+    SPEED_LIMIT_AUTO = 5
     
     def __init__(self):
         super().__init__()
@@ -307,6 +3153,14 @@ class Settings(QObject):
             'autostart': False,
             'closeOnLaunch': True,
             'speedLimit': 0,
+            'parallelDownloads': 4,
+            'parallelSegments': 4,
+            'mirrors': [],  # Дополнительные зеркала загрузки к указанным в манифесте
+            'realms': ServerChecker.DEFAULT_REALMS,  # [{'name', 'auth': 'host:port', 'world': 'host:port'}]
+            'objectStore': '',  # Общее хранилище файлов для нескольких установок (пусто - не используется)
+            'lanCache': False,  # Раздавать файлы клиента лаунчерам в локальной сети и брать их у них
+            'peers': [],  # Адреса лаунчеров 'host:port', опрашиваемые без поиска в сети
+            'logLevels': {},  # Уровни логирования по подсистемам поверх LOG_LEVELS
             'autoUpdate': True,
             'slideInterval': 5,
             'showNotifications': True,
@@ -355,6 +3209,71 @@ class Settings(QObject):
             self._settings['speedLimit'] = value
             self.settingsChanged.emit()
     
+    @pyqtProperty(int, notify=settingsChanged)
+    def parallelDownloads(self): return self._settings['parallelDownloads']
+    @parallelDownloads.setter
+    def parallelDownloads(self, value):
+        if self._settings['parallelDownloads'] != value:
+            self._settings['parallelDownloads'] = value
+            self.settingsChanged.emit()
+    
+    @pyqtProperty(int, notify=settingsChanged)
+    def parallelSegments(self): return self._settings['parallelSegments']
+    @parallelSegments.setter
+    def parallelSegments(self, value):
+        if self._settings['parallelSegments'] != value:
+            self._settings['parallelSegments'] = value
+            self.settingsChanged.emit()
+    
+    @pyqtProperty('QVariantList', notify=settingsChanged)
+    def mirrors(self): return self._settings['mirrors']
+    @mirrors.setter
+    def mirrors(self, value):
+        if self._settings['mirrors'] != value:
+            self._settings['mirrors'] = value
+            self.settingsChanged.emit()
+    
+    @pyqtProperty('QVariantList', notify=settingsChanged)
+    def realms(self): return self._settings['realms']
+    @realms.setter
+    def realms(self, value):
+        if self._settings['realms'] != value:
+            self._settings['realms'] = value
+            self.settingsChanged.emit()
+    
+    @pyqtProperty(str, notify=settingsChanged)
+    def objectStore(self): return self._settings['objectStore']
+    @objectStore.setter
+    def objectStore(self, value):
+        if self._settings['objectStore'] != value:
+            self._settings['objectStore'] = value
+            self.settingsChanged.emit()
+    
+    @pyqtProperty(bool, notify=settingsChanged)
+    def lanCache(self): return self._settings['lanCache']
+    @lanCache.setter
+    def lanCache(self, value):
+        if self._settings['lanCache'] != value:
+            self._settings['lanCache'] = value
+            self.settingsChanged.emit()
+    
+    @pyqtProperty('QVariantList', notify=settingsChanged)
+    def peers(self): return self._settings['peers']
+    @peers.setter
+    def peers(self, value):
+        if self._settings['peers'] != value:
+            self._settings['peers'] = value
+            self.settingsChanged.emit()
+    
+    @pyqtProperty('QVariantMap', notify=settingsChanged)
+    def logLevels(self): return self._settings['logLevels']
+    @logLevels.setter
+    def logLevels(self, value):
+        if self._settings['logLevels'] != value:
+            self._settings['logLevels'] = value
+            apply_log_levels(value)
+            self.settingsChanged.emit()
+    
     @pyqtProperty(bool, notify=settingsChanged)
     def autoUpdate(self): return self._settings['autoUpdate']
     @autoUpdate.setter
@@ -398,30 +3317,149 @@ class Settings(QObject):
             self.settingsChanged.emit()
             self.save_settings()
 
+class ImageCache:
+    """Кэш изображений, уменьшенных до размера отображения.
+
+    Готовые изображения хранятся в памяти и на диске, при превышении
+    лимитов вытесняются давно не использованные (LRU). Ключ включает
+    размер и время изменения исходного файла, поэтому замена картинки
+    сбрасывает кэш. Удаленные изображения (http/https) загружаются через
+    общий HTTP-пул и обновляются не чаще раза в remote_max_age секунд.
+    """
+
+    def __init__(self, cache_dir: str, base_dir: str, memory_limit: int = 64 * 1024 * 1024,
+                 disk_limit: int = 128 * 1024 * 1024, remote_max_age: float = 24 * 3600):
+        self.cache_dir = cache_dir
+        self.base_dir = base_dir  # Относительные пути считаются от папки main.qml
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.remote_max_age = remote_max_age
+        self.logger = logging.getLogger('launcher.ui')
+        self._memory = OrderedDict()  # ключ -> QImage, последний использованный в конце
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, source: str, width: int, height: int, crop: bool = False) -> QImage:
+        """Изображение source, вписанное в width x height (crop - заполняющее его)"""
+        key = self._key(source, width, height, crop)
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                return image
+
+        path = os.path.join(self.cache_dir, key + '.img')
+        image = QImage(path) if os.path.exists(path) else QImage()
+        if not image.isNull():
+            os.utime(path)  # Время доступа для LRU на диске
+        else:
+            image = self._load_source(source)
+            if image.isNull():
+                self.logger.warning(f'Не удалось загрузить изображение {source}')
+                return image
+            if width > 0 and height > 0 and (image.width() > width or image.height() > height):
+                mode = Qt.KeepAspectRatioByExpanding if crop else Qt.KeepAspectRatio
+                image = image.scaled(width, height, mode, Qt.SmoothTransformation)
+            self._store_disk(path, image)
+
+        with self._lock:
+            self._memory[key] = image
+            self._memory_size += image.sizeInBytes()
+            while self._memory_size > self.memory_limit and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= evicted.sizeInBytes()
+        return image
+
+    def _key(self, source: str, width: int, height: int, crop: bool) -> str:
+        if source.startswith(('http://', 'https://')):
+            version = int(time.time() // self.remote_max_age)
+        else:
+            try:
+                stat = os.stat(self._local_path(source))
+                version = f'{stat.st_size}-{stat.st_mtime_ns}'
+            except OSError:
+                version = 'missing'
+        raw = f'{source}|{width}x{height}|{"crop" if crop else "fit"}|{version}'
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _local_path(self, source: str) -> str:
+        if source.startswith('file:'):
+            return QUrl(source).toLocalFile()
+        return os.path.join(self.base_dir, source)
+
+    def _load_source(self, source: str) -> QImage:
+        if source.startswith(('http://', 'https://')):
+            try:
+                with http_pool.get(source) as response:
+                    response.raise_for_status()
+                    return QImage.fromData(response.content)
+            except Exception as e:
+                self.logger.warning(f'Ошибка загрузки изображения {source}: {e}')
+                return QImage()
+        return QImage(self._local_path(source))
+
+    def _store_disk(self, path: str, image: QImage):
+        temp_path = path + '.tmp'
+        # Фотографии без прозрачности хранятся в JPEG - так кэш в разы меньше
+        if not image.save(temp_path, 'PNG' if image.hasAlphaChannel() else 'JPG', 92):
+            return
+        os.replace(temp_path, path)
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.img'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_path in sorted(entries):
+                if total <= self.disk_limit:
+                    break
+                try:
+                    os.remove(entry_path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+class ImageProvider(QQuickImageProvider):
+    """Источник image://assets/fit/<путь> и image://assets/crop/<путь> для QML.
+
+    Путь или адрес изображения передается через encodeURIComponent.
+    Размер берется из sourceSize элемента Image. Загрузка всегда идет в
+    потоке загрузчика изображений QML, не блокируя интерфейс.
+    """
+
+    def __init__(self, cache: ImageCache):
+        super().__init__(QQuickImageProvider.Image, QQuickImageProvider.ForceAsynchronousImageLoading)
+        self.cache = cache
+
+    def requestImage(self, image_id, requested_size):
+        mode, _, source = image_id.partition('/')
+        source = QUrl.fromPercentEncoding(source.encode('utf-8'))
+        image = self.cache.get(source, requested_size.width(), requested_size.height(), crop=mode == 'crop')
+        return image, image.size()
+
+
 class LauncherBackend(QObject):
     # Сигналы
     statusTextChanged = pyqtSignal()
     gamePathChanged = pyqtSignal()
     isDownloadingChanged = pyqtSignal()
-    downloadProgressChanged = pyqtSignal()
-    downloadSpeedChanged = pyqtSignal()
-    currentFileNameChanged = pyqtSignal()
+    downloadStatsChanged = pyqtSignal()
     currentImageChanged = pyqtSignal()
     canPlayChanged = pyqtSignal()
     serverStatusChanged = pyqtSignal()
     isServerOnlineChanged = pyqtSignal()
+    realmStatsChanged = pyqtSignal()
     versionChanged = pyqtSignal()
     notificationRequested = pyqtSignal(str, str)  # message, type
-    downloadSizeInfoChanged = pyqtSignal() # новый сигнал
 
     def __init__(self, config_manager):
         super().__init__()
-        self.logger = logging.getLogger(__name__)
+        self.logger = logging.getLogger('launcher.ui')
         self._config_manager = config_manager
         self._download_manager = None
-        self._server_checker = ServerChecker()
-        self._server_checker.status_changed.connect(self._handle_server_status)
-        self._server_checker.start()
         
         # Сохраняем ссылку на engine
         self.engine = None  # Будет установлено позже
@@ -429,14 +3467,13 @@ class LauncherBackend(QObject):
         # Инициализация свойств
         self._game_path = config_manager.game_path or ""
         self._is_downloading = False
-        self._download_progress = 0.0
-        self._download_speed = ""
-        self._current_file_name = ""
+        self._download_stats = {}  # Последний снимок TransferTelemetry
         self._current_image = "images/slide/1.jpg"
         self._can_play = False
         self._server_status = "⚫ Offline"
         self._is_server_online = False
-        self._version = "3.3.5"
+        self._realm_stats = []  # Задержки до серверов всех realm-ов
+        self._version = config_manager.current_version
         self._status_text = "Пожалуйста, выберите папку с игрой"  # Инициализируем значение по умолчанию
         
         # Инициализация слайд-шоу
@@ -447,9 +3484,6 @@ class LauncherBackend(QObject):
             "qml/images/slide4.jpg"
         ]
         
-        # Проверяем возможность игры при старте
-        self._check_can_play()
-
         # Подключаем сигнал к QML
         self.notificationRequested.connect(
             lambda msg, type: QMetaObject.invokeMethod(
@@ -461,8 +3495,28 @@ class LauncherBackend(QObject):
         )
 
         self._settings = Settings()
+        apply_log_levels(self._settings.logLevels)
+        self._server_checker = ServerChecker(self._settings.realms)
+        self._server_checker.status_changed.connect(self._handle_server_status)
+        self._server_checker.realms_updated.connect(self._handle_realm_stats)
         self._file_verifier = None
-        self._download_size_info = ""
+        self._tray_icon = None
+        self._peer_cache = None
+        self._game_running = False  # Пока идет игра, загрузка работает в фоне
+        self._speed_limit = None  # Последний примененный speedLimit
+
+    def start_background_services(self):
+        """Инициализация, которая не нужна для первого кадра окна.
+
+        Вызывается после того, как окно показано: проверка папки с игрой,
+        опрос серверов, ограничение скорости и значок в трее.
+        """
+        self._check_can_play()
+        self._server_checker.start()
+        self._settings.settingsChanged.connect(self._apply_speed_limit)
+        self._apply_speed_limit()
+        self._settings.settingsChanged.connect(self._apply_lan_cache)
+        self._apply_lan_cache()
 
         # Инициализация трея
         self._tray_icon = QSystemTrayIcon()
@@ -500,6 +3554,8 @@ class LauncherBackend(QObject):
     def gamePath(self, value):
         if self._game_path != value:
             self._game_path = value
+            if self._peer_cache:
+                self._peer_cache.game_path = value
             self.gamePathChanged.emit()
 
     @pyqtProperty(bool, notify=isDownloadingChanged)
@@ -510,29 +3566,13 @@ class LauncherBackend(QObject):
             self._is_downloading = value
             self.isDownloadingChanged.emit()
 
-    @pyqtProperty(float, notify=downloadProgressChanged)
-    def downloadProgress(self): return self._download_progress
-    @downloadProgress.setter
-    def downloadProgress(self, value):
-        if self._download_progress != value:
-            self._download_progress = value
-            self.downloadProgressChanged.emit()
-
-    @pyqtProperty(str, notify=downloadSpeedChanged)
-    def downloadSpeed(self): return self._download_speed
-    @downloadSpeed.setter
-    def downloadSpeed(self, value):
-        if self._download_speed != value:
-            self._download_speed = value
-            self.downloadSpeedChanged.emit()
-
-    @pyqtProperty(str, notify=currentFileNameChanged)
-    def currentFileName(self): return self._current_file_name
-    @currentFileName.setter
-    def currentFileName(self, value):
-        if self._current_file_name != value:
-            self._current_file_name = value
-            self.currentFileNameChanged.emit()
+    @pyqtProperty('QVariantMap', notify=downloadStatsChanged)
+    def downloadStats(self): return self._download_stats
+    @downloadStats.setter
+    def downloadStats(self, value):
+        if self._download_stats != value:
+            self._download_stats = value
+            self.downloadStatsChanged.emit()
 
     @pyqtProperty(str, notify=currentImageChanged)
     def currentImage(self): return self._current_image
@@ -566,8 +3606,21 @@ class LauncherBackend(QObject):
             self._is_server_online = value
             self.isServerOnlineChanged.emit()
 
+    @pyqtProperty('QVariantList', notify=realmStatsChanged)
+    def realmStats(self): return self._realm_stats
+    @realmStats.setter
+    def realmStats(self, value):
+        if self._realm_stats != value:
+            self._realm_stats = value
+            self.realmStatsChanged.emit()
+
     @pyqtProperty(str, notify=versionChanged)
     def version(self): return self._version
+    @version.setter
+    def version(self, value):
+        if self._version != value:
+            self._version = value
+            self.versionChanged.emit()
 
     @pyqtProperty(list)
     def slides(self):
@@ -577,14 +3630,6 @@ class LauncherBackend(QObject):
     def settings(self):
         return self._settings
     
-    @pyqtProperty(str, notify=downloadSizeInfoChanged)
-    def downloadSizeInfo(self): return self._download_size_info
-    @downloadSizeInfo.setter
-    def downloadSizeInfo(self, value):
-        if self._download_size_info != value:
-            self._download_size_info = value
-            self.downloadSizeInfoChanged.emit()
-
     @pyqtSlot()
     def selectGamePath(self):
         try:
@@ -615,9 +3660,7 @@ class LauncherBackend(QObject):
                 self._download_manager = None
             self.isDownloading = False
             self.statusText = "Загрузка остановлена"
-            self.downloadProgress = 0.0
-            self.downloadSpeed = ""
-            self.currentFileName = ""
+            self.downloadStats = {}
             return
 
         if not self.gamePath:
@@ -626,13 +3669,21 @@ class LauncherBackend(QObject):
 
         self.isDownloading = True
         self.statusText = "Начало загрузки..."
-        self._download_manager = DownloadManager("http://you.url.com/client.json", self.gamePath)
-        self._download_manager.update_progress.connect(self._handle_progress)
+        self._download_manager = DownloadManager(
+            MANIFEST_URL,
+            self.gamePath,
+            max_parallel_files=self._settings.parallelDownloads,
+            parallel_segments=self._settings.parallelSegments,
+            mirrors=self._settings.mirrors,
+            object_store=self._object_store(),
+            peers=self._peer_cache
+        )
+        self._download_manager.telemetry_updated.connect(self._handle_telemetry)
         self._download_manager.update_status.connect(self._handle_status)
-        self._download_manager.update_file_name.connect(self._handle_filename)
-        self._download_manager.update_speed.connect(self._handle_speed)
+        self._download_manager.playable_changed.connect(self._handle_playable)
         self._download_manager.finished.connect(self._handle_download_finished)
-        self._download_manager.update_size_info.connect(self._handle_size_info)
+        if self._game_running:
+            self._download_manager.set_background(True)
         self._download_manager.start()
 
     @pyqtSlot()
@@ -640,6 +3691,8 @@ class LauncherBackend(QObject):
         if not self.canPlay:
             return
             
+        span = tracer.start('game.launch', system=platform.system(), emulator=self._settings.linuxEmulator)
+        error = None
         try:
             game_exe = os.path.join(self.gamePath, "Wow.exe")
             game_process = None
@@ -660,10 +3713,10 @@ class LauncherBackend(QObject):
                     game_process = subprocess.Popen(['crossover', game_exe])
 
             self.statusText = "Игра запущена"        
-
-            # Сворачиваем в трей если включена настройка
-            if self._settings.closeOnLaunch:
-                self.minimizeToTray()
+            if game_process:
+                span.attrs['pid'] = game_process.pid
+                # Оставшиеся файлы загружаются дальше, но уступают канал игре
+                self._set_game_running(True)
 
                 # Запускаем мониторинг процесса игры в отдельном потоке
                 monitor_thread = threading.Thread(
@@ -673,13 +3726,26 @@ class LauncherBackend(QObject):
                 )
                 monitor_thread.start()
 
+            # Сворачиваем в трей если включена настройка
+            if self._settings.closeOnLaunch:
+                self.minimizeToTray()
+
         except Exception as e:
+            error = e
             self.statusText = f"Ошибка при запуске игры: {str(e)}"
+        finally:
+            tracer.end(span, error)
+            tracer.count('game_launches', ok=error is None)
+            tracer.export()
 
     def _monitor_game_process(self, process):
         """Мониторит процесс игры и разворачивает лаунчер после завершения"""
         try:
             process.wait() # Ждем завершения процесса игры
+            tracer.count('game_exits', code=process.returncode)
+            QMetaObject.invokeMethod(self, "game_exited", Qt.QueuedConnection)
+            if not self._settings.closeOnLaunch:
+                return
             # разворачиваем лаунчер
             QMetaObject.invokeMethod(
                 self,
@@ -696,6 +3762,26 @@ class LauncherBackend(QObject):
         except Exception as e:
             self.logger.error(f"Ошибка при мониторинге процесса игры: {str(e)}")
 
+    @pyqtSlot()
+    def game_exited(self):
+        self._set_game_running(False)
+
+    def _set_game_running(self, running: bool):
+        """Пока идет игра, загрузка продолжается с пониженным приоритетом.
+
+        Число соединений ограничивается, а если скорость не ограничена
+        вручную, она подбирается по задержке до игрового сервера.
+        """
+        self._game_running = running
+        if self._download_manager:
+            self._download_manager.set_background(running)
+        self._apply_speed_limit(force=True)
+
+    def _handle_playable(self, playable):
+        if playable and not self.canPlay and self.isDownloading:
+            self.notificationRequested.emit("Игра готова к запуску, остальные файлы загружаются в фоне", "success")
+        self.canPlay = playable
+
     def _check_can_play(self):
         if self.gamePath:
             if os.path.exists(os.path.join(self.gamePath, "Wow.exe")):
@@ -708,27 +3794,18 @@ class LauncherBackend(QObject):
             self.canPlay = False
             self.statusText = "Пожалуйста, выберите папку с игрой"
 
-    def _handle_progress(self, progress):
-        self.downloadProgress = progress
+    def _handle_telemetry(self, stats):
+        self.downloadStats = stats
 
     def _handle_status(self, status):
         self.statusText = status
 
-    def _handle_filename(self, filename):
-        self.currentFileName = filename
-
-    def _handle_speed(self, speed):
-        self.downloadSpeed = speed
-
     def _handle_download_finished(self):
         self.isDownloading = False
         self._check_can_play()
 
         # Сбрасываем прогресс и скорость при завершении
-        self.downloadProgress = 0.0
-        self.downloadSpeed = ""
-        self.currentFileName = ""
-        self.downloadSizeInfo = "" # Сбрасываем информацию о размере
+        self.downloadStats = {}
 
         if self._download_manager and self._download_manager.corrupted_files:
             corrupted = len(self._download_manager.corrupted_files)
@@ -741,6 +3818,10 @@ class LauncherBackend(QObject):
                 "Загрузка завершена успешно",
                 "success"
             )
+            # Клиент полностью соответствует манифесту - запоминаем его версию
+            if self._download_manager and self._download_manager.completed and self._download_manager.manifest_version:
+                self._config_manager.save_current_version(self._download_manager.manifest_version)
+                self.version = self._download_manager.manifest_version
         
         self._download_manager = None
 
@@ -748,6 +3829,13 @@ class LauncherBackend(QObject):
         self.isServerOnline = is_online
         self.serverStatus = f"{'🟢' if is_online else '⚫'} {status}"
 
+    def _object_store(self):
+        """Общее хранилище файлов из настроек"""
+        return ObjectStore(self._settings.objectStore) if self._settings.objectStore else None
+
+    def _handle_realm_stats(self, realms):
+        self.realmStats = realms
+
     def _handle_error(self, error_msg):
         self.logger.error(error_msg)
         self.notificationRequested.emit(error_msg, "error")
@@ -769,18 +3857,23 @@ class LauncherBackend(QObject):
                 subprocess.Popen(['xdg-open', self.gamePath])
 
     @pyqtSlot()
-    def verifyFiles(self):
+    def verifyFiles(self, deep=False):
         if not self.isDownloading and self.gamePath:
             self.statusText = "Проверка файлов..."
-            self._file_verifier = FileVerifier("http://you.url.com/client.json", self.gamePath)
+            self._file_verifier = FileVerifier(MANIFEST_URL, self.gamePath, deep)
             self._file_verifier.progress_changed.connect(self._handle_verify_progress)
             self._file_verifier.status_changed.connect(self._handle_status)
             self._file_verifier.verification_complete.connect(self._handle_verify_complete)
             self._file_verifier.start()
             self.notificationRequested.emit("Проверка файлов начата", "info")
+
+    @pyqtSlot()
+    def deepVerifyFiles(self):
+        """Полная проверка: хешируются все файлы, даже не менявшиеся с прошлой проверки"""
+        self.verifyFiles(deep=True)
     
     def _handle_verify_progress(self, progress):
-        self.downloadProgress = progress
+        self.downloadStats = {'progress': progress}
     
     def _handle_verify_complete(self, corrupted_files):
         if corrupted_files:
@@ -790,36 +3883,44 @@ class LauncherBackend(QObject):
                 "error"
             )
             # Спрашиваем пользователя о восстановлении
-            self.repairClient(corrupted_files)
+            self.repairClient(corrupted_files, self._file_verifier.damaged_blocks, self._file_verifier.manifest)
         else:
             self.statusText = "Проверка завершена. Все файлы в порядке"
             self.notificationRequested.emit(
                 "Проверка завершена. Все файлы в порядке",
                 "success"
             )
-        self.downloadProgress = 0.0
+        self.downloadStats = {}
     
     @pyqtSlot()
-    def repairClient(self, files_to_repair=None):
+    def repairClient(self, files_to_repair=None, damaged_blocks=None, manifest=None):
         if not self.isDownloading and self.gamePath:
             self.statusText = "Восстановление клиента..."
             # Если список файлов не передан, проверяем все файлы
             if files_to_repair is None:
-                self.verifyFiles()
+                self.verifyFiles(deep=True)
                 return
             
             # Запускаем загрузку только поврежденных файлов
             self.isDownloading = True
             self._download_manager = DownloadManager(
-                "http://you.url.com/client.json",
+                MANIFEST_URL,
                 self.gamePath,
-                files_to_repair
+                files_to_repair,
+                max_parallel_files=self._settings.parallelDownloads,
+                parallel_segments=self._settings.parallelSegments,
+                mirrors=self._settings.mirrors,
+                object_store=self._object_store(),
+                peers=self._peer_cache,
+                repair_blocks=damaged_blocks,
+                manifest=manifest
             )
-            self._download_manager.update_progress.connect(self._handle_progress)
+            self._download_manager.telemetry_updated.connect(self._handle_telemetry)
             self._download_manager.update_status.connect(self._handle_status)
-            self._download_manager.update_file_name.connect(self._handle_filename)
-            self._download_manager.update_speed.connect(self._handle_speed)
+            self._download_manager.playable_changed.connect(self._handle_playable)
             self._download_manager.finished.connect(self._handle_download_finished)
+            if self._game_running:
+                self._download_manager.set_background(True)
             self._download_manager.start()
             self.notificationRequested.emit(
                 f"Начато восстановление {len(files_to_repair)} файлов",
@@ -876,8 +3977,34 @@ class LauncherBackend(QObject):
                 "error"
             )
 
-    def _handle_size_info(self, size_info):
-        self.downloadSizeInfo = size_info
+    def _apply_speed_limit(self, force: bool = False):
+        """Применяет ограничение скорости, в том числе к уже идущей загрузке.
+
+        Вызывается при любой смене настроек, но действует, только если
+        изменился сам speedLimit (или force). Пока идет игра, скорость без
+        ручного лимита подбирается авторежимом.
+        """
+        limit = self._settings.speedLimit
+        if limit == self._speed_limit and not force:
+            return
+        self._speed_limit = limit
+        if limit == Settings.SPEED_LIMIT_AUTO or (limit == 0 and self._game_running):
+            bandwidth_limiter.set_auto(self._server_checker.auth_host, self._server_checker.auth_port)
+        elif 0 <= limit < len(Settings.SPEED_LIMITS):
+            bandwidth_limiter.set_rate(Settings.SPEED_LIMITS[limit] * 1000 * 1000 / 8)
+
+    def _apply_lan_cache(self):
+        """Включает или выключает обмен файлами в локальной сети по настройке"""
+        if self._settings.lanCache and not self._peer_cache and self.gamePath:
+            self._peer_cache = PeerCache(self.gamePath, self._settings.peers, self._object_store())
+            try:
+                self._peer_cache.start()
+            except OSError as e:
+                self.logger.error(f'Не удалось включить обмен файлами в локальной сети: {e}')
+                self._peer_cache = None
+        elif not self._settings.lanCache and self._peer_cache:
+            self._peer_cache.stop()
+            self._peer_cache = None
 
     @pyqtSlot()
     def show_window(self):
@@ -896,7 +4023,7 @@ class LauncherBackend(QObject):
         if self.engine and self.engine.rootObjects():
             window = self.engine.rootObjects()[0]
             window.hide()
-            if self._settings.showNotifications:
+            if self._settings.showNotifications and self._tray_icon:
                 self._tray_icon.showMessage(
                     "WoW Launcher",
                     "Лаунчер свернут в трей",
@@ -909,64 +4036,305 @@ class FileVerifier(QThread):
     status_changed = pyqtSignal(str)
     verification_complete = pyqtSignal(list)  # список поврежденных файлов
     
-    def __init__(self, manifest_url: str, game_path: str):
+    def __init__(self, manifest_url: str, game_path: str, deep_verify: bool = False):
         super().__init__()
         self.manifest_url = manifest_url
         self.game_path = game_path
+        self.deep_verify = deep_verify  # Хешировать все файлы, не доверяя кэшу проверки
+        self.verify_engine = VerifyEngine()
+        self.damaged_blocks = {}  # {файл: [номера поврежденных блоков]} для блочных манифестов
+        self.manifest = None  # Полученный манифест, передается в DownloadManager при починке
+        self.error = None  # Текст ошибки, прервавшей проверку
         self.is_running = True
-        self.logger = logging.getLogger(__name__)
+        self.logger = logging.getLogger('launcher.verify')
     
     def stop(self):
         self.is_running = False
     
     def run(self):
+        span = tracer.start('verify', deep=self.deep_verify)
+        corrupted_files = []
         try:
             self.status_changed.emit("Загрузка манифеста...")
-            response = requests.get(self.manifest_url)
-            response.raise_for_status()
-            manifest = response.json()['files']
+            with tracer.span('manifest.fetch') as fetch:
+                self.manifest = ManifestStore(self.game_path, self.manifest_url).fetch()
+                fetch['cached'] = self.manifest.from_cache
+            manifest = self.manifest.files
+            verify_cache = VerifyCache(self.game_path, manifest, self.manifest.digest)
             
-            corrupted_files = []
             total_files = len(manifest)
             checked_files = 0
+            hash_jobs = []
             
             for filename, file_info in manifest.items():
-                if not self.is_running:
-                    break
-                    
                 local_path = os.path.join(self.game_path, filename)
-                self.status_changed.emit(f"Проверка: {filename}")
                 
                 if not os.path.exists(local_path):
                     corrupted_files.append(filename)
-                else:
-                    # Проверяем размер
-                    if os.path.getsize(local_path) != file_info['size']:
-                        corrupted_files.append(filename)
-                    else:
-                        # Проверяем хеш
-                        sha256_hash = hashlib.sha256()
-                        with open(local_path, "rb") as f:
-                            for byte_block in iter(lambda: f.read(4096), b""):
-                                if not self.is_running:
-                                    return
-                                sha256_hash.update(byte_block)
-                        
-                        if sha256_hash.hexdigest() != file_info['hash']:
-                            corrupted_files.append(filename)
+                # Проверяем размер
+                elif os.path.getsize(local_path) != file_info['size']:
+                    corrupted_files.append(filename)
+                    bad_blocks = self.verify_engine.find_bad_blocks(local_path, file_info, lambda: self.is_running)
+                    if bad_blocks:
+                        self.damaged_blocks[filename] = bad_blocks
+                elif self.deep_verify or not verify_cache.is_valid(filename, local_path, file_info['hash']):
+                    # Хеш проверяется ниже на пуле потоков
+                    hash_jobs.append((filename, local_path, file_info['hash']))
+                    continue
                 
                 checked_files += 1
+            self.progress_changed.emit(checked_files / total_files if total_files else 1.0)
+
+            def on_result(filename, ok, stats):
+                nonlocal checked_files
+                local_path = os.path.join(self.game_path, filename)
+                if ok:
+                    verify_cache.store(filename, local_path, manifest[filename]['hash'])
+                else:
+                    corrupted_files.append(filename)
+                    verify_cache.discard(filename)
+                    # Хеши блоков посчитаны в том же проходе, файл повторно не читается
+                    bad_blocks = self.verify_engine.compare_blocks(
+                        manifest[filename], self.verify_engine.last_blocks.get(filename)
+                    )
+                    if bad_blocks:
+                        self.damaged_blocks[filename] = bad_blocks
+                checked_files += 1
+                self.status_changed.emit(
+                    f"Проверка: {filename} ({stats['speed'] / (1024 * 1024):.0f} МБ/с)"
+                )
                 self.progress_changed.emit(checked_files / total_files)
+
+            self.verify_engine.verify(
+                hash_jobs, on_result, is_running=lambda: self.is_running,
+                block_sizes=manifest_block_sizes(manifest)
+            )
+            verify_cache.save()
             
             if self.is_running:
+                stats = self.verify_engine.last_stats
+                self.logger.info(
+                    f"Проверка завершена: {stats['size'] / (1024 * 1024):.0f} МБ, "
+                    f"{stats['speed'] / (1024 * 1024):.1f} МБ/с"
+                )
                 self.verification_complete.emit(corrupted_files)
                 
         except Exception as e:
             self.logger.error(f"Ошибка при проверке файлов: {str(e)}")
+            self.error = str(e)
             self.status_changed.emit(f"Ошибка: {str(e)}")
+        finally:
+            tracer.end(span, self.error, corrupted=len(corrupted_files))
+            tracer.export()
+
+
+CLI_COMMANDS = ('install', 'verify', 'repair', 'gc', 'seed', 'make-patch')
+EXIT_OK = 0
+EXIT_DAMAGED = 1  # Остались поврежденные или не загруженные файлы
+EXIT_USAGE = 2  # Неверные аргументы (код argparse)
+EXIT_ERROR = 3  # Ошибка сети, манифеста или диска
+EXIT_INTERRUPTED = 130
+
+
+class CliReporter:
+    """Печатает события в stdout по одному JSON-объекту в строке.
+
+    События progress выводятся не чаще раза в interval секунд, остальные -
+    сразу.
+    """
+
+    def __init__(self, interval: float = 1.0, stream=None):
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self._last_progress = 0.0
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields):
+        line = json.dumps({'event': event, 'time': round(time.time(), 3), **fields}, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def progress(self, force: bool = False, **fields):
+        now = time.monotonic()
+        if force or now - self._last_progress >= self.interval:
+            self._last_progress = now
+            self.emit('progress', **fields)
+
+
+def run_download(manager: DownloadManager, reporter: CliReporter):
+    """Выполняет загрузку в текущем потоке, печатая прогресс из TransferTelemetry"""
+    fields = ('progress', 'downloaded', 'total', 'speed', 'eta', 'activeFiles', 'connections', 'segmentSize', 'readSize')
+    done = threading.Event()
+
+    def report_progress():
+        while not done.wait(reporter.interval):
+            snapshot = manager.telemetry.snapshot()
+            reporter.progress(**{key: snapshot[key] for key in fields})
+
+    manager.update_status.connect(lambda message: reporter.emit('status', message=message))
+    manager.playable_changed.connect(lambda playable: reporter.emit('playable', playable=playable))
+    reporter_thread = threading.Thread(target=report_progress, daemon=True)
+    reporter_thread.start()
+    try:
+        manager.run()
+    finally:
+        done.set()
+        reporter_thread.join()
+    snapshot = manager.telemetry.snapshot()
+    reporter.progress(force=True, **{key: snapshot[key] for key in fields})
+
+
+def run_make_patch(argv: list) -> int:
+    """Создает патч между версиями файла и печатает запись для манифеста"""
+    parser = argparse.ArgumentParser(prog='wow-launcher.py make-patch',
+                                     description='Создание патча между версиями файла клиента.')
+    parser.add_argument('old', help='старая версия файла')
+    parser.add_argument('new', help='новая версия файла')
+    parser.add_argument('out', help='куда записать патч')
+    parser.add_argument('--block-size', type=int, default=4096, help='размер блока сравнения, байт')
+    args = parser.parse_args(argv)
+    reporter = CliReporter()
+    try:
+        DeltaPatch.create(args.old, args.new, args.out, block_size=args.block_size)
+        engine = VerifyEngine()
+        reporter.emit('result', command='make-patch', ok=True, **{
+            'from': engine.hash_file(args.old),
+            'hash': engine.hash_file(args.out),
+            'size': os.path.getsize(args.out),
+        })
+        return EXIT_OK
+    except OSError as e:
+        reporter.emit('result', command='make-patch', ok=False, error=str(e))
+        return EXIT_ERROR
+
+
+def run_cli(argv: list) -> int:
+    """Установка, проверка и починка клиента из командной строки без интерфейса"""
+    if argv and argv[0] == 'make-patch':
+        return run_make_patch(argv[1:])
+    parser = argparse.ArgumentParser(
+        prog='wow-launcher.py',
+        description='Установка, проверка и починка клиента без интерфейса. '
+                    'Прогресс выводится в stdout строками JSON.'
+    )
+    parser.add_argument('command', choices=CLI_COMMANDS)
+    parser.add_argument('--game-path', help='папка клиента (по умолчанию из config.ini)')
+    parser.add_argument('--manifest-url', default=MANIFEST_URL)
+    parser.add_argument('--parallel-files', type=int, default=4, help='одновременно загружаемых файлов')
+    parser.add_argument('--segments', type=int, default=4, help='потоков на один большой файл')
+    parser.add_argument('--speed-limit', type=float, default=0, help='ограничение скорости, Мбит/с (0 - без ограничений)')
+    parser.add_argument('--mirror', action='append', default=[], help='дополнительное зеркало загрузки')
+    parser.add_argument('--store', help='общее хранилище файлов для нескольких установок')
+    parser.add_argument('--lan', action='store_true', help='искать файлы у лаунчеров в локальной сети')
+    parser.add_argument('--peer', action='append', default=[], help='адрес лаунчера host:port в локальной сети')
+    parser.add_argument('--peer-port', type=int, default=0, help='порт раздачи файлов (по умолчанию любой свободный)')
+    parser.add_argument('--deep', action='store_true', help='хешировать все файлы, не доверяя кэшу проверки')
+    parser.add_argument('--progress-interval', type=float, default=1.0, help='период вывода прогресса, секунд')
+    parser.add_argument('--trace', help='записать трассировку фаз в файл JSON lines')
+    parser.add_argument('--metrics', help='сохранить снимок метрик в текстовом формате Prometheus')
+    args = parser.parse_args(argv)
+    tracer.open(args.trace, args.metrics)
+
+    if args.command == 'gc':
+        if not args.store:
+            parser.error('для gc нужно указать хранилище (--store)')
+        reporter = CliReporter(args.progress_interval)
+        reporter.emit('result', command='gc', ok=True, **ObjectStore(args.store).gc())
+        return EXIT_OK
+
+    config_manager = ConfigManager()
+    game_path = args.game_path or config_manager.game_path
+    if not game_path:
+        parser.error('не указана папка клиента (--game-path)')
+    os.makedirs(game_path, exist_ok=True)
+
+    bandwidth_limiter.set_rate(args.speed_limit * 1000 * 1000 / 8)
+    reporter = CliReporter(args.progress_interval)
+    store = ObjectStore(args.store) if args.store else None
+    peer_cache = None
+    if args.lan or args.peer or args.command == 'seed':
+        peer_cache = PeerCache(game_path, args.peer, store, http_port=args.peer_port,
+                               discovery=args.lan or args.command == 'seed')
+        peer_cache.start()
+    reporter.emit('start', command=args.command, gamePath=game_path,
+                  peerPort=peer_cache.http_port if peer_cache else None)
+
+    manager = None
+    try:
+        if args.command == 'seed':
+            # Раздача проверенных файлов до прерывания
+            while True:
+                time.sleep(1)
+
+        verifier = None
+        repair_files = None
+        if args.command in ('verify', 'repair'):
+            # Починка, как и в интерфейсе, начинается с полной проверки
+            verifier = FileVerifier(args.manifest_url, game_path, deep_verify=args.deep or args.command == 'repair')
+            corrupted = []
+            verifier.status_changed.connect(lambda message: reporter.emit('status', message=message))
+            verifier.progress_changed.connect(lambda progress: reporter.progress(progress=progress))
+            verifier.verification_complete.connect(corrupted.extend)
+            verifier.run()
+            if verifier.error:
+                reporter.emit('result', command=args.command, ok=False, error=verifier.error)
+                return EXIT_ERROR
+            reporter.progress(force=True, progress=1.0)
+            if args.command == 'verify' or not corrupted:
+                reporter.emit('result', command=args.command, ok=not corrupted, corrupted=corrupted,
+                              damagedBlocks=verifier.damaged_blocks)
+                return EXIT_DAMAGED if corrupted else EXIT_OK
+            repair_files = corrupted
+
+        manager = DownloadManager(
+            args.manifest_url,
+            game_path,
+            repair_files,
+            max_parallel_files=args.parallel_files,
+            parallel_segments=args.segments,
+            deep_verify=args.deep,
+            repair_blocks=verifier.damaged_blocks if verifier else None,
+            manifest=verifier.manifest if verifier else None,
+            mirrors=args.mirror,
+            object_store=store,
+            peers=peer_cache
+        )
+        run_download(manager, reporter)
+        if manager.completed and manager.manifest_version:
+            config_manager.save_current_version(manager.manifest_version, game_path)
+        reporter.emit('result', command=args.command, ok=manager.completed, corrupted=manager.corrupted_files,
+                      version=manager.manifest_version, error=manager.error)
+        if manager.completed:
+            return EXIT_OK
+        return EXIT_DAMAGED if manager.corrupted_files else EXIT_ERROR
+    except KeyboardInterrupt:
+        if args.command == 'seed':
+            reporter.emit('result', command='seed', ok=True)
+            return EXIT_OK
+        if manager:
+            manager.stop()
+        reporter.emit('result', command=args.command, ok=False, error='Прервано пользователем')
+        return EXIT_INTERRUPTED
+    finally:
+        if peer_cache:
+            peer_cache.stop()
+        tracer.export()
 
 if __name__ == '__main__':
+    setup_logging()
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        # Цикл событий Qt не запускается: движок работает в текущем потоке
+        app = QCoreApplication(sys.argv[:1])
+        sys.exit(run_cli(sys.argv[1:]))
+
+    profiler = StartupProfiler(_startup_time)
+    profiler.mark('Импорт модулей')
     app = QApplication(sys.argv)
+    profiler.mark('QApplication')
+    # Трассировка последнего сеанса и снимок метрик лежат рядом с launcher.log
+    tracer.open('launcher-trace.jsonl', 'launcher-metrics.prom')
+    app.aboutToQuit.connect(tracer.export)
     
     # Добавляем поддержку QtGraphicalEffects
     import os
@@ -985,16 +4353,38 @@ if __name__ == '__main__':
     
     current_dir = os.path.dirname(os.path.abspath(__file__))
     engine.addImportPath(current_dir)
+    image_provider = ImageProvider(ImageCache(os.path.join(current_dir, 'cache', 'images'), current_dir))
+    engine.addImageProvider('assets', image_provider)
+    profiler.mark('Движок QML')
     
     config_manager = ConfigManager()
     backend = LauncherBackend(config_manager)
     backend.engine = engine  # Устанавливаем ссылку на engine
     engine.rootContext().setContextProperty("launcher", backend)
+    profiler.mark('LauncherBackend')
     
     qml_file = os.path.join(current_dir, 'main.qml')
     engine.load(QUrl.fromLocalFile(qml_file))
+    profiler.mark('Загрузка main.qml')
     
     if not engine.rootObjects():
         sys.exit(-1)
+
+    # Все, что не нужно для первого кадра, запускаем после его отрисовки
+    window = engine.rootObjects()[0]
+
+    def on_first_frame():
+        window.frameSwapped.disconnect(on_first_frame)
+        profiler.mark('Первый кадр')
+        backend.start_background_services()
+        profiler.mark('Фоновые службы')
+        logging.info('Время запуска:\n' + profiler.report())
+        for phase, duration in profiler.phases:
+            tracer.gauge('startup_phase_seconds', duration, phase=phase)
+        if '--startup-profile' in sys.argv:
+            print(profiler.report())
+            app.quit()
+
+    window.frameSwapped.connect(on_first_frame)
         
     sys.exit(app.exec_())